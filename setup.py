@@ -37,7 +37,7 @@ setuptools.setup(
         "Environment :: Console",
         "Intended Audience :: End Users/Desktop",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     scripts=["bin/sync-dl"],
     entry_points={
         'console_scripts': ['sync-dl = sync_dl:main'],
@@ -1,5 +1,5 @@
 
-from threading import current_thread
+from threading import current_thread, local
 from sync_dl import config as cfg
 from signal import signal, SIGINT, Signals#,SIGABRT,SIGTERM
 
@@ -9,9 +9,20 @@ class InterruptTriggered(Exception):
     pass
 
 class _NoInterrupt:
-    noInterruptDepth = 0
     signalReceived=False
 
+    def __init__(self):
+        # each thread has its own depth, so a worker thread in a noInterrupt block doesnt stop the main thread being interrupted
+        self._local = local()
+
+    @property
+    def noInterruptDepth(self):
+        return getattr(self._local, 'depth', 0)
+
+    @noInterruptDepth.setter
+    def noInterruptDepth(self, depth):
+        self._local.depth = depth
+
     def __enter__(self):
         if self.interruptible() and self.signalReceived:
             self.signalReceived = False
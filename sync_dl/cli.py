@@ -3,15 +3,17 @@ import sys
 import logging
 
 import argparse
-import shelve
 
 
-from sync_dl import __version__, InterruptTriggered
+from sync_dl import __version__, InterruptTriggered, songStore
 from sync_dl.plManagement import correctStateCorruption
 import sync_dl.config as cfg
 
-from sync_dl.commands import newPlaylist,smartSync,appendNew,manualAdd,swap, showPlaylist, compareMetaData, moveRange, peek, togglePrepends, addTimestampsFromComments
+from sync_dl.commands import newPlaylist,smartSync,appendNew,syncPlaylists,manualAdd,swap, showPlaylist, compareMetaData, moveRange, peek, togglePrepends, toggleVirtualOrder, setPrefixWidth, addTimestampsFromComments
 from sync_dl.ytapiInterface import logout, pushLocalOrder, transferSongs
+from sync_dl.ytdlWrappers import session
+from sync_dl.metaDataStore import openMetaData, metaDataExists
+from sync_dl.playlistDiscovery import findPlaylists
 
 
 
@@ -39,20 +41,22 @@ class ArgsOnce(argparse.HelpFormatter):
             return ', '.join(parts)
 
 
-def setupLogger(args):
-    '''sets cfg.logger level based on verbosity'''
-    #verbosity
-    stream = logging.StreamHandler(sys.stdout)
+def logSettings(args):
+    '''log level and formatter based on verbosity'''
     if args.verbose:
-        cfg.logger.setLevel(logging.DEBUG)
-        stream.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        return logging.DEBUG, logging.Formatter("[%(levelname)s] %(message)s")
 
     elif args.quiet:
-        cfg.logger.setLevel(logging.ERROR)
-        stream.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    else:
-        cfg.logger.setLevel(logging.INFO)
-        stream.setFormatter(logging.Formatter("%(message)s"))
+        return logging.ERROR, logging.Formatter("[%(levelname)s] %(message)s")
+
+    return logging.INFO, logging.Formatter("%(message)s")
+
+def setupLogger(args):
+    '''sets cfg.logger level based on verbosity'''
+    level, formatter = logSettings(args)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    cfg.logger.setLevel(level)
     cfg.logger.addHandler(stream)
 
 def getCwd():
@@ -70,7 +74,7 @@ def playlistExists(plPath, noError = False):
         return False
 
     try:
-        shelve.open(f'{plPath}/{cfg.metaDataName}', flag='r').close()
+        openMetaData(plPath, create = False).close()
     except Exception as e:
         if noError:
             return False
@@ -95,19 +99,7 @@ def getPlPath(playlist):
 
     return f"{cwd}/{playlist}"
 
-def getPlaylistPathsRecursive(path, plPaths):
-    if playlistExists(path, noError = True):
-        plPaths.append(path)
-        return
-    dir = os.listdir(path)
-    for f in dir:
-        fpath = f"{path}/{f}"
-        if not os.path.isdir(fpath):
-            continue
-        getPlaylistPathsRecursive(fpath,plPaths)
-    return
-
-def setupParsers():
+def setupParsers(argv = None):
     description = ("A tool for downloading and syncing remote playlists to your computer. Created to avoid having\n"
                     "music deleted but still have the convenience of browsing and adding and reordering new music using\n"
                     "remote services such as youtube.")
@@ -116,6 +108,7 @@ def setupParsers():
     parser.add_argument('-v','--verbose',action='store_true', help='runs application in verbose mode' )
     parser.add_argument('-q','--quiet',action='store_true', help='runs application with no print outs' )
     parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
+    parser.add_argument('--no-daemon', action='store_true', help='runs command in this process even if the daemon is running (config changes made this way apply to the daemon once its restarted)')
     parser.set_defaults(func = lambda args: baseHandler(args, parser))
 
     subparsers = parser.add_subparsers()
@@ -137,6 +130,7 @@ def setupParsers():
     sync = subparsers.add_parser("sync", help='smart sync playlist, unless options are added', formatter_class=ArgsOnce)
     sync.add_argument('-s','--smart-sync', action='store_true', help='smart sync local playlist with remote playlist')
     sync.add_argument('-a','--append-new', action='store_true', help='append new songs in remote playlist to end of local playlist')
+    sync.add_argument('--full', action='store_true', help='extracts the whole remote playlist, even if it appears unchanged since the last sync')
     sync.add_argument('-r','--recursive', action='store_true', help='syncs all playlists in subfolders of PLAYLIST recursively (effected by config --local-dir)')
     sync.add_argument('PLAYLIST', type=str, help='the name of the directory for the playlist')
     sync.set_defaults(func = lambda args: syncHandler(args, sync))
@@ -148,6 +142,8 @@ def setupParsers():
     edit.add_argument('-r','--move-range',nargs=3, metavar=('I1','I2','NI'), type = int, help='makes songs in range [I1, I2] come after song index NI (NI=-1 will move to start)')
     edit.add_argument('-w','--swap',nargs=2, metavar=('I1','I2'), type = int, help='swaps order of songs index I1 and I2')
     edit.add_argument('-T','--toggle-prepends', action='store_true', help='toggles number prepends on/off')
+    edit.add_argument('--prefix-width', metavar='N', type=int, help='pads number prepends to at least N digits, so songs arent renamed as the playlist grows')
+    edit.add_argument('-V','--toggle-virtual-order', action='store_true', help='toggles keeping the order in metadata and an .m3u8 index instead of number prepends')
     edit.add_argument('PLAYLIST', type=str, help='the name of the directory for the playlist')
     edit.set_defaults(func = lambda args: editHandler(args, edit))
 
@@ -174,6 +170,10 @@ def setupParsers():
     config.add_argument('--list-formats',action='store_true', help='list all acceptable audio formats')
     config.add_argument('-t', '--toggle-timestamps', action='store_true', help='toggles automatic scraping of comments for timestamps when downloading')
     config.add_argument('-T', '--toggle-thumbnails', action='store_true', help='toggles embedding of thumbnails on download')
+    config.add_argument('-S', '--toggle-song-store', action='store_true', help='toggles keeping one copy of each song in the music directory, which is linked into every playlist containing it')
+    config.add_argument('--prune-song-store', action='store_true', help='removes songs from the song store which are no longer in any playlist')
+    config.add_argument('-w', '--download-workers', nargs=1, metavar='N', type=int, help='sets number of songs downloaded at once to N')
+    config.add_argument('-P', '--playlist-workers', nargs=1, metavar='N', type=int, help='sets number of playlists synced at once by sync -r to N')
     config.add_argument('-s', '--show-config', action='store_true', help='shows current configuration')
     config.set_defaults(func= lambda args: configHandler(args, config))
 
@@ -185,7 +185,16 @@ def setupParsers():
     info.add_argument('PLAYLIST',nargs='?', type=str, help='the name of the directory for the playlist')
     info.set_defaults(func = lambda args: infoHandler(args, info))
 
-    args = parser.parse_args()
+    #daemon
+    daemon = subparsers.add_parser("daemon", help='runs sync-dl in the background, other commands are run by it while its running', formatter_class=ArgsOnce)
+    daemon.add_argument('--schedule', nargs=2, metavar=('PLAYLIST','MINUTES'), type=str, help='smart syncs PLAYLIST every MINUTES while the daemon runs')
+    daemon.add_argument('-a','--append-new', action='store_true', help='scheduled PLAYLIST only has new songs appended rather than being smart synced')
+    daemon.add_argument('--unschedule', nargs=1, metavar='PLAYLIST', type=str, help='stops syncing PLAYLIST')
+    daemon.add_argument('--status', action='store_true', help='shows if the daemon is running and the scheduled playlists')
+    daemon.add_argument('--stop', action='store_true', help='stops the daemon once its current command finishes')
+    daemon.set_defaults(func = lambda args: daemonHandler(args, daemon))
+
+    args = parser.parse_args(argv)
     return args
 
 def baseHandler(_,parser):
@@ -204,9 +213,8 @@ def syncHandler(args,parser):
     path = getPlPath(args.PLAYLIST)
 
     if args.recursive:
-        plPaths = []
         cfg.logger.info("Searching for Playlists...")
-        getPlaylistPathsRecursive(path, plPaths)
+        plPaths = findPlaylists(path)
         if len(plPaths) == 0:
             errMessage = f"No Playlists Found in: {path}"
             if cfg.musicDir:
@@ -223,23 +231,22 @@ def syncHandler(args,parser):
             return
         plPaths = [path]
 
+    if not (args.smart_sync or args.append_new):
+        parser.print_help()
+        cfg.logger.error("Please Select an Option")
+        return
 
-    for plPath in plPaths:
-        if len(plPaths) > 1:
-            cfg.logger.info("\n===============================================")
-
-        #smart syncing
-        if args.smart_sync:
-            smartSync(plPath)
+    # playlists are synced in parallel, smart syncing takes precedence over appending
+    if len(plPaths) > 1:
+        syncPlaylists(plPaths, appendOnly = not args.smart_sync, full = args.full)
 
-        #appending
-        elif args.append_new:
-            appendNew(plPath)
+    #smart syncing
+    elif args.smart_sync:
+        smartSync(plPaths[0], full = args.full)
 
-        else:
-            parser.print_help()
-            cfg.logger.error("Please Select an Option")
-            break
+    #appending
+    else:
+        appendNew(plPaths[0], full = args.full)
 
 
 
@@ -279,6 +286,10 @@ def configHandler(args,parser):
             cfg.logger.error("ffmpeg is Required to Use Audio Format Other Than 'best'")
             return
 
+        if not cfg.canConvertTo(fmt):
+            cfg.logger.error(f"Installed ffmpeg Cannot Convert to Audio Format: {fmt}")
+            return
+
         cfg.writeToConfig('audioFormat', fmt)
         cfg.setAudioFormat()
         cfg.logger.info(f"Audio Format Set to: {cfg.audioFormat}")
@@ -308,6 +319,42 @@ def configHandler(args,parser):
 
         cfg.writeToConfig('autoScrapeCommentTimestamps', str(int(cfg.autoScrapeCommentTimestamps)))
 
+    if args.toggle_song_store:
+        cfg.useSongStore = not cfg.useSongStore
+        if cfg.useSongStore:
+            cfg.logger.info("Song Store: ON")
+            if cfg.musicDir == '':
+                cfg.logger.info("Note, the Song Store is Only Used Once a Music Directory is Set (sync-dl config -l PATH)")
+        else:
+            cfg.logger.info("Song Store: OFF")
+
+        cfg.writeToConfig('songStore', str(int(cfg.useSongStore)))
+
+    if args.prune_song_store:
+        if cfg.musicDir == '':
+            cfg.logger.error("The Song Store is Only Used Once a Music Directory is Set (sync-dl config -l PATH)")
+            return
+        numRemoved = songStore.prune()
+        cfg.logger.info(f"Removed {numRemoved} Songs From the Song Store")
+
+    if args.download_workers:
+        numWorkers = args.download_workers[0]
+        if numWorkers < 1:
+            cfg.logger.error("Number of Download Workers Must be at Least 1")
+            return
+        cfg.downloadWorkers = numWorkers
+        cfg.writeToConfig('downloadWorkers', str(numWorkers))
+        cfg.logger.info(f"Download Workers Set to: {cfg.downloadWorkers}")
+
+    if args.playlist_workers:
+        numWorkers = args.playlist_workers[0]
+        if numWorkers < 1:
+            cfg.logger.error("Number of Playlist Workers Must be at Least 1")
+            return
+        cfg.playlistWorkers = numWorkers
+        cfg.writeToConfig('playlistWorkers', str(numWorkers))
+        cfg.logger.info(f"Playlist Workers Set to: {cfg.playlistWorkers}")
+
     if args.show_config:
         cfg.logger.info(f"(-l) (--local-dir):         {cfg.musicDir}")
 
@@ -323,7 +370,16 @@ def configHandler(args,parser):
         else:
             cfg.logger.info("(-T) (--toggle-thumbnails): OFF")
 
-    if not (args.toggle_timestamps or (args.local_dir is not None) or args.audio_format or args.list_formats or args.toggle_thumbnails or args.show_config):
+        if cfg.useSongStore:
+            cfg.logger.info("(-S) (--toggle-song-store): ON")
+        else:
+            cfg.logger.info("(-S) (--toggle-song-store): OFF")
+
+        cfg.logger.info(f"(-w) (--download-workers):  {cfg.downloadWorkers}")
+
+        cfg.logger.info(f"(-P) (--playlist-workers):  {cfg.playlistWorkers}")
+
+    if not (args.toggle_timestamps or (args.local_dir is not None) or args.audio_format or args.list_formats or args.toggle_thumbnails or args.toggle_song_store or args.prune_song_store or args.download_workers or args.playlist_workers or args.show_config):
         parser.print_help()
         cfg.logger.error("Please Select an Option")
 
@@ -350,13 +406,19 @@ def editHandler(args,parser):
             manualAdd(plPath,args.manual_add[0],int(args.manual_add[1]))
 
     # if no options are selected, show help
-    elif not args.toggle_prepends:
+    elif not (args.toggle_prepends or args.toggle_virtual_order or args.prefix_width is not None):
         parser.print_help()
         cfg.logger.error("Please Select an Option")
 
     if args.toggle_prepends:
         togglePrepends(plPath)
 
+    if args.toggle_virtual_order:
+        toggleVirtualOrder(plPath)
+
+    if args.prefix_width is not None:
+        setPrefixWidth(plPath, args.prefix_width)
+
 
 def ytapiHandler(args,parser):
     if args.logout:
@@ -461,6 +523,42 @@ def timestampsHandler(args,parser):
         cfg.logger.error("Please Select an Option")
 
 
+def daemonHandler(args,parser):
+    from sync_dl import daemon
+
+    if args.schedule:
+        plPath = getPlPath(args.schedule[0])
+        if not playlistExists(plPath):
+            return
+        try:
+            minutes = float(args.schedule[1])
+        except ValueError:
+            minutes = 0
+        if minutes <= 0:
+            cfg.logger.error("MINUTES Must be a Positive Number")
+            return
+        daemon.schedule(plPath, minutes, args.append_new)
+        cfg.logger.info(f"Scheduled {plPath} Every {args.schedule[1]} Minutes")
+
+    if args.unschedule:
+        plPath = getPlPath(args.unschedule[0])
+        if daemon.unschedule(plPath):
+            cfg.logger.info(f"Unscheduled {plPath}")
+        else:
+            cfg.logger.error(f"{plPath} Isnt Scheduled")
+
+    if args.status:
+        daemon.status()
+
+    if args.stop:
+        daemon.stop()
+
+    if not (args.schedule or args.unschedule or args.status or args.stop):
+        daemon.runDaemon()
+
+def _startsDaemon(args):
+    return 'stop' in vars(args) and not (args.schedule or args.unschedule or args.status or args.stop)
+
 def checkAllStateCorruption(args):
 
     plPaths = []
@@ -483,9 +581,8 @@ def checkAllStateCorruption(args):
             pass
 
     for plPath in plPaths:
-        metaDataPath = f"{plPath}/{cfg.metaDataName}"
-        if os.path.exists(metaDataPath):
-            with shelve.open(metaDataPath, 'c',writeback=True) as metaData:
+        if metaDataExists(plPath):
+            with openMetaData(plPath) as metaData:
                 correctStateCorruption(plPath,metaData)
             cfg.logger.info(f"State Recovered For Playlist: {plPath}")
 
@@ -497,6 +594,20 @@ def cli():
 
     setupLogger(args)
 
+    # the daemon keeps yt-dlp loaded, so runs commands faster than starting them here
+    if not args.no_daemon and not _startsDaemon(args) and os.path.exists(cfg.daemonSocketPath):
+        from sync_dl.daemon import forward
+        if forward(sys.argv[1:]):
+            return
+
+    try:
+        runCommand(args)
+
+    finally:
+        session.close()
+
+def runCommand(args):
+    '''runs the command parsed into args, recovering the state of its playlists if it fails'''
     try:
         args.func(args)
 
@@ -1,18 +1,21 @@
 import os
 
-import shelve
 import re
 import ntpath
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from sync_dl import noInterrupt
+from sync_dl import noInterrupt, InterruptTriggered
 
-from sync_dl.ytdlWrappers import getIDs, getIdsAndTitles,getJsonPlData
-from sync_dl.plManagement import editPlaylist, correctStateCorruption, removePrepend
-from sync_dl.helpers import createNumLabel, smartSyncNewOrder, getLocalSongs, rename, relabel,download,getNumDigets, numOccurance, getNthOccuranceIndex, getOrdinalIndicator, padZeros
+from sync_dl.ytdlWrappers import getIDs, getIdsAndTitles,getJsonPlData, getPlaylistFingerprint
+from sync_dl.plManagement import editPlaylist, correctStateCorruption, removePrepend, playlistLock
+from sync_dl.helpers import shareDownloadWorkers, createNumLabel, smartSyncNewOrder, getLocalSongs, relabel, rename, uniqueSongName, getSongNum, DownloadPool, getNumDigets, prependWidth, numOccurance, getNthOccuranceIndex, getOrdinalIndicator, padZeros
 
-from sync_dl.timestamps.scraping import scrapeCommentsForTimestamps
-from sync_dl.timestamps import createChapterFile, addTimestampsToChapterFile, applyChapterFileToSong, wipeChapterFile, addTimestampsIfNoneExist
+from sync_dl.metaDataStore import openMetaData
+
+from sync_dl.timestamps.scraping import scrapeCommentsForTimestamps, RateLimiter
+from sync_dl.timestamps import readSongInfo, applyTimestampsToSong
 
 import sync_dl.config as cfg
 
@@ -40,23 +43,17 @@ def newPlaylist(plPath,url):
             os.rmdir(plPath)
             return
 
-    numDigits = getNumDigets(idsLen) #needed for creating starting number for auto ordering ie) 001, 0152
-
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData, DownloadPool(ids, plPath=plPath) as pool:
         metaData["url"] = url
         metaData["ids"] = []
+        metaData["prefixWidth"] = cfg.prefixWidth # so songs arent renamed until the playlist outgrows it
+        numDigits = prependWidth(plPath, metaData, idsLen) #needed for creating starting number for auto ordering ie) 001, 0152
 
         invalidSongs = 0
-        for i,songId in enumerate(ids):
-
-            counter = f'{i+1}/{idsLen}'
-            songName = download(metaData,plPath,songId,-1,numDigits,counter)
-            if not songName:
+        for _ in ids:
+            # timestamps are added by the pool, before the song is moved into the playlist
+            if not pool.download(metaData,plPath,-1,numDigits):
                 invalidSongs+=1
-                continue
-            if cfg.autoScrapeCommentTimestamps:
-                addTimestampsIfNoneExist(plPath, songName, songId)
-
 
         cfg.logger.info(f"Downloaded {idsLen-invalidSongs}/{idsLen} Songs")
 
@@ -67,7 +64,44 @@ def newPlaylist(plPath,url):
             shutil.rmtree(plPath)
 
 
-def smartSync(plPath):
+def getRemoteIds(plPath, full = False):
+    '''
+    returns the ids of the remote playlist of plPath. the ids are recorded in metadata with the remote playlists
+    fingerprint (see getPlaylistFingerprint), while the fingerprint is unchanged the recorded ids are used rather
+    than extracting the whole playlist. if full, the whole playlist is always extracted (and the fingerprint isnt fetched)
+    '''
+    with openMetaData(plPath) as metaData:
+        url = metaData["url"]
+        remote = metaData.get("remote")
+
+    fingerprint = None if full else getPlaylistFingerprint(url)
+    if fingerprint is not None and remote is not None and remote['fingerprint'] == fingerprint:
+        cfg.logger.debug(f"Remote Playlist Unchanged Since Last Sync")
+        return remote['ids']
+
+    remoteIds = getIDs(url)
+
+    # the fingerprint is only recorded if it agrees with the extracted playlist
+    if fingerprint is not None and len(remoteIds) > 0 and remoteIds[:len(fingerprint['ids'])] == fingerprint['ids']:
+        with openMetaData(plPath) as metaData:
+            metaData["remote"] = {'fingerprint': fingerprint, 'ids': remoteIds, 'syncedIds': None}
+
+    return remoteIds
+
+
+def _recordSynced(plPath, remoteIds, numFailed):
+    '''records the local ids left by smart syncing with remoteIds, so the sync can be skipped until either changes'''
+    with openMetaData(plPath) as metaData:
+        remote = metaData.get("remote")
+        if remote is None or remote['ids'] != remoteIds:
+            return
+
+        # songs which failed to download are tried again next sync
+        remote['syncedIds'] = list(metaData["ids"]) if numFailed == 0 else None
+        metaData["remote"] = remote
+
+
+def smartSync(plPath, remoteIds = None, full = False, stop = None):
     '''
     Syncs to remote playlist however will Not delete local songs (will reorder). Songs not in remote (ie ones deleted)
     will be after the song they are currently after in local
@@ -88,43 +122,165 @@ def smartSync(plPath):
         notice C and B where swapped and D was deleted from Remote
 
     see test_smartSyncNewOrder in tests.py for more examples
+
+    remoteIds can be given if they where already fetched (otherwise see getRemoteIds for full), see editPlaylist for stop
+    returns the number of songs which failed to download
     '''
     cfg.logger.info(f"Smart Syncing {plPath}")
 
 
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
-        url = metaData["url"]
-        localIds = metaData["ids"]
 
-    remoteIds = getIDs(url)
+    if remoteIds is None:
+        remoteIds = getRemoteIds(plPath, full)
 
+    with openMetaData(plPath) as metaData:
+        localIds = list(metaData["ids"])
+        remote = metaData.get("remote")
+
+    # neither playlist has changed since they where last synced
+    if not full and remote is not None and remote['ids'] == remoteIds and remote['syncedIds'] == localIds:
+        cfg.logger.info("Playlist Already Synced")
+        return 0
 
     newOrder = smartSyncNewOrder(localIds,remoteIds)
 
-    editPlaylist(plPath,newOrder)
+    numFailed = editPlaylist(plPath,newOrder,stop=stop)
+    _recordSynced(plPath, remoteIds, numFailed)
+    return numFailed
 
 
-def appendNew(plPath):
-    '''will append new songs in remote playlist to local playlist in order that they appear'''
+def appendNew(plPath, remoteIds = None, full = False, stop = None):
+    '''
+    will append new songs in remote playlist to local playlist in order that they appear
+    remoteIds can be given if they where already fetched (otherwise see getRemoteIds for full), see DownloadPool for stop
+    returns the number of songs which failed to download
+    '''
 
     cfg.logger.info(f"Appending New Songs to {plPath}")
 
+    if remoteIds is None:
+        remoteIds = getRemoteIds(plPath, full)
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        idsLen = len(metaData["ids"])
-        numDigits = getNumDigets(idsLen)
+        newIds = []
+        seen = set(metaData['ids'])
+        for remoteId in remoteIds:
+            if remoteId not in seen:
+                seen.add(remoteId)
+                newIds.append(remoteId)
 
-        remoteIds = getIDs(metaData['url'])
+        numDigits = prependWidth(plPath, metaData, len(metaData["ids"]) + len(newIds))
+
+        numFailed = 0
+        with DownloadPool(newIds, stop=stop, plPath=plPath) as pool:
+            for _ in newIds:
+                if not pool.download(metaData,plPath,-1,numDigits):
+                    numFailed += 1
+
+    return numFailed
+
+
+# remote playlists fetched at once by syncPlaylists
+_remoteFetchWorkers = 8
+
+def _fetchRemoteIds(plPath, full):
+    '''run concurrently by syncPlaylists, returns the number of local songs and the remote ids of playlist'''
+    with openMetaData(plPath) as metaData:
+        numSongs = len(metaData["ids"])
+
+    return numSongs, getRemoteIds(plPath, full)
 
-        for remoteId in remoteIds:
-            if remoteId not in metaData['ids']:
-                songName = download(metaData,plPath,remoteId,idsLen,numDigits)
-                if songName and cfg.autoScrapeCommentTimestamps:
-                    addTimestampsIfNoneExist(plPath, songName, remoteId)
+
+def _syncPlaylist(plPath, fetched, appendOnly, stop):
+    '''run concurrently by syncPlaylists, returns (songs added, songs failed), or None if stopped before starting'''
+    numSongs, remoteIds = fetched.result()
+    if stop.is_set():
+        return None
+
+    with playlistLock(plPath):
+        if appendOnly:
+            numFailed = appendNew(plPath, remoteIds, stop=stop)
+        else:
+            numFailed = smartSync(plPath, remoteIds, stop=stop)
+
+        with openMetaData(plPath) as metaData:
+            return len(metaData["ids"]) - numSongs, numFailed
+
+
+def syncPlaylists(plPaths, appendOnly = False, full = False):
+    '''
+    smart syncs (or appends new songs to) every playlist in plPaths. the remote playlists are all fetched at once,
+    and up to cfg.playlistWorkers playlists are synced at once, sharing cfg.downloadWorkers downloads between them.
+    a summary of every playlist is logged at the end, one failing doesnt stop the others (see getRemoteIds for full)
+
+    if interrupted, playlists being synced stop before their next song is added and the rest arent started
+    '''
+    stop = threading.Event()
+    results = {}
+
+    with shareDownloadWorkers(), \
+         ThreadPoolExecutor(max_workers = min(len(plPaths), _remoteFetchWorkers)) as fetchPool, \
+         ThreadPoolExecutor(max_workers = cfg.playlistWorkers) as syncPool:
+
+        fetches = [fetchPool.submit(_fetchRemoteIds, plPath, full) for plPath in plPaths]
+        syncs = [syncPool.submit(_syncPlaylist, plPath, fetched, appendOnly, stop) for plPath, fetched in zip(plPaths, fetches)]
+
+        # syncs are handled as they finish, so one being interrupted stops the rest straight away
+        pending = dict(zip(syncs, plPaths))
+        while pending:
+            try:
+                finished, _ = wait(pending, return_when = FIRST_COMPLETED)
+            except InterruptTriggered:
+                # interrupted while waiting, running syncs stop before their next song and are waited for
+                _stopSyncs(stop)
+                continue
+
+            for sync in finished:
+                plPath = pending.pop(sync)
+                try:
+                    results[plPath] = sync.result()
+                except InterruptTriggered as e:
+                    _stopSyncs(stop)
+                    results[plPath] = e
+                except Exception as e:
+                    cfg.logger.exception(e)
+                    results[plPath] = e
+                    with openMetaData(plPath) as metaData:
+                        correctStateCorruption(plPath,metaData)
+
+    _logSyncSummary(plPaths, results)
+    if stop.is_set():
+        raise InterruptTriggered
+
+
+def _stopSyncs(stop):
+    if not stop.is_set():
+        stop.set()
+        cfg.logger.info("Stopping Playlists Being Synced...")
+
+
+def _logSyncSummary(plPaths, results):
+    cfg.logger.info("\n===============================================")
+    cfg.logger.info(f"Synced {sum(1 for result in results.values() if isinstance(result, tuple))}/{len(plPaths)} Playlists:")
+    for plPath in plPaths:
+        result = results.get(plPath)
+        if result is None:
+            cfg.logger.info(f"{plPath}: Not Synced")
+        elif isinstance(result, InterruptTriggered):
+            cfg.logger.info(f"{plPath}: Interrupted")
+        elif isinstance(result, Exception):
+            cfg.logger.info(f"{plPath}: Failed, {result.__class__.__name__}: {result}")
+        else:
+            numAdded, numFailed = result
+            summary = f"{plPath}: {numAdded} Added"
+            if numFailed > 0:
+                summary += f", {numFailed} Failed to Download"
+            cfg.logger.info(summary)
 
 
 
@@ -135,13 +291,13 @@ def manualAdd(plPath, songPath, posistion):
         cfg.logger.error(f'{songPath} Does Not Exist')
         return
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
-
         idsLen = len(metaData["ids"])
-        numDigits = getNumDigets(idsLen)
+        numDigits = prependWidth(plPath, metaData, idsLen)
+
+        currentDir = getLocalSongs(plPath, metaData)
 
         #clamp posistion
         if posistion > idsLen:
@@ -155,23 +311,21 @@ def manualAdd(plPath, songPath, posistion):
         for i in reversed(range(posistion, idsLen)):
             oldName = currentDir[i]
 
-            newName = re.sub(cfg.filePrependRE, f"{createNumLabel(i+1,numDigits)}_" , oldName)
+            # old posistion is blanked in case of crash, blank entries can be removed restoring state
+            relabel(metaData,cfg.logger.debug,plPath,oldName,i,i+1,numDigits)
 
-            with noInterrupt:
-                rename(metaData,cfg.logger.debug,plPath,oldName,newName,i+1,metaData["ids"][i])
 
-                metaData["ids"][i] = '' #wiped in case of crash, this blank entries can be removed restoring state
-
-
-        newSongName = f"{createNumLabel(posistion,numDigits)}_" + ntpath.basename(songPath)
+        if metaData.virtualOrder:
+            newSongName = uniqueSongName(plPath, ntpath.basename(songPath))
+        else:
+            newSongName = f"{createNumLabel(posistion,numDigits)}_" + ntpath.basename(songPath)
 
         with noInterrupt:
+            intent = metaData.logIntent('rename', songPath, f'{plPath}/{newSongName}', setSongs = [(posistion,cfg.manualAddId,newSongName)])
+
             os.rename(songPath,f'{plPath}/{newSongName}')
 
-            if posistion >= len(metaData["ids"]):
-                metaData["ids"].append(cfg.manualAddId)
-            else:
-                metaData["ids"][posistion] = cfg.manualAddId
+            metaData.commitIntent(intent)
 
 def swap(plPath, index1, index2):
     '''moves song to provided posistion, shifting all below it down'''
@@ -179,13 +333,13 @@ def swap(plPath, index1, index2):
         cfg.logger.info(f"Given Index are the Same")
 
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
-
         idsLen = len(metaData["ids"])
-        numDigits = getNumDigets(idsLen)
+        numDigits = prependWidth(plPath, metaData, idsLen)
+
+        currentDir = getLocalSongs(plPath, metaData)
 
         if index1>=idsLen or index2>=idsLen:
             cfg.logger.error(f"Given Index is Larger than Max {idsLen-1}")
@@ -222,13 +376,13 @@ def move(plPath, currentIndex, newIndex):
         return
 
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
-
         idsLen = len(metaData["ids"])
-        numDigits = getNumDigets(idsLen)
+        numDigits = prependWidth(plPath, metaData, idsLen)
+
+        currentDir = getLocalSongs(plPath, metaData)
 
 
         if currentIndex>=idsLen:
@@ -279,13 +433,13 @@ def moveRange(plPath, start, end, newStart):
         return
 
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
-
         idsLen = len(metaData["ids"])
-        numDigits = getNumDigets(idsLen)
+        numDigits = prependWidth(plPath, metaData, idsLen)
+
+        currentDir = getLocalSongs(plPath, metaData)
 
 
         if start>=idsLen:
@@ -325,7 +479,7 @@ def moveRange(plPath, start, end, newStart):
         #accounts for block of songs being shifted if start>newStart
         offset = 0
         if start>newStart:
-            currentDir = getLocalSongs(plPath)
+            currentDir = getLocalSongs(plPath, metaData)
             offset = blockSize
 
         # shift block into gap made
@@ -380,7 +534,7 @@ def shuffle(plPath):
     cfg.logger.info("Shuffling Playlist")
 
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
         plLen = len(metaData["ids"])
@@ -400,12 +554,12 @@ def showPlaylist(plPath, lineBreak='', urlWithoutId = "https://www.youtube.com/w
     lineBreak can be set to newline if you wish to format for small screens
     urlWithoutId is added if you wish to print out all full urls
     '''
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         cfg.logger.info(f"Playlist URL: {metaData['url']}")
 
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
+        currentDir = getLocalSongs(plPath, metaData)
 
         maxNum = len(currentDir)
         numDigits = len(str(maxNum))
@@ -423,13 +577,13 @@ def showPlaylist(plPath, lineBreak='', urlWithoutId = "https://www.youtube.com/w
 
 def compareMetaData(plPath):
     '''Tool for comparing ids held in metadata and their order compared to remote playlist ids'''
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath, metaData)
 
         remoteIds, remoteTitles = getIdsAndTitles(metaData["url"])
         localIds = metaData["ids"]
         assert isinstance(localIds, list)
-        currentDir = getLocalSongs(plPath)
+        currentDir = getLocalSongs(plPath, metaData)
 
         maxNum = max(len(localIds), len(remoteIds))
         numDigits = len(str(maxNum))
@@ -507,7 +661,7 @@ def peek(urlOrPlName,fmt="{index}: {url} {title}"):
     musicDir = os.listdir(path= musicPath)
 
     if urlOrPlName in musicDir:
-        with shelve.open(f"{musicPath}/{urlOrPlName}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(f"{musicPath}/{urlOrPlName}") as metaData:
             urlOrPlName = metaData['url']
 
 
@@ -520,7 +674,11 @@ def peek(urlOrPlName,fmt="{index}: {url} {title}"):
 
 
 def togglePrepends(plPath):
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(plPath) as metaData:
+        if metaData.virtualOrder:
+            cfg.logger.error("Playlist Uses Virtual Ordering, Songs Have No Prepends to Toggle")
+            return
+
         if "removePrependOrder" in metaData:
             # prepends where removed, hence we must add them
             correctStateCorruption(plPath,metaData) # part of correcting state corruption is re-adding prepends
@@ -530,12 +688,128 @@ def togglePrepends(plPath):
         cfg.logger.info("Prepends Removed")
 
 
+def setPrefixWidth(plPath, width):
+    '''
+    sets the minimum width of number prepends, and renames songs to the new width
+    the playlist can grow to 10^width-2 songs before any new song gets a wider prepend
+    '''
+    if width < 1:
+        cfg.logger.error("Prefix Width Must be at Least 1")
+        return
+
+    with openMetaData(plPath) as metaData:
+        if metaData.virtualOrder:
+            cfg.logger.error("Playlist Uses Virtual Ordering, Songs Have No Prepends")
+            return
+
+        correctStateCorruption(plPath,metaData)
+
+        currentDir = getLocalSongs(plPath, metaData)
+        numDigets = getNumDigets(len(currentDir), width)
+
+        cfg.logger.info(f"Setting Prefix Width of {ntpath.basename(plPath)} to {numDigets}")
+        for i,oldName in enumerate(currentDir):
+            newName = re.sub(cfg.filePrependRE, f"{createNumLabel(i,numDigets)}_", oldName, count=1)
+            if newName != oldName:
+                rename(metaData,cfg.logger.debug,plPath,oldName,newName,i,metaData['ids'][i])
+
+        # stored once every song has the width (see prependWidth)
+        metaData['prefixWidth'] = numDigets
+
+
+def toggleVirtualOrder(plPath):
+    '''
+    toggles between keeping the playlist order in number prepends and keeping it only in metadata (virtual ordering)
+    with virtual ordering songs are not renamed when moved, the order is written to an .m3u8 index instead
+    '''
+    with openMetaData(plPath) as metaData:
+        if "removePrependOrder" in metaData:
+            cfg.logger.error("Prepends are Removed, Add Them Back Before Toggling Virtual Ordering")
+            return
+
+        correctStateCorruption(plPath,metaData)
+
+        # set for the duration of the conversion, so it is finished if interrupted
+        converting = metaData.get('convertingOrder')
+        if converting is None:
+            converting = 'prefixed' if metaData.virtualOrder else 'virtual'
+            metaData['convertingOrder'] = converting
+
+        if converting == 'virtual':
+            if not metaData.virtualOrder:
+                getLocalSongs(plPath, metaData) # stores song names in metadata
+                if None in metaData.songNames():
+                    cfg.logger.error("Local Songs do not Match Metadata, Cannot Use Virtual Ordering")
+                    del metaData['convertingOrder']
+                    return
+
+                # each song keeps its metadata entry, so the playlist is valid in virtual ordering from here on
+                metaData.setVirtualOrder(True)
+
+            for i,name in enumerate(metaData.songNames()):
+                if re.match(cfg.filePrependRE, name) and getSongNum(name) == i:
+                    newName = uniqueSongName(plPath, re.sub(cfg.filePrependRE, "", name, count=1))
+                    rename(metaData,cfg.logger.debug,plPath,name,newName,i,metaData['ids'][i])
+
+            cfg.logger.info("Virtual Ordering On")
+
+        else:
+            names = metaData.songNames()
+            numDigets = getNumDigets(len(names), metaData.prefixWidth)
+
+            for i,name in enumerate(names):
+                label = f"{createNumLabel(i,numDigets)}_"
+                if not name.startswith(label):
+                    rename(metaData,cfg.logger.debug,plPath,name,label+name,i,metaData['ids'][i])
+
+            metaData['prefixWidth'] = numDigets
+            metaData.setVirtualOrder(False)
+            cfg.logger.info("Virtual Ordering Off")
+
+        del metaData['convertingOrder']
+
+
+def _readTimestamps(songPath, songName, videoId, scrapeExisting, rateLimiter):
+    '''
+    run concurrently by addTimestampsFromComments, returns (SongInfo, comment timestamps)
+    comment timestamps are None if they werent scraped, returns None if the song couldnt be read
+    '''
+    songInfo = readSongInfo(songPath, videoId)
+    if songInfo is None:
+        cfg.logger.error(f"Failed to Read Chapters of Song: {songName}")
+        return None
+
+    if len(songInfo.timestamps) > 0 and not scrapeExisting:
+        return songInfo, None
+
+    cfg.logger.debug(f"Scraping Comments for Timestamps of Song: {songName}")
+    return songInfo, scrapeCommentsForTimestamps(videoId, rateLimiter = rateLimiter)
+
+
+def _applyTimestamps(songPath, songName, videoId, timestamps, duration, workPath):
+    '''run concurrently by addTimestampsFromComments, workPath holds the metadata file and remuxed song'''
+    os.mkdir(workPath)
+    return applyTimestampsToSong(songPath, songName, timestamps, duration, f"{workPath}/FFMETADATAFILE", f"{workPath}/songEdit", videoId)
+
+
 def addTimestampsFromComments(plPath, start, end, autoAccept = False, overwrite = False, autoOverwrite = False):
+    '''
+    existing chapters are read and comments are scraped for every song in the range up front (concurrently, with
+    scraping limited to cfg.commentScrapesPerSecond), then only songs needing a decision are prompted for.
+    accepted timestamps are applied by ffmpeg concurrently, while later songs are being prompted for
+    '''
+    if autoOverwrite and not overwrite:
+        cfg.logger.error("auto-overwrite can only be enabled if overwrite is")
+        return
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    if autoOverwrite and not autoAccept:
+        cfg.logger.error("auto-overwrite can only be enabled if auto-accept is")
+        return
+
+    with openMetaData(plPath) as metaData:
         correctStateCorruption(plPath,metaData)
 
-        currentDir = getLocalSongs(plPath)
+        currentDir = getLocalSongs(plPath, metaData)
         idsLen = len(metaData["ids"])
 
         ### Sanitize Inputs ###
@@ -556,35 +830,35 @@ def addTimestampsFromComments(plPath, start, end, autoAccept = False, overwrite
             return
         ### Sanitize Inputs Over ###
 
+        songs = [(i, currentDir[i], metaData['ids'][i]) for i in range(start,end+1)]
 
-        multipleSongs = start!=end
-        for i in range(start,end+1):
+    multipleSongs = start!=end
+    cfg.clearTmpSubPath(cfg.songEditPath)
+    rateLimiter = RateLimiter(cfg.commentScrapesPerSecond)
 
-            if autoOverwrite and not overwrite:
-                cfg.logger.error("auto-overwrite can only be enabled if overwrite is")
-                return
+    with ThreadPoolExecutor(max_workers = cfg.downloadWorkers) as scrapePool, \
+         ThreadPoolExecutor(max_workers = os.cpu_count() or 1) as ffmpegPool:
 
-            if autoOverwrite and not autoAccept:
-                cfg.logger.error("auto-overwrite can only be enabled if auto-accept is")
-                return
+        # overwrite can only be turned off while prompting, so songs with existing timestamps are scraped if it starts on
+        readFutures = [scrapePool.submit(_readTimestamps, f"{plPath}/{songName}", songName, videoId, overwrite, rateLimiter)
+                       for _,songName,videoId in songs]
 
-            songName = currentDir[i]
+        applyFutures = []
+        for (i,songName,videoId), readFuture in zip(songs, readFutures):
             songPath = f"{plPath}/{songName}"
-            videoId = metaData['ids'][i]
 
-            if not createChapterFile(songPath, songName):
+            result = readFuture.result()
+            if result is None:
                 continue
+            songInfo, timestamps = result
+            existingTimestamps = songInfo.timestamps
 
-            # Check for existing chapters in ffmpegMetadata file, wipe them, and prompt user to continue
-            existingTimestamps = wipeChapterFile()
             if len(existingTimestamps) > 0:
                 if not overwrite:
                     cfg.logger.info(f"{i}: Existing Timestamps Detected on Song: {songName}\nSkipping...\n")
                     continue
 
-            # Get timestamps
-            cfg.logger.info(f"{i}: Scraping Comments for Timestamps of Song: {songName}")
-            timestamps = scrapeCommentsForTimestamps(videoId)
+            cfg.logger.info(f"{i}: Comment Timestamps of Song: {songName}")
 
             if len(timestamps) == 0:
                 cfg.logger.info(f"No Timestamps Found\n")
@@ -595,25 +869,21 @@ def addTimestampsFromComments(plPath, start, end, autoAccept = False, overwrite
                 continue
 
             if len(existingTimestamps) > 0:
-                if not overwrite:
-                    cfg.logger.info("Comment Timestamps and Existing Timestamps Found but Overwrite is Disabled\n")
-                    continue
-
                 # existing timestamps, plus timestamps found
                 cfg.logger.info(f"\nExisting Timestamps Found:")
                 numDigitsExistingTimestamps = len(str(len(existingTimestamps)))
                 numDigitsCommentTimestamps = len(str(len(timestamps)))
-                for i,timestamp in enumerate(existingTimestamps):
+                for j,timestamp in enumerate(existingTimestamps):
                     leadChar = ' '
                     if timestamp not in timestamps:
                         leadChar = '-'
-                    cfg.logger.info(f"{leadChar} {padZeros(i, numDigitsExistingTimestamps)}) {timestamp}")
+                    cfg.logger.info(f"{leadChar} {padZeros(j, numDigitsExistingTimestamps)}) {timestamp}")
                 cfg.logger.info(f"\nComment Timestamps Found:")
-                for i,timestamp in enumerate(timestamps):
+                for j,timestamp in enumerate(timestamps):
                     leadChar = ' '
                     if timestamp not in existingTimestamps:
                         leadChar = '+'
-                    cfg.logger.info(f"{leadChar} {padZeros(i, numDigitsCommentTimestamps)}) {timestamp}")
+                    cfg.logger.info(f"{leadChar} {padZeros(j, numDigitsCommentTimestamps)}) {timestamp}")
 
                 cfg.logger.info('\n')
 
@@ -652,13 +922,12 @@ def addTimestampsFromComments(plPath, start, end, autoAccept = False, overwrite
                 else:
                     cfg.logger.info("Auto Accepting Timestamps")
 
-            addTimestampsToChapterFile(timestamps, songPath)
+            applyFutures.append((songName, ffmpegPool.submit(_applyTimestamps, songPath, songName, videoId, timestamps, songInfo.duration, f"{cfg.songEditPath}/{i}")))
 
-            if not applyChapterFileToSong(songPath, songName):
+        for songName, applyFuture in applyFutures:
+            if not applyFuture.result():
                 cfg.logger.error(f"Failed to Add Timestamps To Song {songName}\n")
                 continue
 
-            cfg.logger.info("Timestamps Applied!\n")
-
-
+            cfg.logger.info(f"Timestamps Applied to {songName}!")
 
@@ -1,12 +1,13 @@
 from re import compile
-from yt_dlp.postprocessor import FFmpegExtractAudioPP
 
 from sync_dl.config.tmpdir import createTmpDir, clearTmpDir, clearTmpSubPath, \
                                   tmpDownloadPath, songSegmentsPath, thumbnailPath, songDownloadPath, ffmpegMetadataPath, songEditPath
 
 from sync_dl.config.parsing import modulePath, writeToConfig, readConfig
 
-from sync_dl.config.ytdlParams import setAudioFormat, setEmbedThumbnails, dlParams
+from sync_dl.config.ffmpeg import getFfmpegCapabilities, ffmpegPath, ffprobePath, canConvertTo
+
+from sync_dl.config.ytdlParams import setAudioFormat, setEmbedThumbnails, getDlParams, testFfmpeg
 
 '''
 contains all global variables, also parses config into global variables
@@ -16,8 +17,6 @@ contains all global variables, also parses config into global variables
 filePrependRE = compile(r'\d+_')
 plIdRe = compile(r'list=.{34}')
 
-knownFormats = (*FFmpegExtractAudioPP.SUPPORTED_EXTS, 'best')
-
 metaDataName = readConfig('metaDataName')
 manualAddId = readConfig('manualAddId')
 testPlPath = f"{modulePath}/{readConfig('testPlPath')}"
@@ -27,6 +26,19 @@ musicDir = readConfig('musicDir')
 autoScrapeCommentTimestamps = readConfig('autoScrapeCommentTimestamps', boolean=True)
 audioFormat = readConfig('audioFormat')
 embedThumbnail = readConfig('embedThumbnail', boolean=True)
+downloadWorkers = int(readConfig('downloadWorkers'))
+playlistWorkers = int(readConfig('playlistWorkers'))
+prefixWidth = int(readConfig('prefixWidth')) # minimum prefix width of new playlists, see MetaData.prefixWidth
+useSongStore = readConfig('songStore', boolean=True)
+timestampCachePath = f"{modulePath}/timestampCache.sqlite"
+playlistRegistryPath = f"{modulePath}/playlistRegistry.json"
+daemonSocketPath = f"{modulePath}/daemon.sock"
+daemonSchedulePath = f"{modulePath}/daemonSchedule.json"
+timestampCacheDays = float(readConfig('timestampCacheDays'))
+timestampCacheSize = int(readConfig('timestampCacheSize'))
+commentScrapesPerSecond = float(readConfig('commentScrapesPerSecond'))
+commentPages = int(readConfig('commentPages'))
+commentSeconds = float(readConfig('commentSeconds'))
 
 
 #TODO move add to ini
@@ -37,3 +49,16 @@ import logging
 logger = logging.getLogger('sync_dl')
 
 
+def __getattr__(name):
+    '''
+    dlParams and knownFormats need ffmpeg to be found and yt-dlp to be imported respectively, which slows startup,
+    so they are only worked out once a command uses them
+    '''
+    if name == 'dlParams':
+        return getDlParams()
+
+    if name == 'knownFormats':
+        from yt_dlp.postprocessor import FFmpegExtractAudioPP
+        return (*FFmpegExtractAudioPP.SUPPORTED_EXTS, 'best')
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,153 @@
+'''
+capabilities of the installed ffmpeg and ffprobe (their paths, versions, and the encoders and muxers ffmpeg supports)
+
+probing them takes several subprocesses, so the capabilities are cached in ffmpegCapabilitiesPath and only probed
+again once either binary changes (found by its path and mtime), they are only looked up once a command needs them
+'''
+import os
+import json
+import shutil
+import threading
+import subprocess
+
+from sync_dl.config.parsing import modulePath
+
+ffmpegCapabilitiesPath = f"{modulePath}/ffmpegCapabilities.json"
+
+# ffmpeg encoder and muxer used to convert to each audio format (matches yt-dlp's FFmpegExtractAudioPP)
+audioFormatRequirements = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'aac': ('aac', 'adts'),
+    'm4a': ('aac', 'ipod'),
+    'opus': ('libopus', 'ogg'),
+    'vorbis': ('libvorbis', 'ogg'),
+    'flac': ('flac', 'flac'),
+    'alac': ('alac', 'ipod'),
+    'wav': ('pcm_s16le', 'wav'),
+}
+
+_lock = threading.Lock()
+_capabilities = None
+
+
+def _binaryId(name):
+    '''(path, mtime) of binary, or None if it isnt installed'''
+    path = shutil.which(name)
+    if path is None:
+        return None
+    try:
+        return [path, os.stat(path).st_mtime_ns]
+    except OSError:
+        return None
+
+
+def _run(*cmd):
+    return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+
+
+def _version(path):
+    # first line is of the form: ffmpeg version 6.0 Copyright ...
+    words = _run(path, '-version').split()
+    return words[2] if len(words) > 2 else ''
+
+
+def _listed(output):
+    '''names listed by ffmpeg -encoders/-muxers, which follow a line of dashes (muxers may list several names)'''
+    names = []
+    listing = False
+    for line in output.splitlines():
+        if not listing:
+            listing = line.strip().startswith('--')
+            continue
+
+        fields = line.split()
+        if len(fields) >= 2:
+            names.extend(fields[1].split(','))
+    return names
+
+
+def _probe(ffmpegId, ffprobeId):
+    empty = {'ffmpeg': None, 'ffprobe': None, 'encoders': [], 'muxers': []}
+    capabilities = dict(empty)
+
+    try:
+        if ffmpegId is not None:
+            path = ffmpegId[0]
+            capabilities['ffmpeg'] = {'path': path, 'version': _version(path)}
+            capabilities['encoders'] = _listed(_run(path, '-hide_banner', '-encoders'))
+            capabilities['muxers'] = _listed(_run(path, '-hide_banner', '-muxers'))
+
+        if ffprobeId is not None:
+            path = ffprobeId[0]
+            capabilities['ffprobe'] = {'path': path, 'version': _version(path)}
+
+    except (OSError, subprocess.CalledProcessError):
+        # a binary exists but cant be run, they are treated as not installed
+        capabilities = dict(empty)
+
+    # what the capabilities where probed from, so they are probed again if either binary changes
+    capabilities['ids'] = [ffmpegId, ffprobeId]
+    return capabilities
+
+
+def _readCache():
+    try:
+        with open(ffmpegCapabilitiesPath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _writeCache(capabilities):
+    tmpPath = f"{ffmpegCapabilitiesPath}.{os.getpid()}.tmp"
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump(capabilities, f)
+        os.replace(tmpPath, ffmpegCapabilitiesPath)
+    except OSError:
+        # the cache is only an optimization (ie the install may be read only)
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def getFfmpegCapabilities():
+    '''returns the capabilities of ffmpeg and ffprobe (see _probe), probing them only if they have changed since cached'''
+    global _capabilities
+    with _lock:
+        if _capabilities is not None:
+            return _capabilities
+
+        ids = [_binaryId('ffmpeg'), _binaryId('ffprobe')]
+
+        capabilities = _readCache()
+        if capabilities is None or capabilities.get('ids') != ids:
+            capabilities = _probe(*ids)
+            _writeCache(capabilities)
+
+        _capabilities = capabilities
+        return _capabilities
+
+
+def ffmpegPath():
+    '''path of ffmpeg, or None if it isnt installed'''
+    ffmpeg = getFfmpegCapabilities()['ffmpeg']
+    return None if ffmpeg is None else ffmpeg['path']
+
+
+def ffprobePath():
+    '''path of ffprobe, or None if it isnt installed'''
+    ffprobe = getFfmpegCapabilities()['ffprobe']
+    return None if ffprobe is None else ffprobe['path']
+
+
+def canConvertTo(audioFormat):
+    '''whether the installed ffmpeg has the encoder and muxer needed to convert to audioFormat'''
+    if audioFormat == 'best':
+        return True
+
+    capabilities = getFfmpegCapabilities()
+    if capabilities['ffmpeg'] is None or audioFormat not in audioFormatRequirements:
+        return False
+
+    encoder, muxer = audioFormatRequirements[audioFormat]
+    return encoder in capabilities['encoders'] and muxer in capabilities['muxers']
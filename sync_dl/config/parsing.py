@@ -11,7 +11,16 @@ _defaultConfig = {
     'musicDir' : '',
     'autoScrapeCommentTimestamps': '0',
     'audioFormat': 'best',
-    'embedThumbnail': '0'
+    'embedThumbnail': '0',
+    'downloadWorkers': '4',
+    'playlistWorkers': '4',
+    'prefixWidth': '3',
+    'songStore': '0',
+    'timestampCacheDays': '30',
+    'timestampCacheSize': '100000',
+    'commentScrapesPerSecond': '4',
+    'commentPages': '5',
+    'commentSeconds': '10'
 }
 
 #loading config
@@ -35,20 +44,15 @@ def readConfig(key, boolean = False):
     return _config[key]
 
 def checkConfig():
-    global _defaultConfig
+    '''
+    reads config.ini over the defaults, keys missing from it take their default value. the file is only written
+    when a value is changed (by writeToConfig), so reading the config is cheap and works in read only installs
+    '''
     global _config
     cfgPath = f'{modulePath}/config.ini'
 
-    if not os.path.exists(cfgPath):
-        _parser['CONFIG'] = _defaultConfig
-        with open(cfgPath, 'w+') as f:
-            _parser.write(f)
-    else:
-        _parser.read(cfgPath)
+    _parser.read_dict({'CONFIG': _defaultConfig})
+    _parser.read(cfgPath)
     _config = _parser['CONFIG']
 
-    for key in _defaultConfig.keys():
-        if not key in _config.keys():
-            writeToConfig(key, _defaultConfig[key])
-
 checkConfig()
@@ -1,35 +1,28 @@
-import subprocess
 from sync_dl.config.parsing import writeToConfig, readConfig
+from sync_dl.config.ffmpeg import ffmpegPath, canConvertTo
 
-# youtube-dl dlParams, used in downloadToTmp
-dlParams={"quiet": True, "noplaylist": True, 'format': 'bestaudio'}
+# youtube-dl dlParams, used in downloadToTmp. built by getDlParams when first needed, as the postprocessors
+# depend on whether ffmpeg is installed
+_dlParams = None
 
 
-_ffmpegTested = False
-_hasFfmpeg = False
-
 def testFfmpeg():
-    global _ffmpegTested
-    global _hasFfmpeg
-    if _ffmpegTested:
-        return _hasFfmpeg
-    try:
-        subprocess.check_output(['ffmpeg', '-version'])
-    except:
-        _ffmpegTested = True
-        _hasFfmpeg = False
-        return False
+    '''whether ffmpeg is installed (see config.ffmpeg)'''
+    return ffmpegPath() is not None
 
-    _ffmpegTested = True
-    _hasFfmpeg = True
-    return True
 
+def getDlParams():
+    global _dlParams
+    if _dlParams is None:
+        _dlParams = {"quiet": True, "noplaylist": True, 'format': 'bestaudio', 'postprocessors': []}
+        if testFfmpeg():
+            _dlParams['postprocessors'].append(
+                {'key': 'FFmpegMetadata'}
+            )
+        _applyAudioFormat(_dlParams)
+        _applyEmbedThumbnails(_dlParams)
 
-dlParams['postprocessors'] = []
-if testFfmpeg():
-    dlParams['postprocessors'].append(
-        {'key': 'FFmpegMetadata'}
-    )
+    return _dlParams
 
 def _addIfNotExists(l, key, val):
     for i in range(len(l)):
@@ -47,8 +40,11 @@ def _removeIfExists(l, key):
 
 
 def setAudioFormat():
-    global audioFormat
-    global dlParams
+    '''applies audioFormat in config to dlParams (if they have been built)'''
+    if _dlParams is not None:
+        _applyAudioFormat(_dlParams)
+
+def _applyAudioFormat(dlParams):
     audioFormat = readConfig('audioFormat')
 
     if audioFormat == 'best':
@@ -59,6 +55,9 @@ def setAudioFormat():
         if not testFfmpeg():
             writeToConfig('audioFormat', 'best')
             raise Exception("ffmpeg is Required to Use Audio Format Other Than 'best'")
+        if not canConvertTo(audioFormat):
+            writeToConfig('audioFormat', 'best')
+            raise Exception(f"Installed ffmpeg Cannot Convert to Audio Format: {audioFormat}")
         dlParams['format'] = f'{audioFormat}/bestaudio'
         _addIfNotExists(dlParams['postprocessors'], 'FFmpegExtractAudio', {
             'key': 'FFmpegExtractAudio',
@@ -67,10 +66,12 @@ def setAudioFormat():
             'nopostoverwrites': True
         })
 
-setAudioFormat()
-
 def setEmbedThumbnails():
-    global embedThumbnail
+    '''applies embedThumbnail in config to dlParams (if they have been built)'''
+    if _dlParams is not None:
+        _applyEmbedThumbnails(_dlParams)
+
+def _applyEmbedThumbnails(dlParams):
     embedThumbnail = readConfig('embedThumbnail', boolean=True)
     if embedThumbnail:
         dlParams['writethumbnail'] = True
@@ -82,5 +83,3 @@ def setEmbedThumbnails():
         _removeIfExists(dlParams['postprocessors'], 'EmbedThumbnail')
         if 'writethumbnail' in dlParams:
             dlParams.pop('writethumbnail')
-
-setEmbedThumbnails()
@@ -0,0 +1,434 @@
+'''
+long running sync-dl process (sync-dl daemon), which keeps yt-dlp, its extractors and the ffmpeg capabilities loaded
+between commands and syncs scheduled playlists every few minutes
+
+while it runs, other sync-dl commands are forwarded to it over a unix socket at cfg.daemonSocketPath, rather than run
+in a new process. each message is a line of json:
+    client -> daemon:  {"argv": [...], "cwd": ...} then {"input": line} or {"interrupt": true}
+    daemon -> client:  {"out": text}, {"read": true} (client replies with input) and finally {"done": true}
+                       or only {"rejected": true} if the client belongs to another user
+
+commands are run one at a time by the thread running the daemon (so playlists are never edited by two commands at
+once), with their stdin and stdout redirected to the client
+'''
+import os
+import io
+import sys
+import json
+import time
+import struct
+import queue
+import socket
+import logging
+import threading
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+
+import sync_dl.config as cfg
+from sync_dl import noInterrupt, InterruptTriggered
+
+# the running daemon (in this process), if any
+_daemon = None
+
+
+def available():
+    return hasattr(socket, 'AF_UNIX')
+
+
+def isRunning():
+    '''whether a daemon is accepting commands'''
+    if not available() or not os.path.exists(cfg.daemonSocketPath):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(cfg.daemonSocketPath)
+        return True
+    except OSError:
+        return False
+
+
+def readSchedule():
+    '''returns the scheduled playlists, {plPath: {"minutes": M, "appendOnly": bool}}'''
+    try:
+        with open(cfg.daemonSchedulePath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _writeSchedule(schedule):
+    tmpPath = f"{cfg.daemonSchedulePath}.{os.getpid()}.tmp"
+    with open(tmpPath, 'w') as f:
+        json.dump(schedule, f, indent = 2)
+    os.replace(tmpPath, cfg.daemonSchedulePath)
+
+
+def schedule(plPath, minutes, appendOnly = False):
+    '''schedules plPath to be synced by the daemon every minutes'''
+    plPath = os.path.abspath(plPath)
+    plSchedule = readSchedule()
+    plSchedule[plPath] = {'minutes': minutes, 'appendOnly': appendOnly}
+    _writeSchedule(plSchedule)
+
+    if _daemon is not None:
+        _daemon.lastSynced.pop(plPath, None)
+
+
+def unschedule(plPath):
+    '''returns False if plPath wasnt scheduled'''
+    plPath = os.path.abspath(plPath)
+    plSchedule = readSchedule()
+    if plPath not in plSchedule:
+        return False
+
+    del plSchedule[plPath]
+    _writeSchedule(plSchedule)
+    return True
+
+
+def status():
+    '''logs whether the daemon is running and the scheduled playlists'''
+    if _daemon is not None:
+        cfg.logger.info(f"Daemon Running (pid {os.getpid()}) for {_formatDuration(time.time() - _daemon.started)}")
+    else:
+        cfg.logger.info("Daemon Not Running")
+
+    plSchedule = readSchedule()
+    if len(plSchedule) == 0:
+        cfg.logger.info("No Playlists Scheduled")
+        return
+
+    cfg.logger.info("Scheduled Playlists:")
+    for plPath, entry in plSchedule.items():
+        line = f"{plPath}: {'Append New' if entry['appendOnly'] else 'Smart Sync'} Every {entry['minutes']} Minutes"
+        if _daemon is not None and plPath in _daemon.lastSynced:
+            line += f", Last Synced {_formatDuration(time.time() - _daemon.lastSynced[plPath])} Ago"
+        cfg.logger.info(line)
+
+
+def stop():
+    '''stops the running daemon once its current command finishes'''
+    if _daemon is None:
+        cfg.logger.error("Daemon Not Running")
+        return
+    cfg.logger.info("Stopping Daemon...")
+    _daemon.stopping.set()
+
+
+def _formatDuration(seconds):
+    minutes = int(seconds)//60
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes//60}h{minutes%60}m"
+
+
+def _send(wfile, message):
+    try:
+        wfile.write((json.dumps(message) + '\n').encode())
+        wfile.flush()
+    except (OSError, ValueError):
+        # the client has gone, the command is still finished
+        pass
+
+
+class _ClientOutput(io.TextIOBase):
+    '''stdout of a forwarded command'''
+    def __init__(self, job):
+        self.job = job
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        _send(self.job.wfile, {'out': text})
+        return len(text)
+
+
+class _ClientInput(io.TextIOBase):
+    '''stdin of a forwarded command, lines are read from the client'''
+    def __init__(self, job):
+        self.job = job
+
+    def readable(self):
+        return True
+
+    def readline(self, size = -1):
+        _send(self.job.wfile, {'read': True})
+        line = self.job.inputs.get()
+        return '' if line is None else line
+
+
+class _Job:
+    def __init__(self, argv, cwd, wfile):
+        self.argv = argv
+        self.cwd = cwd
+        self.wfile = wfile
+        self.inputs = queue.Queue()
+        self.running = False
+        self.done = threading.Event()
+
+
+def _peerUid(sock):
+    '''returns the uid of the process connected to sock, or None if it cant be found on this platform'''
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+        return uid
+    return None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    '''queues the command sent by a client, then passes on its input until the command is done'''
+    def handle(self):
+        # commands run as the daemons user, so are only taken from that user
+        try:
+            uid = _peerUid(self.request)
+        except OSError:
+            return
+        if uid is not None and uid != os.getuid():
+            cfg.logger.debug(f"Rejected Command From uid {uid}")
+            _send(self.wfile, {'rejected': True})
+            return
+
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        job = _Job(request['argv'], request['cwd'], self.wfile)
+        self.server.jobs.put(job)
+
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+
+            if 'input' in message:
+                job.inputs.put(message['input'])
+            elif message.get('interrupt') and job.running:
+                noInterrupt.simulateSigint()
+
+        # client has gone, the command is interrupted as if it where run by the client
+        job.inputs.put(None)
+        if job.running and not job.done.is_set():
+            noInterrupt.simulateSigint()
+        job.done.wait()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, path, jobs):
+        self.jobs = jobs
+        super().__init__(path, _RequestHandler)
+
+
+class Daemon:
+    '''
+    runs forwarded commands and scheduled syncs, one at a time, in the thread calling serve
+    (the main thread, so they can be interrupted like commands run from the cli)
+    '''
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.stopping = threading.Event()
+        self.lastSynced = {}
+        self.started = time.time()
+
+    def warmUp(self):
+        '''loads what commands would otherwise each load, yt-dlp with its youtube extractors and ffmpegs capabilities'''
+        from sync_dl.ytdlWrappers import session
+
+        cfg.getFfmpegCapabilities()
+        with session.extractor() as ydl:
+            for extractor in ('Youtube', 'YoutubeTab'):
+                ydl.get_info_extractor(extractor)
+
+    def serve(self):
+        global _daemon
+
+        if os.path.exists(cfg.daemonSocketPath):
+            if isRunning():
+                cfg.logger.error("Daemon Already Running")
+                return
+            # left by a daemon which didnt stop cleanly
+            os.remove(cfg.daemonSocketPath)
+
+        # the socket is created only accessible to its owner, rather than restricted after being bound
+        umask = os.umask(0o177)
+        try:
+            server = _Server(cfg.daemonSocketPath, self.jobs)
+        finally:
+            os.umask(umask)
+        serverThread = threading.Thread(target = server.serve_forever, daemon = True)
+        serverThread.start()
+
+        _daemon = self
+        cfg.logger.info(f"Daemon Listening on {cfg.daemonSocketPath}")
+        try:
+            while not self.stopping.is_set():
+                try:
+                    job = self.jobs.get(timeout = min(self._secondsUntilDue(), 60))
+                except queue.Empty:
+                    job = None
+
+                if job is None:
+                    self._syncDue()
+                else:
+                    self._run(job)
+
+        except InterruptTriggered:
+            cfg.logger.info("Stopping Daemon...")
+
+        finally:
+            _daemon = None
+            server.shutdown()
+            self._rejectQueued()
+            server.server_close()
+            os.remove(cfg.daemonSocketPath)
+
+    def _rejectQueued(self):
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            _send(job.wfile, {'out': "Daemon Stopped Before Running Command\n"})
+            _send(job.wfile, {'done': True})
+            job.done.set()
+
+    def _secondsUntilDue(self):
+        now = time.time()
+        waits = [self.lastSynced.get(plPath, 0) + 60*entry['minutes'] - now for plPath, entry in readSchedule().items()]
+        return max(0, min(waits, default = 60))
+
+    def _syncDue(self):
+        from sync_dl.commands import syncPlaylists
+        from sync_dl.metaDataStore import metaDataExists
+
+        now = time.time()
+        due = {False: [], True: []}
+        for plPath, entry in readSchedule().items():
+            if now - self.lastSynced.get(plPath, 0) < 60*entry['minutes']:
+                continue
+            self.lastSynced[plPath] = now
+
+            if not metaDataExists(plPath):
+                cfg.logger.error(f"Scheduled Playlist {plPath} No Longer Exists, Use sync-dl daemon --unschedule to Remove it")
+                continue
+            due[entry['appendOnly']].append(plPath)
+
+        for appendOnly, plPaths in due.items():
+            if len(plPaths) > 0:
+                try:
+                    syncPlaylists(plPaths, appendOnly = appendOnly)
+                except InterruptTriggered:
+                    cfg.logger.info("Scheduled Sync Interrupted")
+
+    def _run(self, job):
+        from sync_dl.cli import setupParsers, logSettings, runCommand
+        from sync_dl.ytdlWrappers import session
+
+        output = _ClientOutput(job)
+        handler = logging.StreamHandler(output)
+        cwd = os.getcwd()
+        dlSettings = (cfg.audioFormat, cfg.embedThumbnail)
+
+        job.running = True
+        try:
+            os.chdir(job.cwd)
+            with redirect_stdout(output), redirect_stderr(output):
+                stdin, sys.stdin = sys.stdin, _ClientInput(job)
+                try:
+                    args = setupParsers(job.argv)
+                    level, formatter = logSettings(args)
+                    handler.setLevel(level)
+                    handler.setFormatter(formatter)
+                    cfg.logger.addHandler(handler)
+
+                    runCommand(args)
+
+                except SystemExit:
+                    # argparse exits after printing usage errors
+                    pass
+                finally:
+                    sys.stdin = stdin
+                    cfg.logger.removeHandler(handler)
+
+        except OSError as e:
+            _send(job.wfile, {'out': f"{e}\n"})
+
+        finally:
+            os.chdir(cwd)
+            job.running = False
+            noInterrupt.signalReceived = False # interrupts from the client only apply to its command
+
+            # downloaders are built with the audio format and thumbnail settings
+            if dlSettings != (cfg.audioFormat, cfg.embedThumbnail):
+                session.close()
+
+            _send(job.wfile, {'done': True})
+            job.done.set()
+
+
+def runDaemon():
+    if not available():
+        cfg.logger.error("The Daemon Requires Unix Sockets, Which Arent Supported on This Platform")
+        return
+
+    # the daemons own output is at the level it was started with, forwarded commands may log at any level
+    level = cfg.logger.level
+    for handler in cfg.logger.handlers:
+        handler.setLevel(level)
+    cfg.logger.setLevel(logging.DEBUG)
+
+    daemon = Daemon()
+    cfg.logger.info("Starting Daemon...")
+    daemon.warmUp()
+    daemon.serve()
+
+
+def forward(argv, stdin = None, stdout = None):
+    '''
+    runs the sync-dl command argv in the daemon, passing on stdin and stdout (default sys.stdin and sys.stdout)
+    returns False if the daemon couldnt be reached or belongs to another user, in which case the command should be
+    run locally
+    '''
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(cfg.daemonSocketPath)
+    except OSError:
+        sock.close()
+        return False
+
+    with sock, sock.makefile('rb') as rfile, sock.makefile('wb') as wfile:
+        _send(wfile, {'argv': argv, 'cwd': os.getcwd()})
+
+        messages = iter(rfile)
+        while True:
+            try:
+                line = next(messages, None)
+                if line is None:
+                    stdout.write("Lost Connection to Daemon\n")
+                    break
+
+                message = json.loads(line)
+                if 'out' in message:
+                    stdout.write(message['out'])
+                    stdout.flush()
+                elif message.get('read'):
+                    _send(wfile, {'input': stdin.readline()})
+                elif message.get('done'):
+                    break
+                elif message.get('rejected'):
+                    return False
+
+            except InterruptTriggered:
+                # the daemon finishes the current operation, like the command would if it where run here
+                _send(wfile, {'interrupt': True})
+
+    return True
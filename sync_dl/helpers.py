@@ -1,11 +1,18 @@
 import os
 import re
 import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque, Counter
 from typing import Union, List
 
-from sync_dl import noInterrupt
+from sync_dl import noInterrupt, InterruptTriggered
 import sync_dl.config as cfg
-from sync_dl.ytdlWrappers import downloadToTmp,moveFromTmp
+from sync_dl.ytdlWrappers import downloadToTmp,moveFromTmp,getTmpSongName
+from sync_dl import songStore
+from sync_dl.timestamps import addTimestampsIfNoneExist
 
 _ords = ('th', 'st', 'nd', 'rd')
 def getOrdinalIndicator(n: int):
@@ -13,21 +20,39 @@ def getOrdinalIndicator(n: int):
 
 
 
-def getNumDigets(plLen):
-    return len(str( plLen+1 ))
+def getNumDigets(plLen, minWidth = 1):
+    '''
+    width of number prepends in a playlist of plLen songs, at least minWidth (see MetaData.prefixWidth)
+    playlists with metadata should use prependWidth, which keeps every prepend in the playlist the same width
+    '''
+    return max(minWidth, len(str( plLen+1 )))
 
 def padZeros(s, numDigits):
     return str(s).zfill(numDigits)
 
+# each primitive records an intent in the metadata journal before touching the filesystem, the metadata edits
+# are then committed along with the removal of the intent. see plManagement._replayJournal for recovery
+
+def uniqueSongName(plPath, songName):
+    '''
+    used for playlists with virtual ordering, where song names have no number prepend to make them unique
+    returns songName, with a number added before the extension if a file of that name already exists
+    '''
+    base, ext = os.path.splitext(songName)
+    n = 1
+    while os.path.exists(f"{plPath}/{songName}"):
+        songName = f"{base} ({n}){ext}"
+        n += 1
+    return songName
+
 def rename(metaData, printer, plPath, oldName, newName, index, newId):
     with noInterrupt:
         printer(f"Renaming {oldName} to {newName}")
+        intent = metaData.logIntent('rename', f"{plPath}/{oldName}", f"{plPath}/{newName}", setSongs = [(index,newId,newName)])
+
         os.rename(f"{plPath}/{oldName}",f"{plPath}/{newName}")
 
-        if index >= len(metaData["ids"]):
-            metaData["ids"].append(newId)
-        else:
-            metaData["ids"][index] = newId
+        metaData.commitIntent(intent)
         printer("Renaming Complete")
 
 def relabel(metaData, printer,plPath, oldName, oldIndex, newIndex, numDigets):
@@ -39,92 +64,311 @@ def relabel(metaData, printer,plPath, oldName, oldIndex, newIndex, numDigets):
     an existing song
 
     returns new name which is needed in some cases (ie when a song is temporarily moved)
+
+    with virtual ordering the song keeps its name, only the metadata is changed
     '''
+    songId = metaData['ids'][oldIndex]
+
+    if metaData.virtualOrder:
+        with noInterrupt:
+            printer(f"Relabeling {oldName} from {oldIndex} to {newIndex}")
+            metaData.setSongs([(newIndex,songId,oldName), (oldIndex,'',None)])
+            printer("Relabeling Complete")
+        return oldName
 
     newName = re.sub(cfg.filePrependRE, f"{createNumLabel(newIndex,numDigets)}_" , oldName)
 
-    songId = metaData['ids'][oldIndex]
     with noInterrupt:
         printer(f"Relabeling {oldName} to {newName}")
+        intent = metaData.logIntent('rename', f"{plPath}/{oldName}", f"{plPath}/{newName}", setSongs = [(newIndex,songId,newName), (oldIndex,'',None)])
 
         os.rename(f"{plPath}/{oldName}",f"{plPath}/{newName}")
 
-        numIds = len(metaData["ids"])
-        if newIndex >= numIds:
-
-            for _ in range(newIndex-numIds):
-                metaData["ids"].append('')
-
-            metaData["ids"].append(songId)
-        else:
-            metaData["ids"][newIndex] = songId
-
-        metaData['ids'][oldIndex] = ''
+        metaData.commitIntent(intent)
         printer("Relabeling Complete")
     return newName
 
 def copy(srcMetaData, destMetaData, printer, srcPlPath, destPlPath, srcName, srcIndex, destIndex, numDigets):
-    destName = re.sub(cfg.filePrependRE, f"{createNumLabel(destIndex,numDigets)}_" , srcName)
+    songName = srcName if srcMetaData.virtualOrder else re.sub(cfg.filePrependRE, "", srcName, count=1)
+    if destMetaData.virtualOrder:
+        destName = uniqueSongName(destPlPath, songName)
+    else:
+        destName = f"{createNumLabel(destIndex,numDigets)}_{songName}"
     songId = srcMetaData['ids'][srcIndex]
-    numDestIds = len(destMetaData["ids"])
 
     with noInterrupt:
         printer(f"Copying {srcPlPath}/{srcName} to {destPlPath}/{destName}")
+        intent = destMetaData.logIntent('copy', f"{srcPlPath}/{srcName}", f"{destPlPath}/{destName}", setSongs = [(destIndex,songId,destName)])
 
-        shutil.copy(f"{srcPlPath}/{srcName}",f"{destPlPath}/{destName}")
-
-        if destIndex >= numDestIds:
-            for _ in range(destIndex-numDestIds):
-                destMetaData["ids"].append('')
-
-            destMetaData["ids"].append(songId)
-        else:
-            destMetaData["ids"][destIndex] = songId
+        songStore.linkOrCopy(f"{srcPlPath}/{srcName}",f"{destPlPath}/{destName}")
 
+        destMetaData.commitIntent(intent)
         printer("Copy Complete")
     return destName
 
 
-def delete(metaData, plPath, name, index):
+def delete(metaData, plPath, name, index, blank = False):
+    '''
+    deletes song and removes it from metadata, shifting the ids after it
+    if blank is true its metadata entry is blanked instead, so other songs keep their index
+    '''
     with noInterrupt:
         cfg.logger.debug(f"Deleting {metaData['ids'][index]} {name}")
-        os.remove(f"{plPath}/{name}")
+        if blank:
+            intent = metaData.logIntent('delete', f"{plPath}/{name}", setSongs = [(index,'',None)])
+        else:
+            intent = metaData.logIntent('delete', f"{plPath}/{name}", removeIndex = index)
 
-        del metaData["ids"][index]
+        os.remove(f"{plPath}/{name}")
 
+        metaData.commitIntent(intent)
         cfg.logger.debug("Deleting Complete")
 
 
 
-def download(metaData,plPath, songId, index,numDigets, counter = ''):
+def _commitStored(metaData, plPath, songId, index, numDigets, storedPath):
+    '''links song from the song store into the playlist, recorded as a copy so an interrupted link is undone'''
+    storedName = os.path.basename(storedPath)
+    if metaData.virtualOrder:
+        songName = uniqueSongName(plPath, storedName)
+    else:
+        songName = f"{createNumLabel(index,numDigets)}_{storedName}"
+
+    with noInterrupt:
+        intent = metaData.logIntent('copy', storedPath, f"{plPath}/{songName}", setSongs = [(index,songId,songName)])
+
+        songStore.linkOrCopy(storedPath, f"{plPath}/{songName}")
+
+        metaData.commitIntent(intent)
+        cfg.logger.debug("Download Complete")
+    return songName
+
+def _commitDownload(metaData, plPath, songId, index, numDigets, downloadPath):
+    '''moves song downloaded to downloadPath into the playlist (songs for the song store are stored by DownloadPool._store)'''
+    numberStr = createNumLabel(index,numDigets)
+    tmpName = getTmpSongName(downloadPath)
+    if metaData.virtualOrder:
+        songName = uniqueSongName(plPath, tmpName)
+    else:
+        songName = f"{numberStr}_{tmpName}"
+
+    with noInterrupt: # moving the song from tmp and editing the metadata must occur togeather
+        intent = metaData.logIntent('download', f"{downloadPath}/{tmpName}", f"{plPath}/{songName}", setSongs = [(index,songId,songName)])
+
+        moveFromTmp(plPath, numberStr, downloadPath, songName)
+
+        metaData.commitIntent(intent)
+        cfg.logger.debug("Download Complete")
+    return songName
+
+
+# limits downloads across every DownloadPool, while set by shareDownloadWorkers
+_sharedDownloadSlots = None
+
+@contextmanager
+def shareDownloadWorkers(numWorkers = None):
+    '''
+    while in this context, at most numWorkers (defaults to cfg.downloadWorkers) songs are downloaded at once
+    across all DownloadPools (ie when several playlists are synced at once)
     '''
-    downloads song and adds it to metadata at index
-    returns whether or not the download succeeded
+    global _sharedDownloadSlots
+    if numWorkers is None:
+        numWorkers = cfg.downloadWorkers
+
+    _sharedDownloadSlots = threading.BoundedSemaphore(max(1, numWorkers))
+    try:
+        yield
+    finally:
+        _sharedDownloadSlots = None
 
-    counter is an optional string indicating what number the download is ie) 10 or 23/149
+
+class DownloadPool:
     '''
-    if index == -1:
-        index = len(metaData["ids"])
+    downloads songIds in a pipeline of stages, each with its own worker threads
 
-    num = createNumLabel(index,numDigets)
+    download:   yt-dlp fetches the song and runs its postprocessors, each worker downloading into its own tmp directory
+                (if addTimestamps, timestamps scraped from comments are written as chapters by the postprocessors)
+    timestamps: (if addTimestamps) songs taken from the song store have comment timestamps added as chapters,
+                if they have none
+    commit:     DownloadPool.download moves finished songs into the playlist in the order of songIds, so the playlist
+                and its metadata are still edited one song at a time (keeping crash recovery intact)
 
-    if counter:
-        message = f"Dowloading song {counter}, Id {songId}"
-    else:
-        message = f"Dowloading song Id {songId}"
+    the network is kept busy downloading while ffmpeg adds chapters to songs from the store. each pool works in its
+    own tmp directory, so several can run at once (see shareDownloadWorkers)
 
-    cfg.logger.info(message)
-    if downloadToTmp(songId,num): #returns true if succeeds
+    if stop (a threading.Event) is set, DownloadPool.download raises InterruptTriggered rather than waiting for its
+    next song, used to interrupt pools run outside of the main thread. plPath is the playlist the songs are for, which
+    decides if the song store is used (see songStore.enabled)
+    '''
 
-        with noInterrupt: # moving the song from tmp and editing the metadata must occur togeather
-            songName = moveFromTmp(plPath)
-            if index >= len(metaData["ids"]):
-                metaData["ids"].append(songId)
-            else:
-                metaData["ids"][index] = songId
-            cfg.logger.debug("Download Complete")
-            return songName
-    return ''
+    def __init__(self, songIds, numWorkers = None, addTimestamps = None, stop = None, plPath = None):
+        self.songIds = list(songIds)
+        self.stopEvent = stop
+        self.useStore = songStore.enabled(plPath)
+
+        if numWorkers is None:
+            numWorkers = cfg.downloadWorkers
+        self.numWorkers = max(1, numWorkers)
+
+        if addTimestamps is None:
+            addTimestamps = cfg.autoScrapeCommentTimestamps
+        self.addTimestamps = addTimestamps
+
+        # caps the number of songs in the pipeline ahead of the one being moved into the playlist
+        self.window = 2*self.numWorkers
+
+        self._path = None
+        self._executor = None
+        self._timestampExecutor = None
+        self._futures = []
+        self._cursor = 0
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._numWorkerDirs = 0
+
+    def __enter__(self):
+        self._path = tempfile.mkdtemp(prefix = 'pool', dir = cfg.songDownloadPath)
+        self._executor = ThreadPoolExecutor(max_workers = self.numWorkers)
+        if self.addTimestamps:
+            self._timestampExecutor = ThreadPoolExecutor(max_workers = self.numWorkers)
+        self._submit()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        # downloads already running cannot be stopped, but nothing new will be started
+        self._stop.set()
+        for future in self._futures[self._cursor:]:
+            future.cancel()
+        self._executor.shutdown(wait = type is None)
+
+        # shut down after the download stage, which submits to it
+        if self._timestampExecutor is not None:
+            self._timestampExecutor.shutdown(wait = type is None)
+
+        if type is None:
+            shutil.rmtree(self._path)
+
+    def _submit(self):
+        end = min(len(self.songIds), self._cursor + self.window)
+        while len(self._futures) < end:
+            jobNum = len(self._futures)
+            self._futures.append(self._executor.submit(self._download, jobNum))
+
+    def _workerDir(self):
+        if not hasattr(self._local, 'path'):
+            with self._lock:
+                self._local.path = f"{self._path}/worker{self._numWorkerDirs}"
+                self._numWorkerDirs += 1
+            os.mkdir(self._local.path)
+        return self._local.path
+
+    def _download(self, jobNum):
+        '''
+        download stage, run by worker threads. returns the path of the song, or None if it failed
+        if there is a timestamp stage, the future of the songs timestamp job is returned instead
+        '''
+        if self._stop.is_set():
+            return None
+
+        songId = self.songIds[jobNum]
+        storedPath = songStore.getStored(songId) if self.useStore else None
+
+        if storedPath:
+            cfg.logger.info(f"Song {jobNum+1}/{len(self.songIds)}, Id {songId} Found in Song Store")
+            songPath = storedPath
+        else:
+            cfg.logger.info(f"Dowloading song {jobNum+1}/{len(self.songIds)}, Id {songId}")
+
+            workerDir = self._workerDir()
+            if not self._downloadToTmp(songId, workerDir):
+                return None
+
+            # song is handed off so the worker can start its next download
+            readyDir = f"{self._path}/ready{jobNum}"
+            os.mkdir(readyDir)
+            songName = os.listdir(path=workerDir)[0]
+            songPath = f"{readyDir}/{songName}"
+            shutil.move(f"{workerDir}/{songName}", songPath)
+
+        if self.addTimestamps and storedPath:
+            return self._timestampExecutor.submit(self._timestamps, jobNum, songPath)
+
+        return self._store(songId, songPath)
+
+    def _downloadToTmp(self, songId, workerDir):
+        slots = _sharedDownloadSlots
+        if slots is None:
+            return downloadToTmp(songId, workerDir, self.addTimestamps)
+
+        with slots:
+            if self._stop.is_set():
+                return False
+            return downloadToTmp(songId, workerDir, self.addTimestamps)
+
+    def _timestamps(self, jobNum, songPath):
+        '''timestamp stage, run by worker threads. returns the path of the song, or None if stopped'''
+        if self._stop.is_set():
+            return None
+
+        songId = self.songIds[jobNum]
+        workPath = f"{self._path}/timestamps{jobNum}"
+        os.mkdir(workPath)
+        try:
+            addTimestampsIfNoneExist(os.path.dirname(songPath), os.path.basename(songPath), songId, workPath)
+        except Exception as e:
+            # the song is still added, just without chapters
+            cfg.logger.debug(e)
+            cfg.logger.error(f"Failed to Add Timestamps to Song Id {songId}")
+        shutil.rmtree(workPath)
+
+        return self._store(songId, songPath)
+
+    def _store(self, songId, songPath):
+        '''
+        moves a downloaded song into the song store (if its used), returning its new path
+        moving into the store may be a copy across filesystems, which is done here rather than when committing
+        '''
+        if not self.useStore or songStore.inStore(songPath):
+            return songPath
+
+        readyDir = os.path.dirname(songPath)
+        storedPath = songStore.addToStore(songId, readyDir)
+        os.rmdir(readyDir)
+        return storedPath
+
+    def download(self, metaData, plPath, index, numDigets):
+        '''
+        waits for the next song (in the order of songIds) and moves it into the playlist at index (-1 appends)
+        returns the song name, or '' if the download failed
+        '''
+        if self.stopEvent is not None and self.stopEvent.is_set():
+            raise InterruptTriggered
+
+        songId = self.songIds[self._cursor]
+        future = self._futures[self._cursor]
+
+        self._cursor += 1
+        self._submit()
+
+        songPath = future.result()
+        if isinstance(songPath, Future):
+            songPath = songPath.result()
+
+        if songPath is None:
+            return ''
+
+        if index == -1:
+            index = len(metaData["ids"])
+
+        if songStore.inStore(songPath):
+            return _commitStored(metaData, plPath, songId, index, numDigets, songPath)
+
+        readyDir = os.path.dirname(songPath)
+        songName = _commitDownload(metaData, plPath, songId, index, numDigets, readyDir)
+        os.rmdir(readyDir)
+        return songName
 
 
 def createNumLabel(n,numDigets):
@@ -160,73 +404,185 @@ def _filterFunc(element):
     return False
 
 
-def getLocalSongs(plPath):
+def getLocalSongs(plPath, metaData = None):
     '''
     returns sanatized list of all songs in local playlist, in order
+
+    if metaData is given the file names stored in it are used, unless the directory has changed since they
+    where stored, in which case the directory is listed and the names are stored for next time
     '''
+    if metaData is not None:
+        currentDir = metaData.localSongs()
+        if currentDir is not None:
+            return currentDir
+
+        mtime = os.stat(plPath).st_mtime_ns # taken before listing, so changes made during the listing are caught
+
     currentDir = os.listdir(path=plPath)
     currentDir = sorted(filter(_filterFunc,currentDir), key= getSongNum) #sorted and sanitized dir
+
+    if metaData is not None and all(getSongNum(song) == i for i,song in enumerate(currentDir)):
+        metaData.storeLocalSongs(currentDir, mtime)
+
     return currentDir
 
+def prependWidth(plPath, metaData, plLen):
+    '''
+    width of number prepends for the playlist at plPath once it has plLen songs. every prepend in a playlist has the
+    same width so songs sort alphanumerically, if plLen needs a wider prepend every song is renamed to it in one pass
+
+    the width is kept in metaData.prefixWidth, so it never shrinks and songs are only renamed again once the playlist
+    outgrows it. must be called before song names are listed, as they may change
+    '''
+    stored = metaData.get('prefixWidth')
+    numDigets = getNumDigets(plLen, metaData.prefixWidth)
+    if numDigets == stored or metaData.virtualOrder or 'removePrependOrder' in metaData:
+        return numDigets
+
+    # the width has grown (or isnt known, for playlists from before it was stored)
+    currentDir = getLocalSongs(plPath, metaData)
+    renames = []
+    for i,oldName in enumerate(currentDir):
+        newName = re.sub(cfg.filePrependRE, f"{createNumLabel(getSongNum(oldName),numDigets)}_", oldName, count=1)
+        if newName != oldName:
+            renames.append((i,oldName,newName))
+
+    if renames:
+        cfg.logger.info(f"Widening Number Prepends of {os.path.basename(plPath)} to {numDigets} Digits")
+    for i,oldName,newName in renames:
+        rename(metaData,cfg.logger.debug,plPath,oldName,newName,i,metaData['ids'][i])
+
+    # stored once every song has the width, so an interrupted pass is finished next time
+    metaData['prefixWidth'] = numDigets
+    return numDigets
+
 def smartSyncNewOrder(localIds,remoteIds):
     '''
-    used by smartSync, localIds will not be mutated but remoteIds will
+    used by smartSync, neither localIds nor remoteIds are mutated
     output is newOrder, a list of tuples ( Id of song, where to find it )
     the "where to find it" is the number in the old ordering (None if song is to be downloaded)
+
+    runs in linear time, remaining local songs are kept in a linked list over their local indices
+    and remaining remote songs are counted, so each membership check is constant time
     '''
     newOrder=[]
 
-    localIdPairs = [(localIds[index],index) for index in range(len(localIds))] #contins ( Id of song, local order )
+    localLen = len(localIds)
+
+    # local songs not yet in newOrder, linked by local index (localLen marks the end of the list)
+    nextLocal = list(range(1, localLen+1))
+    prevLocal = list(range(-1, localLen-1))
+    placed = [False]*localLen
+    head = 0
+
+    # local indices of each id, earliest first. indices already placed are skipped when reached
+    localPositions = {}
+    for index,localId in enumerate(localIds):
+        localPositions.setdefault(localId, deque()).append(index)
+
+    remoteQueue = deque(remoteIds)
+    remoteRemaining = Counter(remoteIds) # number of times each id occurs in remoteQueue
+
+    def placeLocal(index):
+        '''adds local song at index to newOrder, returns index of the next remaining local song'''
+        nonlocal head
+        placed[index] = True
+        prev, nxt = prevLocal[index], nextLocal[index]
+
+        if prev == -1:
+            head = nxt
+        else:
+            nextLocal[prev] = nxt
+
+        if nxt != localLen:
+            prevLocal[nxt] = prev
+
+        newOrder.append( (localIds[index],index) )
+        return nxt
+
+    def popRemote():
+        remoteRemaining[remoteQueue.popleft()] -= 1
 
     while True:
-        if len(localIdPairs)==0:
-            newOrder.extend( (remoteId,None) for remoteId in remoteIds )
+        if head == localLen:
+            newOrder.extend( (remoteId,None) for remoteId in remoteQueue )
             break
 
-        elif len(remoteIds)==0:
-            newOrder.extend( localIdPairs )
+        elif len(remoteQueue)==0:
+            while head != localLen:
+                placeLocal(head)
             break
 
-        remoteId=remoteIds[0]
-        localId,localIndex = localIdPairs[0]
+        remoteId = remoteQueue[0]
+        localId = localIds[head]
 
         if localId==remoteId:
             #remote song is already saved locally in correct posistion
-            newOrder.append( localIdPairs.pop(0) )
+            placeLocal(head)
+            popRemote() #must also remove this remote element
 
-            remoteId = remoteIds.pop(0) #must also remove this remote element
-
-        elif localId not in remoteIds:
+        elif remoteRemaining[localId] == 0:
             # current local song has been removed from remote playlist, it must remain in current order
-            newOrder.append( localIdPairs.pop(0) )
+            placeLocal(head)
 
+        else:
+            # at this point the current local song and remote song arent the same, but the current local
+            # song still exists remotly, hence we can insert the remote song into the current posistion
+            positions = localPositions.get(remoteId)
+            while positions and placed[positions[0]]:
+                positions.popleft()
 
-        # at this point the current local song and remote song arent the same, but the current local
-        # song still exists remotly, hence we can insert the remote song into the current posistion
-        elif remoteId in localIds:
-            # remote song exists in local but in wrong place
+            if positions:
+                # remote song exists in local but in wrong place
+                nxt = placeLocal(positions.popleft())
+                popRemote()
 
-            index = localIds[localIndex+1:].index(remoteId)+localIndex+1
-            j = -1
-            for i,_ in enumerate(localIdPairs):
-                if localIdPairs[i][1]==index:
-                    j = i
-                    break
+                #checks if songs after the moved song are not in remote, if so they must be moved with it
+                while nxt != localLen and remoteRemaining[localIds[nxt]] == 0:
+                    nxt = placeLocal(nxt)
 
-            assert j != -1
-            newOrder.append( localIdPairs.pop(j) )
-            remoteId = remoteIds.pop(0) #must also remove this remote element
+            else:
+                newOrder.append( (remoteId,None) )
+                popRemote()
 
-            #checks if songs after the moved song are not in remote, if so they must be moved with it
-            while j<len(localIdPairs) and (localIdPairs[j][0] not in remoteIds):
-                newOrder.append( localIdPairs.pop(j) )
+    return newOrder
 
+def calculateRelabels(moves, tempIndex):
+    '''
+    used by editPlaylist, moves maps old index -> new index for each song which changes posistion
+    (new indices are distinct, and any new index which isnt an old index in moves is unoccupied)
 
+    returns list of (oldIndex, newIndex) relabels, ordered so no song is ever relabeled onto another.
+    each song is relabeled once, apart from one song per cycle of moves, which is parked at tempIndex
+    '''
+    sourceOf = {newIndex: oldIndex for oldIndex,newIndex in moves.items()}
+    relabels = []
+    moved = set()
+
+    def followChain(freeIndex):
+        # fill the free index, which frees the index of the song used to fill it
+        while freeIndex in sourceOf and sourceOf[freeIndex] not in moved:
+            oldIndex = sourceOf[freeIndex]
+            relabels.append( (oldIndex,freeIndex) )
+            moved.add(oldIndex)
+            freeIndex = oldIndex
+
+    # chains start at an unoccupied index
+    for newIndex in sourceOf:
+        if newIndex not in moves:
+            followChain(newIndex)
+
+    # everything remaining is a cycle
+    for oldIndex,newIndex in moves.items():
+        if oldIndex in moved:
+            continue
+        relabels.append( (oldIndex,tempIndex) )
+        moved.add(oldIndex)
+        followChain(oldIndex)
+        relabels.append( (tempIndex,newIndex) )
 
-        else:
-            newOrder.append( (remoteIds.pop(0),None) )
+    return relabels
 
-    return newOrder
 
 def getNthOccuranceIndex(l: list, item, n:int) -> Union[int, None]:
     '''returns the nth occurance of item in l'''
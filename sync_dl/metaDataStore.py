@@ -0,0 +1,533 @@
+'''
+playlist metadata, held in a sqlite database inside the directory {plPath}/{cfg.metaDataName}
+
+MetaData behaves like the shelve it replaces (metaData['url'], metaData['ids'], metaData['removePrependOrder'])
+however each edit to ids/removePrependOrder only writes the rows it touches, and edits made inside
+metaData.transaction() are committed atomically
+'''
+import os
+import json
+import time
+import shelve
+import shutil
+import sqlite3
+import dbm
+from contextlib import contextmanager
+
+from sync_dl import noInterrupt
+import sync_dl.config as cfg
+
+_dbName = 'metaData.sqlite'
+_schemaVersion = 3
+
+# directories modified this recently may be modified again without their mtime changing (ie FAT has a 2s resolution),
+# so marks recording that the directory is unchanged since its mtime arent stored for them
+_racyNs = 2*10**9
+
+def _isRacy(mtime):
+    return mtime >= time.time_ns() - _racyNs
+
+# files which may make up a shelve (depends on which dbm backend created it)
+_shelveSuffixes = ('', '.db', '.dat', '.dir', '.bak', '.pag', '-wal', '-shm')
+
+
+class IdList(list):
+    '''
+    list of song ids which writes each change through to the songs table
+    only the operations used on playlist ids are supported
+    '''
+    def __init__(self, store, ids):
+        super().__init__(ids)
+        self._store = store
+
+    def _index(self, index):
+        if isinstance(index, slice):
+            raise TypeError("slices of metaData['ids'] can only be read")
+        return range(len(self))[index] # normalizes negative indices, raises IndexError
+
+    def __setitem__(self, index, songId):
+        index = self._index(index)
+        self._store._execute("UPDATE songs SET id = ? WHERE pos = ?", (songId, index))
+        super().__setitem__(index, songId)
+
+    def __delitem__(self, index):
+        index = self._index(index)
+        with self._store.transaction():
+            self._store._execute("DELETE FROM songs WHERE pos = ?", (index,))
+            self._store._execute("UPDATE songs SET pos = pos - 1 WHERE pos > ?", (index,))
+        super().__delitem__(index)
+
+    def append(self, songId):
+        self._store._execute("INSERT INTO songs (pos, id) VALUES (?, ?)", (len(self), songId))
+        super().append(songId)
+
+    def extend(self, songIds):
+        with self._store.transaction():
+            for songId in songIds:
+                self.append(songId)
+
+    def __iadd__(self, songIds):
+        self.extend(songIds)
+        return self
+
+    def insert(self, index, songId):
+        index = min(max(index if index >= 0 else len(self) + index, 0), len(self))
+        with self._store.transaction():
+            self._store._execute("UPDATE songs SET pos = pos + 1 WHERE pos >= ?", (index,))
+            self._store._execute("INSERT INTO songs (pos, id) VALUES (?, ?)", (index, songId))
+        super().insert(index, songId)
+
+    def pop(self, index = -1):
+        songId = self[index]
+        del self[index]
+        return songId
+
+    def clear(self):
+        self._store._execute("DELETE FROM songs")
+        super().clear()
+
+    def _unsupported(self, *args, **kwargs):
+        raise TypeError("operation not supported by metaData['ids']")
+
+    remove = sort = reverse = __imul__ = _unsupported
+
+
+class PrependOrder(dict):
+    '''dict of song name -> index, used while prepends are removed. writes each change through to the prependOrder table'''
+    def __init__(self, store, order):
+        super().__init__(order)
+        self._store = store
+
+    def __setitem__(self, name, index):
+        self._store._execute("INSERT OR REPLACE INTO prependOrder (name, pos) VALUES (?, ?)", (name, index))
+        super().__setitem__(name, index)
+
+    def __delitem__(self, name):
+        super().__delitem__(name) # raises KeyError before touching the db
+        self._store._execute("DELETE FROM prependOrder WHERE name = ?", (name,))
+
+    def _unsupported(self, *args, **kwargs):
+        raise TypeError("operation not supported by metaData['removePrependOrder']")
+
+    update = pop = popitem = clear = setdefault = _unsupported
+
+
+class MetaData:
+    '''
+    metadata of the playlist whose metadata directory is at path
+
+    edits made outside of a transaction are committed immediately, if a transaction fails it is rolled
+    back and ids/removePrependOrder are reloaded, so references to them taken before the failure are stale
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.plPath = os.path.dirname(path)
+        self._conn = sqlite3.connect(f"{path}/{_dbName}", isolation_level = None)
+        self._depth = 0
+
+        self._ids = None
+        self._prependOrder = None
+
+        # wal keeps readers from blocking the writer, synchronous=normal is durable at each checkpoint in wal mode
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._createSchema()
+
+        self._virtualOrder = None
+        self._changesAtOpen = self._conn.total_changes
+
+    def _createSchema(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == _schemaVersion:
+            return
+
+        if version > _schemaVersion:
+            raise RuntimeError(f"Playlist Metadata at {self.path} was Created by a Newer Version of sync-dl")
+
+        with self.transaction():
+            if version < 1:
+                self._execute("CREATE TABLE kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+                # pos is shifted a row at a time when songs are removed, hence it cannot have a unique index
+                self._execute("CREATE TABLE songs (pos INTEGER NOT NULL, id TEXT NOT NULL)")
+                self._execute("CREATE INDEX songsPos ON songs (pos)")
+
+                self._execute("CREATE TABLE prependOrder (name TEXT PRIMARY KEY, pos INTEGER NOT NULL)")
+
+            if version < 2:
+                # filesystem operations which have been started but whose metadata edits are not yet committed
+                self._execute("CREATE TABLE journal (id INTEGER PRIMARY KEY AUTOINCREMENT, intent TEXT NOT NULL)")
+
+            if version < 3:
+                # file name of each song, only valid while kv namesMtime matches the playlist directory
+                self._execute("ALTER TABLE songs ADD COLUMN name TEXT")
+
+            self._execute(f"PRAGMA user_version = {_schemaVersion}")
+
+    def _execute(self, sql, params = ()):
+        return self._conn.execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        '''groups edits into one atomic commit, can be nested (only the outermost transaction commits)'''
+        if self._depth == 0:
+            self._execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self._execute("ROLLBACK")
+                self._ids = None
+                self._prependOrder = None
+            raise
+        else:
+            self._depth -= 1
+            if self._depth == 0:
+                self._execute("COMMIT")
+
+    ### mapping interface (matches the shelve previously used) ###
+    def __getitem__(self, key):
+        if key == 'ids':
+            if self._ids is None:
+                rows = self._execute("SELECT id FROM songs ORDER BY pos").fetchall()
+                self._ids = IdList(self, (songId for songId, in rows))
+            return self._ids
+
+        if key == 'removePrependOrder':
+            if key not in self:
+                raise KeyError(key)
+            if self._prependOrder is None:
+                rows = self._execute("SELECT name, pos FROM prependOrder").fetchall()
+                self._prependOrder = PrependOrder(self, rows)
+            return self._prependOrder
+
+        row = self._execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        with self.transaction():
+            if key == 'ids':
+                self._execute("DELETE FROM songs")
+                self._conn.executemany("INSERT INTO songs (pos, id) VALUES (?, ?)", enumerate(value))
+                self._ids = None
+                self._execute("DELETE FROM kv WHERE key = 'namesMtime'") # file names where dropped with the rows
+
+            elif key == 'removePrependOrder':
+                self._execute("DELETE FROM prependOrder")
+                self._conn.executemany("INSERT INTO prependOrder (name, pos) VALUES (?, ?)", value.items())
+                self._execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, 'true'))
+                self._prependOrder = None
+
+            else:
+                self._execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        with self.transaction():
+            if key == 'ids':
+                self._execute("DELETE FROM songs")
+                self._ids = None
+            elif key == 'removePrependOrder':
+                self._execute("DELETE FROM prependOrder")
+                self._prependOrder = None
+
+            self._execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def __contains__(self, key):
+        if key == 'ids':
+            return True
+        return self._execute("SELECT 1 FROM kv WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    ### intent journal ###
+    def logIntent(self, op, src, dst = None, setSongs = (), removeIndex = None):
+        '''
+        records a filesystem operation (op is rename, download, copy or delete, src/dst are paths) before it is
+        performed, along with the metadata edits it requires. setSongs is a list of (index, id, file name) which
+        are set in order, padding with blanks (blanks have the name None), and then removeIndex is deleted
+
+        returns intentId, which is passed to commitIntent once the filesystem operation is complete
+        '''
+        assert self._depth == 0, "intent must be committed before the filesystem is touched"
+
+        mtime = os.stat(self.plPath).st_mtime_ns
+        intent = {
+            'op': op, 'src': src, 'dst': dst,
+            'setSongs': list(setSongs), 'removeIndex': removeIndex,
+            'wasClean': self.get('cleanMtime') == mtime,
+            'namesValid': self.get('namesMtime') == mtime,
+        }
+        return self._execute("INSERT INTO journal (intent) VALUES (?)", (json.dumps(intent),)).lastrowid
+
+    def commitIntent(self, intentId):
+        '''applies the edits recorded with the intent and removes it from the journal, in one transaction'''
+        row = self._execute("SELECT intent FROM journal WHERE id = ?", (intentId,)).fetchone()
+        intent = json.loads(row[0])
+
+        with self.transaction():
+            self.setSongs(intent['setSongs'])
+
+            if intent['removeIndex'] is not None:
+                ids = self['ids']
+                del ids[intent['removeIndex']]
+
+            self._execute("DELETE FROM journal WHERE id = ?", (intentId,))
+
+            # removing an id shifts the ones after it, so song numbers no longer match until gaps are removed
+            if intent['removeIndex'] is not None:
+                self.markDirty()
+            elif intent['wasClean']:
+                self.markClean()
+
+            if intent['namesValid']:
+                self._markNamesValid(os.stat(self.plPath).st_mtime_ns)
+
+    def setSongs(self, setSongs):
+        '''sets (index, id, file name) entries of setSongs in order, padding with blanks'''
+        with self.transaction():
+            ids = self['ids']
+            for index,songId,name in setSongs:
+                if index >= len(ids):
+                    ids.extend( ['']*(index-len(ids)) + [songId] )
+                else:
+                    ids[index] = songId
+                self._execute("UPDATE songs SET name = ? WHERE pos = ?", (name, index))
+
+    def rollbackIntent(self, intentId):
+        self._execute("DELETE FROM journal WHERE id = ?", (intentId,))
+
+    def pendingIntents(self):
+        '''returns list of (intentId, intent) for intents which where never committed, oldest first'''
+        rows = self._execute("SELECT id, intent FROM journal ORDER BY id").fetchall()
+        return [(intentId, json.loads(intent)) for intentId,intent in rows]
+
+    @property
+    def prefixWidth(self):
+        '''
+        width of every number prepend (see helpers.prependWidth), set with a width the playlist wont outgrow to avoid
+        renaming when it grows. new playlists start at cfg.prefixWidth
+        '''
+        return self.get('prefixWidth', 1)
+
+    ### virtual ordering ###
+    @property
+    def virtualOrder(self):
+        '''
+        if true the order of the playlist only exists in metadata (songs have no number prepend), the stored
+        file names are always valid and an ordered .m3u8 index is written to the playlist for music players
+        '''
+        if self._virtualOrder is None:
+            self._virtualOrder = self.get('virtualOrder', False)
+        return self._virtualOrder
+
+    def setVirtualOrder(self, virtualOrder):
+        self['virtualOrder'] = virtualOrder
+        self._virtualOrder = virtualOrder
+
+        if not virtualOrder and os.path.exists(self.indexPath()):
+            self._keepMarks(os.remove, self.indexPath())
+
+    def indexPath(self):
+        return f"{self.plPath}/{os.path.basename(os.path.normpath(self.plPath))}.m3u8"
+
+    def writeIndex(self):
+        '''writes the ordered .m3u8 index of the playlist, if it has changed'''
+        index = '#EXTM3U\n' + ''.join(f"{name}\n" for name in self.localSongs())
+
+        try:
+            with open(self.indexPath(), encoding='utf-8') as f:
+                if f.read() == index:
+                    return
+        except FileNotFoundError:
+            pass
+
+        def write():
+            tmpPath = f"{self.indexPath()}.tmp"
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                f.write(index)
+            os.replace(tmpPath, self.indexPath())
+
+        self._keepMarks(write)
+
+    def _keepMarks(self, func, *args):
+        '''runs func, which edits the playlist directory without changing any songs, keeping it marked clean'''
+        mtime = os.stat(self.plPath).st_mtime_ns
+        wasClean = self.get('cleanMtime') == mtime
+        namesValid = self.get('namesMtime') == mtime
+
+        func(*args)
+
+        mtime = os.stat(self.plPath).st_mtime_ns
+        with self.transaction():
+            if wasClean:
+                self.markClean(mtime)
+            if namesValid:
+                self._markNamesValid(mtime)
+
+    def _mtimeMatches(self):
+        return self.get('cleanMtime') == os.stat(self.plPath).st_mtime_ns
+
+    ### file names ###
+    def localSongs(self):
+        '''
+        returns the file names of the songs in order (as getLocalSongs would), or None if the
+        playlist directory has changed since they where stored
+
+        with virtual ordering the stored names are the only record of the order, so they are always returned
+        '''
+        if not self.virtualOrder:
+            if self.get('namesMtime') != os.stat(self.plPath).st_mtime_ns:
+                return None
+
+            if self._execute("SELECT 1 FROM journal LIMIT 1").fetchone() is not None:
+                return None
+
+        return [name for name, in self._execute("SELECT name FROM songs WHERE name IS NOT NULL ORDER BY pos")]
+
+    def songNames(self):
+        '''file name of each song, in the same order as ids (None for blanks)'''
+        return [name for name, in self._execute("SELECT name FROM songs ORDER BY pos")]
+
+    def storeLocalSongs(self, songs, mtime):
+        '''
+        stores songs (the file names of song 0, 1, 2... listed when the directory had mtime)
+        they are only stored if they line up with ids
+        '''
+        ids = self['ids']
+        if len(songs) != len(ids) or '' in ids:
+            return
+
+        with self.transaction():
+            self._conn.executemany("UPDATE songs SET name = ? WHERE pos = ?", ((name,pos) for pos,name in enumerate(songs)))
+            self._markNamesValid(mtime)
+
+    def _markNamesValid(self, mtime):
+        '''
+        records the stored names are valid while the directory has mtime. if it was modified too recently to trust
+        its mtime to change with the next edit, the names are treated as out of date instead (see localSongs)
+        '''
+        if not _isRacy(mtime):
+            self['namesMtime'] = mtime
+        elif 'namesMtime' in self:
+            del self['namesMtime']
+
+    ### clean state tracking ###
+    def markClean(self, mtime = None):
+        '''
+        records that the playlist directory (which has mtime, if its known) and metadata currently agree
+        if the directory was modified too recently to trust its mtime to change with the next edit, its marked dirty
+        '''
+        if mtime is None:
+            mtime = os.stat(self.plPath).st_mtime_ns
+
+        if _isRacy(mtime):
+            self.markDirty()
+        else:
+            self['cleanMtime'] = mtime
+
+    def markDirty(self):
+        if 'cleanMtime' in self:
+            del self['cleanMtime']
+
+    def isClean(self):
+        '''
+        true if nothing has touched the playlist directory since it was last marked clean (other than
+        committed intents), so there is nothing for correctStateCorruption to fix
+        '''
+        if self._execute("SELECT 1 FROM journal LIMIT 1").fetchone() is not None:
+            return False
+
+        if 'removePrependOrder' in self:
+            return False
+
+        return self._mtimeMatches() and '' not in self['ids']
+
+    def close(self):
+        if self._conn is not None:
+            if self.virtualOrder and self._conn.total_changes != self._changesAtOpen:
+                self.writeIndex()
+
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def _shelveFiles(path):
+    return [f"{path}{suffix}" for suffix in _shelveSuffixes if os.path.isfile(f"{path}{suffix}")]
+
+
+def _migrateShelve(path):
+    '''
+    converts metadata stored by shelve (versions 2.3 and earlier) to the sqlite store
+    the new store is built beside the shelve, which is only removed once the store is complete
+    '''
+    migratingPath = f"{path}.migrating"
+
+    with noInterrupt:
+        if not os.path.exists(f"{migratingPath}/{_dbName}"):
+            cfg.logger.debug(f"Migrating Playlist Metadata at {path}")
+            with shelve.open(path, 'r') as oldMetaData:
+                data = dict(oldMetaData)
+
+            if os.path.exists(migratingPath):
+                shutil.rmtree(migratingPath)
+            os.mkdir(migratingPath)
+
+            # built under another name so its existence means the migration finished
+            os.mkdir(f"{migratingPath}/partial")
+            with MetaData(f"{migratingPath}/partial") as metaData, metaData.transaction():
+                for key,value in data.items():
+                    metaData[key] = value
+            for name in os.listdir(f"{migratingPath}/partial"):
+                os.rename(f"{migratingPath}/partial/{name}", f"{migratingPath}/{name}")
+            os.rmdir(f"{migratingPath}/partial")
+
+        for shelveFile in _shelveFiles(path):
+            os.remove(shelveFile)
+
+        os.rename(migratingPath, path)
+        cfg.logger.debug("Migration Complete")
+
+
+def _isShelve(path):
+    return not os.path.isdir(path) and bool(dbm.whichdb(path))
+
+
+def metaDataExists(plPath):
+    '''tests if plPath has metadata (either the sqlite store or a shelve which has yet to be migrated)'''
+    path = f"{plPath}/{cfg.metaDataName}"
+    return os.path.isfile(f"{path}/{_dbName}") or os.path.exists(f"{path}.migrating/{_dbName}") or _isShelve(path)
+
+
+def openMetaData(plPath, create = True):
+    '''
+    opens the metadata of playlist at plPath, migrating it from shelve if needed
+    raises FileNotFoundError if there is no metadata and create is False
+    '''
+    path = f"{plPath}/{cfg.metaDataName}"
+
+    if _isShelve(path) or os.path.exists(f"{path}.migrating/{_dbName}"):
+        _migrateShelve(path)
+
+    if not os.path.isfile(f"{path}/{_dbName}"):
+        if not create:
+            raise FileNotFoundError(f"No Metadata at {path}")
+        os.makedirs(path, exist_ok = True)
+
+    return MetaData(path)
@@ -1,17 +1,32 @@
 import os
 import re
-import shelve
+import threading
 
 from sync_dl import noInterrupt
-from sync_dl.helpers import createNumLabel, getLocalSongs,download, delete, relabel, getNumDigets, getSongNum
-from sync_dl.timestamps import addTimestampsIfNoneExist
+from sync_dl.helpers import createNumLabel, getLocalSongs, DownloadPool, delete, relabel, getNumDigets, getSongNum, calculateRelabels, prependWidth
+from sync_dl.metaDataStore import openMetaData
 import sync_dl.config as cfg
 
+_playlistLocks = {}
+_playlistLocksLock = threading.Lock()
+
+def playlistLock(plPath):
+    '''lock held while a playlist is edited by one of several threads (ie when syncing many playlists at once)'''
+    key = os.path.realpath(plPath)
+    with _playlistLocksLock:
+        if key not in _playlistLocks:
+            _playlistLocks[key] = threading.Lock()
+        return _playlistLocks[key]
+
 def _checkDeletions(plPath,metaData):
     '''
     checks if metadata has songs that are no longer in directory
     '''
-    currentDir = getLocalSongs(plPath)
+    if metaData.virtualOrder:
+        _checkVirtualDeletions(plPath,metaData)
+        return
+
+    currentDir = getLocalSongs(plPath, metaData)
     idsLen = len(metaData['ids'])
 
     # there have been no deletions, however there may be a gap in numberings
@@ -31,7 +46,7 @@ def _checkDeletions(plPath,metaData):
     if numDeleted > 0:
         cfg.logger.debug(f"songs numbered {deleted} are no longer in playlist")
 
-        numDidgets = len(str( len(metaData["ids"]) - numDeleted ))
+        numDidgets = getNumDigets(len(metaData["ids"]) - numDeleted, metaData.prefixWidth)
         newIndex = 0
 
         for newIndex, oldIndex in enumerate(currentDirNums):
@@ -39,7 +54,7 @@ def _checkDeletions(plPath,metaData):
                 oldName = currentDir[newIndex]
                 newName = re.sub(cfg.filePrependRE, f"{createNumLabel(newIndex,numDidgets)}_" , oldName)
 
-                with noInterrupt:
+                with noInterrupt, metaData.transaction():
                     cfg.logger.debug(f"Renaming {oldName} to {newName}")
                     os.rename(f"{plPath}/{oldName}",f"{plPath}/{newName}")
 
@@ -62,31 +77,58 @@ def _checkDeletions(plPath,metaData):
             # note even if the program crashed at this point, running this fuction
             # again would yeild an uncorrupted state
             removedAlready = (numDeleted - len(deleted))
-            with noInterrupt:
+            with noInterrupt, metaData.transaction():
                 cfg.logger.debug(f"Removing {metaData['ids'][index - removedAlready]} from metadata")
                 del metaData["ids"][index - removedAlready]
                 del deleted[0]
 
+def _checkVirtualDeletions(plPath,metaData):
+    '''
+    with virtual ordering songs are found by their stored name, so the metadata
+    entries of missing songs can be removed directly
+    '''
+    names = metaData.songNames()
+    with metaData.transaction():
+        for i in reversed(range(len(names))):
+            if names[i] is not None and not os.path.exists(f"{plPath}/{names[i]}"):
+                cfg.logger.debug(f"{names[i]} is no longer in playlist, removing {metaData['ids'][i]} from metadata")
+                del metaData["ids"][i]
+
 def _checkBlanks(plPath,metaData):
-    for i in reversed(range(len(metaData["ids"]))):
-        songId = metaData['ids'][i]
-        if songId == '':
-            cfg.logger.debug(f'Blank MetaData id Found at Index {i}, removing')
-            del metaData["ids"][i]
+    with metaData.transaction():
+        for i in reversed(range(len(metaData["ids"]))):
+            songId = metaData['ids'][i]
+            if songId == '':
+                cfg.logger.debug(f'Blank MetaData id Found at Index {i}, removing')
+                del metaData["ids"][i]
+
+                # songs after the blank are numbered one higher than their index until gaps are removed
+                metaData.markDirty()
+
+def _removeGaps(plPath, metaData):
+    if metaData.virtualOrder:
+        # there are no numbers in song names to have gaps
+        return
 
-def _removeGaps(plPath):
-    currentDir = getLocalSongs(plPath)
-    numDidgets = len(str(len(currentDir)))
+    # every song is given the same width first, so only songs whose number changes are renamed below
+    numDidgets = prependWidth(plPath, metaData, len(metaData['ids']))
+    currentDir = getLocalSongs(plPath, metaData)
 
+    renamed = False
     for i,oldName in enumerate(currentDir):
-        newPrepend = f"{createNumLabel(i,numDidgets)}_"
-        oldPrepend = re.search(cfg.filePrependRE, oldName).group(0)
-        if oldPrepend!=newPrepend:
-            newName = re.sub(cfg.filePrependRE, f"{createNumLabel(i,numDidgets)}_" , oldName)
+        if getSongNum(oldName) != i:
+            newName = re.sub(cfg.filePrependRE, f"{createNumLabel(i,numDidgets)}_" , oldName, count=1)
             cfg.logger.debug(f"Renaming {oldName} to {newName}")
             os.rename(f"{plPath}/{oldName}",f"{plPath}/{newName}")
             cfg.logger.debug("Renaming Complete")
 
+            currentDir[i] = newName
+            renamed = True
+
+    if renamed:
+        # names are stored only if they line up with metadata ids
+        metaData.storeLocalSongs(currentDir, os.stat(plPath).st_mtime_ns)
+
 
 
 def _restorePrepend(plPath,metaData):
@@ -99,7 +141,7 @@ def _restorePrepend(plPath,metaData):
 
     currentDir = os.listdir(path=plPath)
     idsLen = len(metaData["ids"])
-    numDigets = getNumDigets(idsLen)
+    numDigets = getNumDigets(idsLen, metaData.prefixWidth)
 
     for file in currentDir:
         try:
@@ -112,7 +154,7 @@ def _restorePrepend(plPath,metaData):
         label = createNumLabel(index,numDigets)
 
         cfg.logger.debug(f"Adding Prepend {label} to {file}")
-        with noInterrupt:
+        with noInterrupt, metaData.transaction():
             os.rename(f"{plPath}/{file}",f"{plPath}/{label}_{file}")
 
             # removed item from dictionary to prevent double restoring
@@ -121,21 +163,66 @@ def _restorePrepend(plPath,metaData):
     # metaData["removePrependOrder"] is removed, this is used to signal that all the prepends are there
     # and the playlist can be treated like normal
 
-    del metaData["removePrependOrder"]
+    with metaData.transaction():
+        metaData['prefixWidth'] = numDigets
+        del metaData["removePrependOrder"]
+
+
+def _replayJournal(plPath,metaData):
+    '''
+    completes or undoes filesystem operations which where interrupted before their metadata was committed
+    renames and downloads are rolled forward if they completed, copies are rolled back and deletes are rolled forward
+    '''
+    for intentId, intent in metaData.pendingIntents():
+        op, src, dst = intent['op'], intent['src'], intent['dst']
+
+        if op == 'delete':
+            rollForward = True
+            if os.path.exists(src):
+                os.remove(src)
+
+        elif op == 'copy':
+            # the source is untouched, so a partial copy can simply be removed
+            rollForward = False
+            if os.path.exists(dst):
+                os.remove(dst)
+
+        else:
+            rollForward = os.path.exists(dst) and not os.path.exists(src)
+
+            # downloads are moved from tmp, which may be a copy if tmp is on another filesystem
+            if op == 'download' and not rollForward and os.path.exists(dst):
+                os.remove(dst)
+
+        with noInterrupt:
+            if rollForward:
+                cfg.logger.debug(f"Completing Interrupted {op}: {src} {dst if dst else ''}")
+                metaData.commitIntent(intentId)
+            else:
+                cfg.logger.debug(f"Undoing Interrupted {op}: {src} {dst if dst else ''}")
+                metaData.rollbackIntent(intentId)
 
 
 def correctStateCorruption(plPath,metaData):
+    if metaData.isClean():
+        # the playlist hasnt been touched since it was last checked (other than by completed operations)
+        return
+
     cfg.logger.debug("Checking for playlist state Corruption")
 
+    _replayJournal(plPath,metaData) # interrupted operations are finished/undone so metadata matches the files
+
     _checkBlanks(plPath,metaData) # must come first so later steps dont assume blanks are valid when checking len
 
     _restorePrepend(plPath,metaData) # can only restore if prepends where removed by remove prepends
 
     _checkDeletions(plPath,metaData)
 
-    _removeGaps(plPath) # must come after check deletions (if user manually deletes, then we only have number
+    _removeGaps(plPath,metaData) # must come after check deletions (if user manually deletes, then we only have number
                      # on song to go off of, hence removing gaps by chaning the numbers would break this)
 
+    metaData.markClean()
+
 
 def removePrepend(plPath, metaData):
     #TODO this step might be unnessisary because its already done in togglePrepend
@@ -143,7 +230,7 @@ def removePrepend(plPath, metaData):
         # prepends already removed or partially removed
         return
 
-    currentDir = getLocalSongs(plPath)
+    currentDir = getLocalSongs(plPath, metaData)
 
     metaData["removePrependOrder"] = {}
 
@@ -151,52 +238,72 @@ def removePrepend(plPath, metaData):
         index = getSongNum(oldName)
         newName = re.sub(cfg.filePrependRE, "" , oldName)
 
-        with noInterrupt:
+        with noInterrupt, metaData.transaction():
             os.rename(f"{plPath}/{oldName}",f"{plPath}/{newName}")
             metaData["removePrependOrder"][newName] = index
 
 
-def editPlaylist(plPath, newOrder, deletions=False):
+def editPlaylist(plPath, newOrder, deletions=False, stop=None):
     '''
     metaData is json as defined in newPlaylist
     newOrder is an ordered list of tuples (Id of song, where to find it )
     the "where to find it" is the number in the old ordering (None if song is to be downloaded)
 
     note if song is in playlist already the id of song in newOrder will not be used
+
+    songs not in newOrder are deleted if deletions is true, otherwise they are kept (ahead of newOrder).
+    only songs whose posistion changes are relabeled, each relabel blanks the songs old posistion
+    so the state remains recoverable in event of crash
+
+    stop is passed to the DownloadPool (see DownloadPool), so the edit can be interrupted from another thread
+
+    returns the number of songs which failed to download
     '''
 
-    currentDir = getLocalSongs(plPath)
-    numDigets = len(str(2*len(newOrder))) #needed for creating starting number for auto ordering ie) 001, 0152
-                                           # len is doubled because we will be first numbering with numbers above the
-                                           # so state remains recoverable in event of crash
+    downloadIds = [newId for newId,oldIndex in newOrder if oldIndex is None]
+
+    with openMetaData(plPath) as metaData, DownloadPool(downloadIds, stop=stop, plPath=plPath) as pool:
+        wasClean = metaData.isClean()
 
-    with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
         idsLen = len(metaData['ids'])
         cfg.logger.info(f"Editing Playlist...")
         cfg.logger.debug(f"Old Order: {metaData['ids']}")
 
-        for i in range(len(newOrder)):
-            newId,oldIndex = newOrder[i]
-            newIndex = idsLen + i # we reorder the playlist with exclusivly new numbers in case a crash occurs
+        inNewOrder = set(oldIndex for _,oldIndex in newOrder if oldIndex is not None)
+        notInNewOrder = [i for i in range(idsLen) if i not in inNewOrder]
 
-            if oldIndex == None:
-                # must download new song
-                songName = download(metaData,plPath,newId,newIndex,numDigets)
-                if songName and cfg.autoScrapeCommentTimestamps:
-                    addTimestampsIfNoneExist(plPath, songName, newId)
+        finalLen = len(newOrder) if deletions else len(notInNewOrder) + len(newOrder)
+        numDigets = prependWidth(plPath, metaData, finalLen)
+        currentDir = getLocalSongs(plPath, metaData)
 
-            else:
-                #song exists locally, but must be reordered/renamed
-                oldName = currentDir[oldIndex]
-                relabel(metaData,cfg.logger.debug,plPath,oldName,oldIndex,newIndex,numDigets)
+        if deletions:
+            # blanked rather than removed, so the remaining songs keep their index
+            for i in notInNewOrder:
+                delete(metaData,plPath,currentDir[i],i,blank=True)
+            finalOrder = list(newOrder)
+        else:
+            finalOrder = [(metaData['ids'][i],i) for i in notInNewOrder] + list(newOrder)
 
+        tempIndex = max(idsLen, finalLen) # never used by a song before or after the edit
 
-        if deletions:
-            oldIndices = [item[1] for item in newOrder]
+        moves = {oldIndex: newIndex for newIndex,(_,oldIndex) in enumerate(finalOrder) if oldIndex is not None and oldIndex != newIndex}
+
+        names = dict(enumerate(currentDir))
+        for oldIndex,newIndex in calculateRelabels(moves, tempIndex):
+            width = len(str(tempIndex)) if newIndex == tempIndex else numDigets
+            names[newIndex] = relabel(metaData,cfg.logger.debug,plPath,names.pop(oldIndex),oldIndex,newIndex,width)
 
-            for i in reversed(range(len(currentDir))):
-                if i not in oldIndices:
-                    delete(metaData,plPath,currentDir[i],i)
+        # every song is now in its final posistion, leaving the posistions of new songs free
+        numFailed = 0
+        for newIndex,(_,oldIndex) in enumerate(finalOrder):
+            if oldIndex is None and not pool.download(metaData,plPath,newIndex,numDigets):
+                numFailed += 1
 
         _checkBlanks(plPath,metaData)
-        _removeGaps(plPath)
+        _removeGaps(plPath,metaData)
+
+        # all edits went through the primitives, and blanks and gaps they left have been removed
+        if wasClean:
+            metaData.markClean()
+
+    return numFailed
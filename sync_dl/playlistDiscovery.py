@@ -0,0 +1,132 @@
+'''
+finds the playlists in a directory tree (used by sync -r), without opening their metadata
+
+a directory is a playlist if it has an entry named after the metadata, playlists and the song store are not
+searched further. when cfg.musicDir is set, what was found in each directory under it is kept in a registry at
+cfg.playlistRegistryPath, a directory is only listed again once its mtime changes (the registry is kept outside
+of cfg.musicDir so writing it doesnt change the mtime of cfg.musicDir)
+'''
+import os
+import json
+import time
+
+import sync_dl.config as cfg
+from sync_dl import songStore
+
+# directories modified this recently may be modified again without their mtime changing, so arent registered
+_racyNs = 2*10**9
+
+
+def _inMusicDir(path):
+    if cfg.musicDir == '':
+        return False
+    musicDir = os.path.abspath(cfg.musicDir)
+    path = os.path.abspath(path)
+    return path == musicDir or path.startswith(musicDir + os.sep)
+
+
+def _readRegistry():
+    try:
+        with open(cfg.playlistRegistryPath) as f:
+            registry = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if registry.get('musicDir') != os.path.abspath(cfg.musicDir) or registry.get('metaDataName') != cfg.metaDataName:
+        return {}
+    return registry.get('dirs', {})
+
+
+def _writeRegistry(dirs):
+    path = cfg.playlistRegistryPath
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump({'musicDir': os.path.abspath(cfg.musicDir), 'metaDataName': cfg.metaDataName, 'dirs': dirs}, f)
+        os.replace(tmpPath, path)
+    except OSError:
+        # the registry is only an optimization
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def _isMetaData(name):
+    # shelve metadata (from versions 2.3 and earlier) is held in files with suffixes
+    return name == cfg.metaDataName or name.startswith(f"{cfg.metaDataName}.")
+
+
+def _scan(dirPath):
+    '''returns whether dirPath is a playlist, and the names of its subdirectories to search if it isnt'''
+    subDirs = []
+    with os.scandir(dirPath) as entries:
+        for entry in entries:
+            if _isMetaData(entry.name):
+                return True, []
+
+            if entry.name == songStore.storeName:
+                continue
+
+            try:
+                if entry.is_dir():
+                    subDirs.append(entry.name)
+            except OSError:
+                continue
+
+    return False, sorted(subDirs)
+
+
+def findPlaylists(path, useRegistry = True):
+    '''
+    returns paths of all playlists in path (or path itself if its a playlist), in sorted order
+    if useRegistry and path is in cfg.musicDir, directories unchanged since they where last searched arent listed again
+    '''
+    useRegistry = useRegistry and _inMusicDir(path)
+    registry = _readRegistry() if useRegistry else {}
+    musicDir = os.path.abspath(cfg.musicDir) if useRegistry else ''
+
+    newRegistry = {}
+    racy = time.time_ns() - _racyNs
+    seen = set() # symlinked directories may form cycles
+
+    plPaths = []
+    stack = [path]
+    while stack:
+        dirPath = stack.pop()
+        try:
+            stat = os.stat(dirPath)
+        except OSError:
+            continue
+
+        if (stat.st_dev, stat.st_ino) in seen:
+            continue
+        seen.add((stat.st_dev, stat.st_ino))
+
+        key = os.path.relpath(os.path.abspath(dirPath), musicDir) if useRegistry else dirPath
+        entry = registry.get(key)
+        if entry is not None and entry[0] == stat.st_mtime_ns:
+            _, isPlaylist, subDirs = entry
+        else:
+            try:
+                isPlaylist, subDirs = _scan(dirPath)
+            except OSError:
+                continue
+
+        if stat.st_mtime_ns < racy:
+            newRegistry[key] = [stat.st_mtime_ns, isPlaylist, subDirs]
+
+        if isPlaylist:
+            plPaths.append(dirPath)
+        else:
+            stack.extend(f"{dirPath}/{name}" for name in reversed(subDirs))
+
+    if useRegistry:
+        # entries outside of path werent searched, so are kept
+        root = os.path.relpath(os.path.abspath(path), musicDir)
+        for key, entry in registry.items():
+            if root != '.' and key != root and not key.startswith(root + os.sep):
+                newRegistry.setdefault(key, entry)
+
+        if newRegistry != registry:
+            _writeRegistry(newRegistry)
+
+    return plPaths
@@ -0,0 +1,151 @@
+'''
+library wide store of downloaded songs, held in {cfg.musicDir}/.songStore
+
+each song is downloaded once per audio format, playlists get hardlinks (or reflinks) to the stored file,
+so a song in several playlists only takes up space once. the store is off by default (sync-dl config -S), and is
+only used if cfg.musicDir is set, for playlists on the same filesystem as it (which songs can be linked into)
+
+songs stay in the store after being deleted from every playlist, until the store is pruned (see prune)
+'''
+import os
+import sys
+import errno
+import shutil
+import tempfile
+
+import sync_dl.config as cfg
+
+storeName = '.songStore'
+
+# ioctl which clones a file on linux filesystems supporting reflinks (btrfs, xfs)
+_FICLONE = 0x40049409
+
+
+def enabled(plPath = None):
+    '''
+    whether the store is used, for songs in plPath if its given. songs would have to be copied into playlists
+    on other filesystems, keeping a second copy of each in the store, so the store isnt used for them
+    '''
+    if not cfg.useSongStore or cfg.musicDir == '':
+        return False
+
+    if plPath is None:
+        return True
+    return _sameFilesystem(plPath, cfg.musicDir)
+
+
+def _sameFilesystem(path1, path2):
+    try:
+        return os.stat(path1).st_dev == os.stat(path2).st_dev
+    except OSError:
+        return False
+
+
+def _formatPath():
+    '''songs downloaded with different formats/thumbnails differ, so each combination is stored separately'''
+    fmt = cfg.audioFormat
+    if cfg.embedThumbnail:
+        fmt += '-thumbnail'
+    return f"{cfg.musicDir}/{storeName}/{fmt}"
+
+
+def inStore(path):
+    return os.path.abspath(path).startswith(os.path.abspath(f"{cfg.musicDir}/{storeName}") + os.sep)
+
+
+def getStored(songId):
+    '''returns path of the stored song with songId, or None if it hasnt been stored'''
+    songDir = f"{_formatPath()}/{songId}"
+    try:
+        songs = os.listdir(path=songDir)
+    except FileNotFoundError:
+        return None
+
+    if len(songs) != 1:
+        return None
+    return f"{songDir}/{songs[0]}"
+
+
+def addToStore(songId, downloadPath):
+    '''
+    moves the song downloaded to downloadPath into the store, returns its path in the store
+    if songId is already stored (ie downloaded concurrently) the stored song is kept
+    '''
+    formatPath = _formatPath()
+    os.makedirs(formatPath, exist_ok=True)
+
+    songName = os.listdir(path=downloadPath)[0]
+
+    # song is moved into a hidden directory first, which is renamed into place once the move is complete
+    partialDir = tempfile.mkdtemp(prefix=f'.{songId}', dir=formatPath)
+    shutil.move(f"{downloadPath}/{songName}", f"{partialDir}/{songName}")
+
+    try:
+        os.rename(partialDir, f"{formatPath}/{songId}")
+    except OSError:
+        shutil.rmtree(partialDir)
+
+    return getStored(songId)
+
+
+def prune():
+    '''
+    removes stored songs which arent linked into any playlist (the store holds their only link), returns how many
+    where removed. songs reflinked or copied into playlists are also removed, the playlists copies dont depend on them
+    '''
+    storePath = f"{cfg.musicDir}/{storeName}"
+    if cfg.musicDir == '' or not os.path.exists(storePath):
+        return 0
+
+    numRemoved = 0
+    for fmtEntry in os.scandir(storePath):
+        if not fmtEntry.is_dir():
+            continue
+
+        for songEntry in os.scandir(fmtEntry.path):
+            # hidden directories are songs being moved into the store
+            if songEntry.name.startswith('.') or not songEntry.is_dir():
+                continue
+
+            songs = os.listdir(path=songEntry.path)
+            if all(os.stat(f"{songEntry.path}/{song}").st_nlink == 1 for song in songs):
+                cfg.logger.debug(f"Removing {songEntry.name} From Song Store")
+                shutil.rmtree(songEntry.path)
+                numRemoved += 1
+
+    return numRemoved
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as srcFile, open(dst, 'wb') as dstFile:
+        try:
+            fcntl.ioctl(dstFile.fileno(), _FICLONE, srcFile.fileno())
+        except OSError:
+            dstFile.close()
+            os.remove(dst)
+            raise
+    shutil.copymode(src, dst)
+
+
+def linkOrCopy(src, dst):
+    '''
+    hardlinks src to dst, falling back to a reflink if the filesystem doesnt support hardlinks,
+    and finally to a copy (ie when src and dst are on different filesystems)
+    '''
+    try:
+        os.link(src, dst)
+        return
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            raise
+        cfg.logger.debug(f"Unable to Hardlink {src}: {e}")
+
+    if sys.platform.startswith('linux'):
+        try:
+            _reflink(src, dst)
+            return
+        except OSError as e:
+            cfg.logger.debug(f"Unable to Reflink {src}: {e}")
+
+    shutil.copy(src, dst)
@@ -1,7 +1,6 @@
 import re
 import unittest
 import os
-import shelve
 import shutil
 import random
 
@@ -10,6 +9,7 @@ import sync_dl.config as cfg
 from sync_dl.commands import compareMetaData, showPlaylist
 from sync_dl.helpers import getLocalSongs
 from sync_dl.ytdlWrappers import getTitle,getIdsAndTitles
+from sync_dl.metaDataStore import openMetaData
 
 from sync_dl.timestamps import getTimestamps, extractChapters, createChapterFile, wipeChapterFile, addTimestampsToChapterFile, applyChapterFileToSong
 from sync_dl.timestamps.scraping import Timestamp, scrapeCommentsForTimestamps
@@ -110,7 +110,7 @@ class test_integration(unittest.TestCase):
 
         newPlaylist(self.plPath,self.PL_URL)
 
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
 
@@ -121,7 +121,7 @@ class test_integration(unittest.TestCase):
     def test_1_smartSyncNoEdit(self):
         cfg.logger.info("Running test_smartSyncNoEdit")
         smartSync(self.plPath)
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
         self.assertTrue(passed)
@@ -133,7 +133,7 @@ class test_integration(unittest.TestCase):
         swap(self.plPath,0 , 1)
 
         smartSync(self.plPath)
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
         self.assertTrue(passed)
@@ -141,14 +141,14 @@ class test_integration(unittest.TestCase):
     def test_3_smartSyncMove(self):
         cfg.logger.info("Running test_smartSyncSwap")
 
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             numIds = len(metaData['ids'])
 
         move(self.plPath,0 , int(numIds/2))
 
         smartSync(self.plPath)
 
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
         self.assertTrue(passed)
@@ -160,7 +160,7 @@ class test_integration(unittest.TestCase):
         shuffle(self.plPath)
 
         smartSync(self.plPath)
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
         self.assertTrue(passed)
@@ -188,7 +188,7 @@ class test_integration(unittest.TestCase):
 
         smartSync(self.plPath)
 
-        with shelve.open(f"{self.plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(self.plPath) as metaData:
             passed = metaDataMatches(metaData,self.plPath)
 
         self.assertTrue(passed)
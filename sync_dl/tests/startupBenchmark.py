@@ -0,0 +1,127 @@
+'''
+measures how long sync-dl takes to start up for each subcommand, run with: python3 test.py -b
+
+each subcommand is run several times in a fresh interpreter (with -X importtime), the median time taken to
+import sync_dl.cli is checked against the budget for the subcommand. commands which dont download or scrape
+must also not import yt-dlp or requests, or look for ffmpeg (see startupMustNotLoad)
+'''
+import os
+import sys
+import json
+import shutil
+import subprocess
+from statistics import median
+
+import sync_dl.config as cfg
+from sync_dl.tests.unitTests import createFakePlaylist
+
+benchmarkPlName = 'startupBenchmark'
+
+numRuns = 5
+
+# budget for importing sync_dl.cli, in milliseconds
+importBudgetMs = {
+    '--help': 100,
+    'config -s': 100,
+    'info -p': 100,
+    'edit': 100,
+    'timestamps': 100,
+}
+
+startupMustNotLoad = ('yt_dlp', 'requests')
+
+_runCli = '''
+import sys, time, json
+start = time.perf_counter()
+
+import sync_dl.config as cfg
+cfg.musicDir = {musicDir!r}
+from sync_dl.cli import cli
+imported = time.perf_counter()
+
+sys.argv = ['sync-dl'] + {argv!r}
+try:
+    cli()
+except SystemExit:
+    pass
+ran = time.perf_counter()
+
+result = {{
+    'importMs': 1000*(imported - start),
+    'runMs': 1000*(ran - imported),
+    'loaded': [module for module in {mustNotLoad!r} if module in sys.modules],
+    'ffmpegTested': sys.modules['sync_dl.config.ffmpeg']._capabilities is not None,
+}}
+print('startupBenchmark:' + json.dumps(result))
+'''
+
+
+def _slowestImports(importTimes, n = 5):
+    '''the n imports which took longest themselves (excluding the modules they import), from -X importtime output'''
+    imports = []
+    for line in importTimes.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        selfUs, _, name = line[len('import time:'):].split('|')
+
+        # modules imported by site are imported during interpreter startup, before sync-dl is
+        if name.strip() == 'site':
+            imports = []
+            continue
+        imports.append((int(selfUs)/1000, name.strip()))
+
+    imports.sort(reverse=True)
+    return imports[:n]
+
+
+def runSubcommand(args):
+    '''runs sync-dl with args in a new interpreter, returns its result and its slowest imports'''
+    code = _runCli.format(musicDir = cfg.testPlPath, argv = args.split(), mustNotLoad = startupMustNotLoad)
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    lines = [line for line in process.stdout.splitlines() if line.startswith('startupBenchmark:')]
+    if len(lines) == 0:
+        raise Exception(f"sync-dl {args} Failed:\n{process.stderr}")
+
+    return json.loads(lines[-1][len('startupBenchmark:'):]), _slowestImports(process.stderr)
+
+
+def benchmark():
+    '''runs the benchmark, returns True if every subcommand is within its budget'''
+    plPath = f"{cfg.testPlPath}/{benchmarkPlName}"
+    if os.path.exists(plPath):
+        shutil.rmtree(plPath)
+    createFakePlaylist(benchmarkPlName, ['A', 'B', 'C'])
+
+    withinBudget = True
+    try:
+        for subcommand, budget in importBudgetMs.items():
+            args = subcommand if subcommand in ('--help', 'config -s') else f"{subcommand} {benchmarkPlName}"
+
+            runs = [runSubcommand(args) for _ in range(numRuns)]
+            results = [result for result,_ in runs]
+            importMs = median(result['importMs'] for result in results)
+            runMs = median(result['runMs'] for result in results)
+
+            problems = []
+            if importMs > budget:
+                problems.append(f"over budget of {budget}ms")
+
+            loaded = set(module for result in results for module in result['loaded'])
+            if loaded:
+                problems.append(f"imported {', '.join(sorted(loaded))}")
+
+            if any(result['ffmpegTested'] for result in results):
+                problems.append("looked for ffmpeg")
+
+            withinBudget = withinBudget and len(problems) == 0
+
+            print(f"sync-dl {subcommand:<12} import: {importMs:7.1f}ms  run: {runMs:7.1f}ms  {'OK' if not problems else 'FAIL ' + ', '.join(problems)}")
+            for ms, name in runs[0][1]:
+                print(f"    {ms:7.1f}ms  {name}")
+    finally:
+        shutil.rmtree(plPath)
+
+    return withinBudget
@@ -4,17 +4,31 @@ import shutil
 import shelve
 import sys
 import inspect
+import time
+import random
+import json
+import io
+import subprocess
+import threading
+import requests
 from string import ascii_uppercase
 from typing import List
+from unittest.mock import patch
 
 import sync_dl.config as cfg
-from sync_dl.helpers import smartSyncNewOrder,createNumLabel,getLocalSongs,getNumDigets, calcuateTransferMoves, TransferMove
+import sync_dl.config.ffmpeg as ffmpegConfig
+from sync_dl.helpers import smartSyncNewOrder,createNumLabel,getLocalSongs,getNumDigets, calcuateTransferMoves, TransferMove, DownloadPool, calculateRelabels
 from sync_dl.plManagement import editPlaylist,correctStateCorruption
 
-from sync_dl.commands import move, swap, manualAdd, moveRange,togglePrepends
+from sync_dl.ytdlWrappers import YtdlSession, MyLogger as YtdlLogger
+from sync_dl.ytdlPostprocessors import RecordSongInfoPP, CommentTimestampsPP
+from sync_dl.metaDataStore import openMetaData
+from sync_dl.playlistDiscovery import findPlaylists
+from sync_dl import daemon, noInterrupt, InterruptTriggered, songStore
+from sync_dl.commands import move, swap, manualAdd, moveRange,togglePrepends, toggleVirtualOrder, setPrefixWidth, addTimestampsFromComments, syncPlaylists, smartSync, newPlaylist, appendNew
 
-from sync_dl.timestamps import getTimestamps, extractChapters, createChapterFile, wipeChapterFile, addTimestampsToChapterFile, applyChapterFileToSong
-from sync_dl.timestamps.scraping import Timestamp
+from sync_dl.timestamps import SongInfo, probeSong, readSongInfo, getTimestamps, extractChapters, createChapterFile, wipeChapterFile, addTimestampsToChapterFile, applyChapterFileToSong
+from sync_dl.timestamps.scraping import Timestamp, scrapeCommentsForTimestamps, _CommentClient, RateLimiter, iterJson, _getTimeStamps
 
 try:
     from sync_dl_ytapi.helpers import longestIncreasingSequence,oldToNewPushOrder,pushOrderMoves
@@ -32,7 +46,7 @@ def createFakePlaylist(name,songs):
 
     numDigets = getNumDigets(len(songs))
 
-    with shelve.open(f"{cfg.testPlPath}/{name}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(f"{cfg.testPlPath}/{name}") as metaData:
         metaData["url"] = "placeholder"
         metaData["ids"] = []
 
@@ -46,7 +60,7 @@ def getPlaylistData(name):
     '''used to validate playlist returns list of tups (id, song name)'''
     result = []
     songs = getLocalSongs(f"{cfg.testPlPath}/{name}")
-    with shelve.open(f"{cfg.testPlPath}/{name}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+    with openMetaData(f"{cfg.testPlPath}/{name}") as metaData:
         for i,songId in enumerate(metaData['ids']):
             result.append( (songId,songs[i]) )
 
@@ -68,7 +82,7 @@ class test_correctStateCorruption(unittest.TestCase):
         os.remove(f'{plPath}/4_E')
         os.remove(f'{plPath}/2_C')
 
-        with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(plPath) as metaData:
             correctStateCorruption(f'{cfg.testPlPath}/{name}',metaData)
 
         correct = [ ('1', '0_B'), ('3','1_D') ]
@@ -89,7 +103,7 @@ class test_correctStateCorruption(unittest.TestCase):
 
         createFakePlaylist(name,songs)
 
-        with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(plPath) as metaData:
             metaData['ids'].insert(2,'')
 
             correctStateCorruption(plPath,metaData)
@@ -116,7 +130,7 @@ class test_correctStateCorruption(unittest.TestCase):
 
         togglePrepends(plPath)
 
-        with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(plPath) as metaData:
             correctStateCorruption(plPath,metaData)
 
         result = getPlaylistData(name)
@@ -139,7 +153,7 @@ class test_correctStateCorruption(unittest.TestCase):
         togglePrepends(plPath)
 
 
-        with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c',writeback=True) as metaData:
+        with openMetaData(plPath) as metaData:
             correctStateCorruption(plPath,metaData)
 
         correct = [ ('1', '0_B'), ('3','1_D') ]
@@ -353,6 +367,21 @@ class test_smartSyncNewOrder(unittest.TestCase):
         result = smartSyncNewOrder(localIds,remoteIds)
         self.assertEqual(result,correct)
 
+    def test_duplicates(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        localIds = ['B' ,'B' ,'C']
+        remoteIds = ['C' ,'C' ,'B']
+
+
+        correct = [('C',2), ('C',None), ('B',0), ('B',1)]
+
+
+        result = smartSyncNewOrder(localIds,remoteIds)
+        self.assertEqual(result,correct)
+        self.assertEqual(remoteIds,['C' ,'C' ,'B'])
+
 
 class test_move(unittest.TestCase):
 
@@ -592,6 +621,1189 @@ class test_moveRange(unittest.TestCase):
         shutil.rmtree(plPath)
         self.assertEqual(result,correct)
 
+def fakeDownloadToTmp(videoId, downloadPath = None, addTimestamps = False):
+    '''stands in for ytdlWrappers.downloadToTmp, songs finish in random order and ids starting with x fail'''
+    cfg.clearTmpSubPath(downloadPath)
+    time.sleep(random.random()/100)
+    if videoId.startswith('x'):
+        return False
+    with open(f"{downloadPath}/{videoId}",'w') as f:
+        if addTimestamps:
+            f.write(f"downloaded with chapters {videoId}")
+    return True
+
+
+class test_downloadPool(unittest.TestCase):
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    def test_downloadOrder(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,[])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        songIds = ['A', 'B', 'xC', 'D', 'E', 'xF', 'G', 'H']
+        correct = [ ('A', '0_A'), ('B', '1_B'), ('D', '2_D'), ('E', '3_E'), ('G', '4_G'), ('H', '5_H') ]
+
+        with openMetaData(plPath) as metaData, DownloadPool(songIds, 4) as pool:
+            for _ in songIds:
+                pool.download(metaData, plPath, -1, 1)
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(result,correct)
+
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    def test_timestampStage(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(f'{name}Store',[])
+        createFakePlaylist(name,[])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        def fakeAddTimestamps(dirPath, songName, songId, workPath):
+            # songs from the store are given chapters before being linked into the playlist
+            self.assertNotEqual(dirPath, plPath)
+            self.assertEqual(os.listdir(workPath), [])
+            time.sleep(random.random()/100)
+            with open(f"{dirPath}/{songName}", 'w') as f:
+                f.write(f"chapters {songId}")
+
+        with patch.object(cfg, 'musicDir', cfg.testPlPath), patch.object(cfg, 'useSongStore', True):
+            # A and C are stored without timestamps
+            with openMetaData(f'{plPath}Store') as metaData, DownloadPool(['A','C'], 2, addTimestamps=False) as pool:
+                for _ in range(2):
+                    pool.download(metaData, f'{plPath}Store', -1, 1)
+
+            # downloaded songs get chapters from the downloader, rather than the timestamp stage
+            songIds = ['A', 'xB', 'C', 'D']
+            with patch('sync_dl.helpers.addTimestampsIfNoneExist', fakeAddTimestamps), \
+                 openMetaData(plPath) as metaData, DownloadPool(songIds, 2, addTimestamps=True) as pool:
+                for _ in songIds:
+                    pool.download(metaData, plPath, -1, 1)
+
+        result = getPlaylistData(name)
+        contents = []
+        for _,songName in result:
+            with open(f"{plPath}/{songName}") as f:
+                contents.append(f.read())
+
+        shutil.rmtree(plPath)
+        shutil.rmtree(f'{plPath}Store')
+        shutil.rmtree(f'{cfg.testPlPath}/.songStore')
+        self.assertEqual(result, [('A','0_A'), ('C','1_C'), ('D','2_D')])
+        self.assertEqual(contents, ['chapters A', 'chapters C', 'downloaded with chapters D'])
+
+    def test_songStore(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(f'{name}1',[])
+        createFakePlaylist(f'{name}2',[])
+        plPath1 = f'{cfg.testPlPath}/{name}1'
+        plPath2 = f'{cfg.testPlPath}/{name}2'
+
+        with patch('sync_dl.helpers.downloadToTmp', wraps=fakeDownloadToTmp) as downloadMock, \
+             patch.object(cfg, 'musicDir', cfg.testPlPath), patch.object(cfg, 'useSongStore', True):
+
+            for plPath,songIds in ((plPath1, ['A','B']), (plPath2, ['B','A','C'])):
+                with openMetaData(plPath) as metaData, DownloadPool(songIds, 2) as pool:
+                    for _ in songIds:
+                        pool.download(metaData, plPath, -1, 1)
+
+        numDownloads = downloadMock.call_count
+        result = getPlaylistData(f'{name}2')
+        linked = os.stat(f'{plPath1}/0_A').st_ino == os.stat(f'{plPath2}/1_A').st_ino
+
+        shutil.rmtree(plPath1)
+        shutil.rmtree(plPath2)
+        shutil.rmtree(f'{cfg.testPlPath}/.songStore')
+        self.assertEqual(numDownloads, 3)
+        self.assertEqual(result, [('B','0_B'), ('A','1_A'), ('C','2_C')])
+        self.assertTrue(linked)
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    def test_songStorePruneAndFilesystems(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(f'{name}1',[])
+        createFakePlaylist(f'{name}2',[])
+        plPath1 = f'{cfg.testPlPath}/{name}1'
+        plPath2 = f'{cfg.testPlPath}/{name}2'
+
+        with patch.object(cfg, 'musicDir', cfg.testPlPath), patch.object(cfg, 'useSongStore', True):
+            for plPath,songIds in ((plPath1, ['A']), (plPath2, ['A','B'])):
+                with openMetaData(plPath) as metaData, DownloadPool(songIds, 2, plPath=plPath) as pool:
+                    for _ in songIds:
+                        pool.download(metaData, plPath, -1, 1)
+
+            # B is only kept by the store once its playlist is gone
+            shutil.rmtree(plPath2)
+            numPruned = songStore.prune()
+            stored = (songStore.getStored('A') is not None, songStore.getStored('B') is not None)
+
+            # songs would be copied into playlists on another filesystem, so they arent stored
+            with patch('sync_dl.songStore._sameFilesystem', return_value=False), \
+                 openMetaData(plPath1) as metaData, DownloadPool(['C'], 2, plPath=plPath1) as pool:
+                pool.download(metaData, plPath1, -1, 1)
+            cStored = songStore.getStored('C') is not None
+
+        result = getPlaylistData(f'{name}1')
+        cLinks = os.stat(f'{plPath1}/1_C').st_nlink
+
+        shutil.rmtree(plPath1)
+        shutil.rmtree(f'{cfg.testPlPath}/.songStore')
+        self.assertEqual(numPruned, 1)
+        self.assertEqual(stored, (True, False))
+        self.assertFalse(cStored)
+        self.assertEqual(result, [('A','0_A'), ('C','1_C')])
+        self.assertEqual(cLinks, 1)
+
+
+class test_syncPlaylists(unittest.TestCase):
+
+    def test_parallelSync(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        remote = {
+            f'{name}1': ['0', 'N', '1', 'xF', 'M'],
+            f'{name}2': ['P', 'Q', '0', 'R', 'S'],
+            f'{name}3': None, # fetching remote fails
+        }
+        for plName in remote:
+            createFakePlaylist(plName, ['A','B'])
+            with openMetaData(f'{cfg.testPlPath}/{plName}') as metaData:
+                metaData['url'] = plName
+        plPaths = [f'{cfg.testPlPath}/{plName}' for plName in remote]
+
+        def fakeGetIDs(url):
+            if remote[url] is None:
+                raise Exception("Failed to Fetch Playlist")
+            return remote[url]
+
+        downloading = [0, 0] # current, most at once
+        countLock = threading.Lock()
+        def fakeDownload(videoId, downloadPath = None, addTimestamps = False):
+            with countLock:
+                downloading[0] += 1
+                downloading[1] = max(downloading)
+            try:
+                return fakeDownloadToTmp(videoId, downloadPath, addTimestamps)
+            finally:
+                with countLock:
+                    downloading[0] -= 1
+
+        with patch('sync_dl.commands.getIDs', fakeGetIDs), patch('sync_dl.commands.getPlaylistFingerprint', return_value=None), \
+             patch('sync_dl.helpers.downloadToTmp', fakeDownload), \
+             patch.object(cfg, 'downloadWorkers', 2), patch.object(cfg, 'playlistWorkers', 3), \
+             self.assertLogs(cfg.logger, 'INFO') as logs:
+            syncPlaylists(plPaths)
+
+        results = [getPlaylistData(plName) for plName in remote]
+        summary = [line for plPath in plPaths for line in logs.output if f'{plPath}: ' in line]
+
+        for plPath in plPaths:
+            shutil.rmtree(plPath)
+        self.assertEqual(results[0], [('0','0_A'), ('N','1_N'), ('1','2_B'), ('M','3_M')])
+        self.assertEqual(results[1], [('P','0_P'), ('Q','1_Q'), ('0','2_A'), ('1','3_B'), ('R','4_R'), ('S','5_S')])
+        self.assertEqual(results[2], [('0','0_A'), ('1','1_B')])
+        self.assertLessEqual(downloading[1], 2)
+        self.assertEqual(len(summary), 3)
+        self.assertIn('2 Added, 1 Failed to Download', summary[0])
+        self.assertIn('4 Added', summary[1])
+        self.assertIn('Failed to Fetch Playlist', summary[2])
+
+    def test_interrupt(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        remote = {f'{name}{prefix}': [f'{prefix}{i}' for i in range(20)] for prefix in ('a','b')}
+        for plName in remote:
+            createFakePlaylist(plName, ['A'])
+            with openMetaData(f'{cfg.testPlPath}/{plName}') as metaData:
+                metaData['url'] = plName
+        plPaths = [f'{cfg.testPlPath}/{plName}' for plName in remote]
+
+        # both playlists are downloading when one of them is interrupted, and still are once the interrupt is seen
+        bothDownloading = threading.Barrier(2, timeout=5)
+        def fakeDownload(videoId, downloadPath = None, addTimestamps = False):
+            index = int(videoId[1:])
+            if index == 2:
+                bothDownloading.wait()
+                if videoId == 'a2':
+                    noInterrupt.simulateSigint()
+            elif index > 2:
+                time.sleep(0.05)
+            return fakeDownloadToTmp(videoId, downloadPath, addTimestamps)
+
+        # a worker in a noInterrupt block doesnt stop other threads being interrupted
+        entered, release = threading.Event(), threading.Event()
+        def worker():
+            with noInterrupt:
+                entered.set()
+                release.wait(5)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        entered.wait(5)
+        mainInterruptible = noInterrupt.interruptible()
+        release.set()
+        thread.join()
+
+        with patch('sync_dl.commands.getIDs', lambda url: remote[url]), patch('sync_dl.commands.getPlaylistFingerprint', return_value=None), \
+             patch('sync_dl.helpers.downloadToTmp', fakeDownload), \
+             patch.object(cfg, 'downloadWorkers', 8), patch.object(cfg, 'playlistWorkers', 2), \
+             self.assertLogs(cfg.logger, 'INFO') as logs, self.assertRaises(InterruptTriggered):
+            syncPlaylists(plPaths)
+        noInterrupt.signalReceived = False
+
+        results = [getPlaylistData(plName) for plName in remote]
+        summary = [line for plPath in plPaths for line in logs.output if f'{plPath}: ' in line]
+
+        for plPath in plPaths:
+            shutil.rmtree(plPath)
+        self.assertTrue(mainInterruptible)
+        for plName, result in zip(remote, results):
+            # stopped between songs, with the songs added so far in order
+            self.assertLess(len(result), 21)
+            self.assertEqual([songId for songId,_ in result], ['0'] + remote[plName][:len(result)-1])
+        self.assertEqual(len(summary), 2)
+        for line in summary:
+            self.assertIn('Interrupted', line)
+
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    def test_unchangedRemoteSkipped(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name, ['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        remoteIds = ['0', 'N', '2', '1']
+        fingerprint = {'count': 4, 'modified': '20260101', 'ids': remoteIds}
+
+        with patch('sync_dl.commands.getPlaylistFingerprint', return_value=fingerprint) as fingerprintMock, \
+             patch('sync_dl.commands.getIDs', return_value=remoteIds) as getIDsMock, \
+             patch('sync_dl.commands.editPlaylist', wraps=editPlaylist) as editMock:
+            smartSync(plPath)
+            smartSync(plPath) # remote and local are unchanged
+            unchangedCalls = (getIDsMock.call_count, editMock.call_count)
+
+            smartSync(plPath, full=True)
+            fullCalls = (getIDsMock.call_count, editMock.call_count)
+            fullFingerprints = fingerprintMock.call_count
+
+            # local changes are synced, without extracting the remote again
+            swap(plPath, 0, 1)
+            smartSync(plPath)
+            localChangedCalls = (getIDsMock.call_count, editMock.call_count)
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(result, [('0','0_A'), ('N','1_N'), ('2','2_C'), ('1','3_B')])
+        self.assertEqual(unchangedCalls, (1, 1))
+        self.assertEqual(fullCalls, (2, 2))
+        self.assertEqual(fullFingerprints, 2) # only fetched by the syncs which may be skipped
+        self.assertEqual(localChangedCalls, (2, 3))
+
+
+class test_findPlaylists(unittest.TestCase):
+
+    def test_registry(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        libPath = f'{cfg.testPlPath}/{name}'
+        os.makedirs(f'{libPath}/artist/album')
+        os.makedirs(f'{libPath}/.songStore/best')
+        open(f'{libPath}/artist/album/song.mp3','a').close()
+        for plName in ('pl1', 'artist/pl2', 'artist/pl2/inner'):
+            createFakePlaylist(f'{name}/{plName}', ['A'])
+
+        # directories must be older than the registry's racy window to be registered
+        old = time.time() - 60
+        for dirPath,_,_ in os.walk(libPath):
+            os.utime(dirPath, (old, old))
+
+        with patch.object(cfg, 'musicDir', libPath), patch.object(cfg, 'playlistRegistryPath', f'{cfg.testPlPath}/{name}.json'):
+            first = findPlaylists(libPath)
+
+            with patch('os.scandir', wraps=os.scandir) as scandirMock:
+                second = findPlaylists(libPath)
+            numScanned = scandirMock.call_count
+
+            createFakePlaylist(f'{name}/artist/album/pl3', ['A'])
+            with patch('os.scandir', wraps=os.scandir) as scandirMock:
+                third = findPlaylists(f'{libPath}/artist')
+            scanned = [call.args[0] for call in scandirMock.call_args_list]
+
+        shutil.rmtree(libPath)
+        os.remove(f'{cfg.testPlPath}/{name}.json')
+        self.assertEqual(first, [f'{libPath}/artist/pl2', f'{libPath}/pl1'])
+        self.assertEqual(second, first)
+        self.assertEqual(numScanned, 0)
+        self.assertEqual(third, [f'{libPath}/artist/album/pl3', f'{libPath}/artist/pl2'])
+        self.assertEqual(scanned, [f'{libPath}/artist/album', f'{libPath}/artist/album/pl3'])
+
+
+class test_daemon(unittest.TestCase):
+
+    def test_forwarding(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name, ['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+        socketPath = f'{cfg.testPlPath}/{name}.sock'
+        schedulePath = f'{cfg.testPlPath}/{name}.json'
+
+        with patch.object(cfg, 'daemonSocketPath', socketPath), patch.object(cfg, 'daemonSchedulePath', schedulePath), \
+             patch.object(cfg, 'musicDir', cfg.testPlPath), patch('sync_dl.commands.getIDs', return_value=['1','0','2']), \
+             patch('sync_dl.commands.getPlaylistFingerprint', return_value=None):
+            syncDaemon = daemon.Daemon()
+            thread = threading.Thread(target=syncDaemon.serve)
+            thread.start()
+            while not os.path.exists(socketPath):
+                time.sleep(0.01)
+            socketMode = os.stat(socketPath).st_mode & 0o777
+
+            rejectedOut = io.StringIO()
+            with patch('sync_dl.daemon._peerUid', return_value=os.getuid()+1):
+                rejectedForwarded = daemon.forward(['edit', '-w', '0', '1', name], io.StringIO(), rejectedOut)
+
+            out = io.StringIO()
+            forwarded = daemon.forward(['edit', '-w', '0', '1', name], io.StringIO(), out)
+
+            # the prompt is answered by the client
+            daemon.forward(['sync', '-s', '-r', name], io.StringIO('n\n'), out)
+
+            daemon.forward(['daemon', '--schedule', name, '15'], io.StringIO(), out)
+            scheduled = daemon.readSchedule()
+            while plPath not in syncDaemon.lastSynced:
+                time.sleep(0.01)
+
+            daemon.forward(['daemon', '--stop'], io.StringIO(), out)
+            thread.join(5)
+            stopped = not thread.is_alive() and not os.path.exists(socketPath)
+            notForwarded = daemon.forward(['edit', '-w', '0', '1', name], io.StringIO(), out)
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        os.remove(schedulePath)
+        self.assertEqual(socketMode, 0o600)
+        self.assertFalse(rejectedForwarded) # so the command is run locally
+        self.assertEqual(rejectedOut.getvalue(), "")
+        self.assertTrue(forwarded)
+        self.assertEqual(result, [('1','0_B'), ('0','1_A'), ('2','2_C')])
+        self.assertIn("Playlists Found", out.getvalue())
+        self.assertIn("Continue with Theses Playlists?", out.getvalue())
+        self.assertNotIn("Smart Syncing", out.getvalue()) # scheduled syncs are only logged by the daemon
+        self.assertEqual(scheduled, {os.path.abspath(plPath): {'minutes': 15, 'appendOnly': False}})
+        self.assertTrue(stopped)
+        self.assertFalse(notForwarded)
+
+
+class test_calculateRelabels(unittest.TestCase):
+
+    def applyRelabels(self, slots, relabels):
+        '''applies relabels to slots (dict index -> song), checking no song is overwritten'''
+        for oldIndex,newIndex in relabels:
+            self.assertIn(oldIndex, slots)
+            self.assertNotIn(newIndex, slots)
+            slots[newIndex] = slots.pop(oldIndex)
+        return slots
+
+    def test_chainsAndCycles(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        # 0 -> 1 -> 2 -> 0 is a cycle, 3 -> 5 -> 6 is a chain, 4 stays put
+        moves = {0: 1, 1: 2, 2: 0, 3: 5, 5: 6}
+        slots = {i: i for i in range(6)}
+
+        relabels = calculateRelabels(moves, 7)
+        result = self.applyRelabels(slots, relabels)
+
+        self.assertEqual(result, {1: 0, 2: 1, 0: 2, 4: 4, 5: 3, 6: 5})
+        self.assertEqual(len(relabels), len(moves) + 1)
+
+    def test_random(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        random.seed(0)
+        for _ in range(200):
+            numSongs = random.randint(0, 30)
+            finalLen = random.randint(numSongs//2, numSongs + 5)
+            kept = random.sample(range(numSongs), min(numSongs, finalLen))
+            newIndices = random.sample(range(finalLen), len(kept))
+
+            moves = {oldIndex: newIndex for oldIndex,newIndex in zip(kept,newIndices) if oldIndex != newIndex}
+            slots = {oldIndex: oldIndex for oldIndex in kept}
+
+            result = self.applyRelabels(slots, calculateRelabels(moves, max(numSongs, finalLen)))
+            self.assertEqual(result, {newIndex: oldIndex for oldIndex,newIndex in zip(kept,newIndices)})
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    def test_editPlaylistRenames(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A' ,'B' ,'C' ,'D', 'E'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        newOrder = [ ('0',0), ('2',2), ('1',1), ('3',3), ('N',None), ('4',4) ]
+        correct = [ ('0','0_A'), ('2','1_C'), ('1','2_B'), ('3','3_D'), ('N','4_N'), ('4','5_E') ]
+
+        with patch('os.rename', wraps=os.rename) as renameMock:
+            editPlaylist(plPath,newOrder)
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(result,correct)
+        numRenames = len([call for call in renameMock.call_args_list if call.args[0].startswith(plPath)])
+        self.assertEqual(numRenames, 4) # B and C swap through a temporary label, E moves once
+
+
+class test_metaDataStore(unittest.TestCase):
+
+    def test_migrateShelve(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        plPath = f'{cfg.testPlPath}/{name}'
+        os.makedirs(plPath)
+        with shelve.open(f"{plPath}/{cfg.metaDataName}", 'c') as oldMetaData:
+            oldMetaData["url"] = "placeholder"
+            oldMetaData["ids"] = ['A', '', 'B']
+            oldMetaData["removePrependOrder"] = {'A': 0, 'B': 2}
+
+        with openMetaData(plPath) as metaData:
+            result = (metaData["url"], list(metaData["ids"]), dict(metaData["removePrependOrder"]))
+
+        leftOver = os.listdir(plPath)
+        shutil.rmtree(plPath)
+        self.assertEqual(result, ("placeholder", ['A', '', 'B'], {'A': 0, 'B': 2}))
+        self.assertEqual(leftOver, [cfg.metaDataName])
+
+    def test_rollback(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        with openMetaData(plPath) as metaData:
+            try:
+                with metaData.transaction():
+                    del metaData["ids"][0]
+                    metaData["ids"].append('D')
+                    raise ValueError
+            except ValueError:
+                pass
+            afterRollback = list(metaData["ids"])
+
+            del metaData["ids"][1]
+            metaData["ids"][0] = 'E'
+
+        with openMetaData(plPath) as metaData:
+            result = list(metaData["ids"])
+
+        shutil.rmtree(plPath)
+        self.assertEqual(afterRollback, ['0', '1', '2'])
+        self.assertEqual(result, ['E', '2'])
+
+
+class test_intentJournal(unittest.TestCase):
+
+    def test_interruptedRelabel(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        # simulates crashing after renames, but before their metadata is committed
+        with openMetaData(plPath) as metaData:
+            metaData.logIntent('rename', f"{plPath}/0_A", f"{plPath}/3_A", setSongs = [(3,'0','3_A'), (0,'',None)])
+            os.rename(f"{plPath}/0_A", f"{plPath}/3_A")
+
+            metaData.logIntent('rename', f"{plPath}/1_B", f"{plPath}/4_B", setSongs = [(4,'1','4_B'), (1,'',None)])
+
+            correctStateCorruption(plPath,metaData)
+            numPending = len(metaData.pendingIntents())
+
+        correct = [('1','0_B'), ('2','1_C'), ('0','2_A')]
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(numPending, 0)
+        self.assertEqual(result,correct)
+
+    def test_interruptedDeleteAndCopy(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        with openMetaData(plPath) as metaData:
+            metaData.logIntent('delete', f"{plPath}/1_B", removeIndex = 1)
+
+            shutil.copy(f"{plPath}/2_C", f"{plPath}/3_C")
+            metaData.logIntent('copy', f"{plPath}/2_C", f"{plPath}/3_C", setSongs = [(3,'2','3_C')])
+
+            correctStateCorruption(plPath,metaData)
+
+        correct = [('0','0_A'), ('2','1_C')]
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(result,correct)
+
+    @patch('sync_dl.metaDataStore._racyNs', 0) # as if mtimes always changed with the directory
+    def test_cleanState(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        with openMetaData(plPath) as metaData:
+            correctStateCorruption(plPath,metaData)
+            cleanAfterCheck = metaData.isClean()
+
+        swap(plPath, 0, 2)
+
+        with openMetaData(plPath) as metaData:
+            cleanAfterSwap = metaData.isClean()
+
+        os.remove(f"{plPath}/1_B")
+
+        with openMetaData(plPath) as metaData:
+            cleanAfterUserDelete = metaData.isClean()
+            correctStateCorruption(plPath,metaData)
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertTrue(cleanAfterCheck)
+        self.assertTrue(cleanAfterSwap)
+        self.assertFalse(cleanAfterUserDelete)
+        self.assertEqual(result, [('2','0_C'), ('0','1_A')])
+
+    def test_racyCleanState(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        # a delete in the same mtime tick as the check (ie on FAT) leaves the mtime the check saw
+        with openMetaData(plPath) as metaData:
+            correctStateCorruption(plPath,metaData)
+            mtime = os.stat(plPath).st_mtime_ns
+            os.remove(f"{plPath}/1_B")
+            os.utime(plPath, ns=(mtime, mtime))
+            cleanAfterRacyDelete = metaData.isClean()
+            correctStateCorruption(plPath,metaData)
+
+            # once the mtime is old enough, the next change is sure to change it
+            settled = time.time_ns() - 10**10
+            os.utime(plPath, ns=(settled, settled))
+            correctStateCorruption(plPath,metaData)
+            cleanWhenSettled = metaData.isClean()
+
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertFalse(cleanAfterRacyDelete)
+        self.assertTrue(cleanWhenSettled)
+        self.assertEqual(result, [('0','0_A'), ('2','1_C')])
+
+
+class test_localSongNames(unittest.TestCase):
+
+    @patch('sync_dl.metaDataStore._racyNs', 0) # as if mtimes always changed with the directory
+    def test_namesTracked(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C','D'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        with openMetaData(plPath) as metaData:
+            correctStateCorruption(plPath,metaData) # lists directory, storing names
+
+        moveRange(plPath, 0, 1, 2)
+
+        with openMetaData(plPath) as metaData, patch('os.listdir', wraps=os.listdir) as listdirMock:
+            stored = getLocalSongs(plPath, metaData)
+            numListings = listdirMock.call_count
+
+        listed = getLocalSongs(plPath)
+
+        os.rename(f"{plPath}/0_C", f"{plPath}/0_E")
+        with openMetaData(plPath) as metaData:
+            afterUserRename = metaData.localSongs()
+            relisted = getLocalSongs(plPath, metaData)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(numListings, 0)
+        self.assertEqual(stored, listed)
+        self.assertEqual(stored, ['0_C', '1_A', '2_B', '3_D'])
+        self.assertIsNone(afterUserRename)
+        self.assertEqual(relisted, ['0_E', '1_A', '2_B', '3_D'])
+
+    def test_racyNames(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        with openMetaData(plPath) as metaData:
+            getLocalSongs(plPath, metaData)
+
+            # a rename in the same mtime tick as the listing (ie on FAT) leaves the mtime the listing saw
+            mtime = os.stat(plPath).st_mtime_ns
+            os.rename(f"{plPath}/1_B", f"{plPath}/1_E")
+            os.utime(plPath, ns=(mtime, mtime))
+            afterRacyRename = metaData.localSongs()
+
+            # once the mtime is old enough, the next change is sure to change it
+            settled = time.time_ns() - 10**10
+            os.utime(plPath, ns=(settled, settled))
+            getLocalSongs(plPath, metaData)
+            whenSettled = metaData.localSongs()
+
+        shutil.rmtree(plPath)
+        self.assertIsNone(afterRacyRename)
+        self.assertEqual(whenSettled, ['0_A', '1_E', '2_C'])
+
+
+class test_virtualOrder(unittest.TestCase):
+
+    def test_toggle(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C','D'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        toggleVirtualOrder(plPath)
+        virtualFiles = sorted(os.listdir(plPath))
+
+        with patch('os.rename', wraps=os.rename) as renameMock:
+            moveRange(plPath, 0, 1, 2)
+            numRenames = len([c for c in renameMock.call_args_list if str(c.args[0]).startswith(plPath)])
+
+        with open(f"{plPath}/{name}.m3u8") as f:
+            index = f.read()
+
+        with openMetaData(plPath) as metaData:
+            ids = list(metaData['ids'])
+
+        toggleVirtualOrder(plPath)
+        result = getPlaylistData(name)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(virtualFiles, ['.metaData', 'A', 'B', 'C', 'D', f'{name}.m3u8'])
+        self.assertEqual(numRenames, 0)
+        self.assertEqual(index, '#EXTM3U\nC\nA\nB\nD\n')
+        self.assertEqual(ids, ['2', '0', '1', '3'])
+        self.assertEqual(result, [('2','0_C'), ('0','1_A'), ('1','2_B'), ('3','3_D')])
+
+
+class test_prefixWidth(unittest.TestCase):
+
+    def test_growthWidensEveryPrepend(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        songs = list(ascii_uppercase[:10])
+        createFakePlaylist(name,songs[:8])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        for i in (8,9):
+            open(f'{cfg.testPlPath}/{songs[i]}','a').close()
+            manualAdd(plPath, f'{cfg.testPlPath}/{songs[i]}', i)
+
+        with openMetaData(plPath) as metaData:
+            metaData.markDirty()
+            correctStateCorruption(plPath,metaData) # full check, which must leave the widths alone
+        grown = getLocalSongs(plPath)
+
+        setPrefixWidth(plPath, 3)
+        widened = getLocalSongs(plPath)
+
+        shutil.rmtree(plPath)
+        self.assertEqual(grown, [f'{i:02}_{song}' for i,song in enumerate(songs)]) # 09_J must sort after 00_A
+        self.assertEqual(widened, [f'{i:03}_{song}' for i,song in enumerate(songs)])
+
+    @patch('sync_dl.helpers.downloadToTmp', fakeDownloadToTmp)
+    @patch('sync_dl.commands.getPlaylistFingerprint', return_value=None)
+    def test_appendKeepsExistingNames(self, _):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        plPath = f'{cfg.testPlPath}/{name}'
+        ids = [f's{i}' for i in range(101)]
+
+        # new playlists start at a width they can grow into, so appending across 9->10 and 99->100 renames nothing
+        renamed = []
+        with patch('sync_dl.commands.getIDs', return_value=ids[:9]):
+            newPlaylist(plPath, 'placeholder')
+        for plLen in (11, 101):
+            before = getLocalSongs(plPath)
+            with patch('sync_dl.commands.getIDs', return_value=ids[:plLen]):
+                appendNew(plPath)
+            renamed.extend(set(before) - set(getLocalSongs(plPath)))
+        grown = getLocalSongs(plPath)
+        shutil.rmtree(plPath)
+
+        # a playlist without room to grow is widened once, before the songs which need the width are added
+        with patch.object(cfg, 'prefixWidth', 1), patch('sync_dl.commands.getIDs', return_value=ids[:8]):
+            newPlaylist(plPath, 'placeholder')
+        with patch('sync_dl.commands.getIDs', return_value=ids[:11]):
+            appendNew(plPath)
+        widened = getLocalSongs(plPath)
+        shutil.rmtree(plPath)
+
+        self.assertEqual(renamed, [])
+        self.assertEqual(grown, [f'{i:03}_s{i}' for i in range(101)])
+        self.assertEqual(widened, [f'{i:02}_s{i}' for i in range(11)])
+
+
+class test_ytdlSession(unittest.TestCase):
+
+    def test_reuse(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        session = YtdlSession()
+
+        with session.extractor() as first:
+            pass
+        with session.extractor() as second:
+            # instance is reused once returned, a concurrent user gets its own
+            with session.extractor() as third:
+                pass
+
+        with session.downloader() as downloader:
+            pass
+
+        session.close()
+
+        self.assertIs(first, second)
+        self.assertIsNot(second, third)
+        self.assertIsNot(first, downloader)
+        self.assertIs(first.cookiejar, third.cookiejar)
+        self.assertIs(first.cookiejar, downloader.cookiejar)
+
+
+class test_timestampCache(unittest.TestCase):
+
+    def test_cache(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        if not os.path.exists(cfg.testPlPath):
+            os.mkdir(cfg.testPlPath)
+        cachePath = f'{cfg.testPlPath}/{name}.sqlite'
+
+        def removeCache():
+            for f in os.listdir(cfg.testPlPath):
+                if f.startswith(f'{name}.sqlite'):
+                    os.remove(f'{cfg.testPlPath}/{f}')
+        removeCache()
+
+        found = {'A': [Timestamp(time=0, label='intro'), Timestamp(time=65, label='verse')], 'B': [], 'C': []}
+        def fakeScrape(comments, videoId):
+            return list(found[videoId])
+
+        with patch.object(cfg, 'timestampCachePath', cachePath), patch.object(cfg, 'timestampCacheSize', 2), \
+             patch('sync_dl.timestamps.scraping._getComments') as getCommentsMock, \
+             patch('sync_dl.timestamps.scraping._getTimeStamps', fakeScrape):
+
+            first = [scrapeCommentsForTimestamps(videoId) for videoId in ('A','B','A','B')]
+            numFetches = getCommentsMock.call_count
+
+            scrapeCommentsForTimestamps('C') # evicts least recently used (A)
+            scrapeCommentsForTimestamps('A')
+            numFetchesEvicted = getCommentsMock.call_count
+
+            with patch.object(cfg, 'timestampCacheDays', 0):
+                scrapeCommentsForTimestamps('A')
+            numFetchesExpired = getCommentsMock.call_count
+
+            getCommentsMock.side_effect = Exception
+            scrapeCommentsForTimestamps('D') # failures arent cached
+            found['D'] = []
+            getCommentsMock.side_effect = None
+            scrapeCommentsForTimestamps('D')
+            numFetchesFailed = getCommentsMock.call_count
+
+        removeCache()
+
+        self.assertEqual(first, [found['A'], [], found['A'], []])
+        self.assertEqual(numFetches, 2)
+        self.assertEqual(numFetchesEvicted, 4)
+        self.assertEqual(numFetchesExpired, 5)
+        self.assertEqual(numFetchesFailed, 7)
+
+
+class test_batchTimestamps(unittest.TestCase):
+
+    def test_promptsOnlyForDecisions(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B','C','D'])
+        plPath = f'{cfg.testPlPath}/{name}'
+
+        found = {'0': [Timestamp(time=0, label='a'), Timestamp(time=5, label='b')], '1': [], '3': [Timestamp(time=0, label='c'), Timestamp(time=9, label='d')]}
+        existing = {'2': [Timestamp(time=0, label='old'), Timestamp(time=3, label='older')]}
+
+        def fakeProbe(songPath, videoId):
+            songId = str(ord(songPath[-1]) - ord('A'))
+            return SongInfo(duration=10, timestamps=list(existing.get(songId, [])))
+
+        scraped = []
+        def fakeScrape(videoId, rateLimiter):
+            scraped.append(videoId)
+            return found[videoId]
+
+        with patch('sync_dl.commands.readSongInfo', fakeProbe), \
+             patch('sync_dl.commands.scrapeCommentsForTimestamps', side_effect=fakeScrape), \
+             patch('sync_dl.commands._applyTimestamps', return_value=True) as applyMock, \
+             patch('builtins.input', return_value='y') as inputMock:
+            addTimestampsFromComments(plPath, 0, -1)
+
+        applied = [call.args[1] for call in applyMock.call_args_list]
+
+        shutil.rmtree(plPath)
+        self.assertEqual(sorted(scraped), ['0', '1', '3']) # song with existing timestamps isnt scraped without overwrite
+        self.assertEqual(inputMock.call_count, 2)
+        self.assertEqual(applied, ['0_A', '3_D'])
+
+    def test_probeSong(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        probeJson = json.dumps({
+            'chapters': [
+                {'time_base': '1/1000', 'start': 0, 'tags': {'title': 'intro'}},
+                {'time_base': '1/1000', 'start': 65000, 'tags': {'title': 'verse'}},
+            ],
+            'format': {'duration': '120.5', 'tags': {'title': 'song'}}
+        })
+
+        with patch('subprocess.run') as runMock, patch('sync_dl.config.ffprobePath', return_value='ffprobe'):
+            runMock.return_value.stdout = probeJson
+            songInfo = probeSong('song.mp3')
+            numProbes = runMock.call_count
+
+        self.assertEqual(numProbes, 1)
+        self.assertEqual(songInfo, SongInfo(duration=120.5, timestamps=[Timestamp(time=0, label='intro'), Timestamp(time=65, label='verse')]))
+
+    def test_rateLimiter(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        limiter = RateLimiter(100)
+        startTime = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        elapsed = time.monotonic() - startTime
+
+        self.assertGreaterEqual(elapsed, 0.05)
+
+
+class test_ytdlPostprocessors(unittest.TestCase):
+
+    def test_scrapeFailureKeepsSong(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,[])
+        plPath = f'{cfg.testPlPath}/{name}'
+        shutil.copy(cfg.testSongPath, f'{plPath}/source.mp3')
+
+        # a local file stands in for the video, so the download runs through yt-dlp without the network
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL({'quiet': True, 'enable_file_urls': True, 'scrapeCommentTimestamps': True,
+                                'outtmpl': f'{plPath}/downloaded.%(ext)s', 'logger': YtdlLogger()})
+        ydl.add_post_processor(CommentTimestampsPP(), when = 'pre_process')
+        url = f'file://{os.path.abspath(plPath)}/source.mp3'
+        info = {'id': 'A', 'title': 'A', 'duration': 100, 'extractor': 'test', 'extractor_key': 'Test', 'webpage_url': url,
+                'formats': [{'url': url, 'ext': 'mp3', 'format_id': '0', 'acodec': 'mp3', 'vcodec': 'none'}]}
+
+        with patch('sync_dl.ytdlPostprocessors.scrapeCommentsForTimestamps', side_effect=KeyError('text')):
+            result = ydl.process_ie_result(info, download=True)
+
+        downloaded = os.path.exists(f'{plPath}/downloaded.mp3')
+
+        shutil.rmtree(plPath)
+        self.assertTrue(downloaded)
+        self.assertIsNone(result.get('chapters'))
+
+
+class test_songInfo(unittest.TestCase):
+
+    def test_recordedInfoSkipsProbe(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        createFakePlaylist(name,['A','B'])
+        plPath = f'{cfg.testPlPath}/{name}'
+        cachePath = f'{cfg.testPlPath}/{name}.sqlite'
+
+        info = {'id': 'A', 'title': 'A', 'duration': 100.0, 'filepath': f'{plPath}/0_A',
+                'chapters': [{'start_time': 0.0, 'end_time': 60.0, 'title': 'intro'}, {'start_time': 60.4, 'end_time': 100.0, 'title': 'verse'}]}
+        probed = SongInfo(duration=50.0, timestamps=[])
+
+        with patch.object(cfg, 'timestampCachePath', cachePath), \
+             patch('sync_dl.timestamps.probeSong', return_value=probed) as probeMock:
+            RecordSongInfoPP(True).run(info)
+
+            recorded = readSongInfo(f'{plPath}/0_A', 'A')
+            numProbesRecorded = probeMock.call_count
+
+            readSongInfo(f'{plPath}/1_B', 'B') # probed once, then recorded
+            reread = readSongInfo(f'{plPath}/1_B', 'B')
+            numProbesUnrecorded = probeMock.call_count
+
+            with open(f'{plPath}/0_A', 'a') as f:
+                f.write('edited')
+            edited = readSongInfo(f'{plPath}/0_A', 'A') # file changed since it was recorded
+            numProbesEdited = probeMock.call_count
+
+        shutil.rmtree(plPath)
+        for f in os.listdir(cfg.testPlPath):
+            if f.startswith(f'{name}.sqlite'):
+                os.remove(f'{cfg.testPlPath}/{f}')
+
+        self.assertEqual(recorded, SongInfo(duration=100.0, timestamps=[Timestamp(time=0, label='intro'), Timestamp(time=60, label='verse')]))
+        self.assertEqual(numProbesRecorded, 0)
+        self.assertEqual(reread, probed)
+        self.assertEqual(numProbesUnrecorded, 1)
+        self.assertEqual(edited, probed)
+        self.assertEqual(numProbesEdited, 2)
+
+
+class test_commentClient(unittest.TestCase):
+
+    def test_keysCached(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        pages = {videoId: f'"INNERTUBE_API_KEY": "{key}", {{"key": "cver", "value": "2.0"}} "token":"token{videoId}"'
+                 for videoId,key in (('A','key1'), ('B','key1'), ('C','key2'))}
+        validKey = ['key1']
+        posted = []
+
+        class FakeResponse:
+            def __init__(self, text, status = 200):
+                self.text, self.status = text, status
+            def raise_for_status(self):
+                if self.status != 200:
+                    raise requests.HTTPError(self.status)
+
+        class FakeSession:
+            def get(self, url):
+                return FakeResponse(pages[url[-1]])
+            def post(self, url, data):
+                key = url.split('key=')[1]
+                posted.append((key, json.loads(data)['continuation']))
+                if key != validKey[0]:
+                    return FakeResponse('', 400)
+                return FakeResponse('{"contentText": {"runs": []}}')
+
+        with patch('requests.Session', FakeSession), patch.object(_CommentClient, '_findKeys', autospec=True, side_effect=_CommentClient._findKeys) as findKeysMock:
+            client = _CommentClient()
+            list(client.getComments('https://www.youtube.com/watch?v=A'))
+            list(client.getComments('https://www.youtube.com/watch?v=B'))
+            numFinds = findKeysMock.call_count
+
+            # key expires, it is found again from the next page
+            validKey[0] = 'key2'
+            comments = list(client.getComments('https://www.youtube.com/watch?v=C'))
+            numFindsExpired = findKeysMock.call_count
+
+        self.assertEqual(numFinds, 1)
+        self.assertEqual(numFindsExpired, 2)
+        self.assertEqual(comments, [[[]]])
+        self.assertEqual(posted, [('key1','tokenA'), ('key1','tokenB'), ('key1','tokenC'), ('key2','tokenC')])
+
+    def test_sessionPerThread(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        class FakeSession:
+            pass
+
+        sessions = []
+        with patch('requests.Session', FakeSession):
+            client = _CommentClient()
+            sessions.extend((client.session, client.session))
+            thread = threading.Thread(target=lambda: sessions.append(client.session))
+            thread.start()
+            thread.join()
+
+        self.assertIs(sessions[0], sessions[1])
+        self.assertIsNot(sessions[0], sessions[2])
+
+    def test_extractTimestamps(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        def link(text, url):
+            return {'text': text, 'navigationEndpoint': {'commandMetadata': {'webCommandMetadata': {'url': url}}, 'watchEndpoint': {'videoId': 'A'}}}
+
+        def comment(runs):
+            return {'commentThreadRenderer': {'comment': {'commentRenderer': {
+                'authorText': {'simpleText': 'author'}, 'contentText': {'runs': runs}}}}}
+
+        def innertubePayload(numComments, depth):
+            '''shaped like an innertube next response, with the only timestamps in the last comment'''
+            items = [comment([{'text': f'comment {i}'}]) for i in range(numComments - 1)]
+            items.append(comment([link('0:00', '/watch?v=A'), {'text': ' intro'}, {'text': '\n'},
+                                  link('1:05', '/watch?v=A&t=65s'), {'text': ' verse'}]))
+
+            payload = {'onResponseReceivedEndpoints': [{'reloadContinuationItemsCommand': {'continuationItems': items}}]}
+            for _ in range(depth):
+                payload = {'contents': [payload]}
+            return payload
+
+        results = []
+        for numComments, depth in ((1, 0), (20000, 0), (10, 5*sys.getrecursionlimit())):
+            comments = list(iterJson(innertubePayload(numComments, depth), 'contentText', 'runs'))
+            results.append((len(comments), _getTimeStamps([comments], 'A')))
+
+        timestamps = [Timestamp(time=0, label='intro'), Timestamp(time=65, label='verse')]
+        self.assertEqual(results, [(1, timestamps), (20000, timestamps), (10, timestamps)])
+
+
+    def test_pagesFetchedLazily(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        page = '"INNERTUBE_API_KEY": "key", {"key": "cver", "value": "2.0"} "token":"token0"'
+        timestampRuns = [{'text': '0:00', 'navigationEndpoint': {'commandMetadata': {'webCommandMetadata': {'url': '/watch?v=A'}}}},
+                         {'text': ' intro'}, {'text': '\n'},
+                         {'text': '1:05', 'navigationEndpoint': {'commandMetadata': {'webCommandMetadata': {'url': '/watch?v=A&t=65s'}}}},
+                         {'text': ' verse'}]
+
+        def commentPage(pageNum):
+            runs = timestampRuns if pageNum == 3 else [{'text': f'comment on page {pageNum}'}]
+            items = [{'commentRenderer': {'contentText': {'runs': runs}}},
+                     {'continuationItemRenderer': {'continuationEndpoint': {'continuationCommand': {'token': f'token{pageNum+1}'}}}}]
+            return json.dumps({'onResponseReceivedEndpoints': [{'appendContinuationItemsAction': {'continuationItems': items}}]})
+
+        posted = []
+
+        class FakeResponse:
+            def __init__(self, text):
+                self.text = text
+            def raise_for_status(self):
+                pass
+
+        class FakeSession:
+            def get(self, url):
+                return FakeResponse(page)
+            def post(self, url, data):
+                pageNum = int(json.loads(data)['continuation'][len('token'):])
+                posted.append(pageNum)
+                return FakeResponse(commentPage(pageNum))
+
+        results = []
+        with patch('requests.Session', FakeSession), patch.object(cfg, 'commentSeconds', 60):
+            client = _CommentClient()
+            for commentPages in (10, 2):
+                with patch.object(cfg, 'commentPages', commentPages):
+                    results.append(_getTimeStamps(client.getComments('https://www.youtube.com/watch?v=A'), 'A'))
+                results.append(list(posted))
+                posted.clear()
+
+        self.assertEqual(results, [[Timestamp(time=0, label='intro'), Timestamp(time=65, label='verse')], [0, 1, 2, 3], # stops at the candidate
+                                   [], [0, 1]]) # stops at the page budget
+
+
+
+class test_startup(unittest.TestCase):
+
+    def test_lazyImports(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        code = ("import sys, json, sync_dl.cli\n"
+                "print(json.dumps([[m for m in ('yt_dlp', 'requests') if m in sys.modules], sys.modules['sync_dl.config.ffmpeg']._capabilities is not None]))")
+        result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True, text=True)
+
+        loaded, ffmpegTested = json.loads(result.stdout)
+        self.assertEqual(loaded, [])
+        self.assertFalse(ffmpegTested)
+
+    def test_ffmpegCapabilitiesCached(self):
+        name = inspect.currentframe().f_code.co_name
+        cfg.logger.info(f"Running {self.__class__.__name__}: {name}")
+
+        binPath = f'{cfg.testPlPath}/{name}'
+        os.makedirs(binPath)
+        for binary in ('ffmpeg', 'ffprobe'):
+            open(f'{binPath}/{binary}', 'a').close()
+
+        outputs = {
+            '-version': 'ffmpeg version 6.0 Copyright (c) 2000-2023',
+            '-encoders': 'Encoders:\n A..... = Audio\n ------\n A....D libmp3lame           libmp3lame MP3\n A....D aac                  AAC\n',
+            '-muxers': 'File formats:\n  E = Muxing supported\n  --\n  E mp3             MP3\n  E ipod            iPod H.264 MP4\n',
+        }
+        runs = []
+        def fakeRun(*cmd):
+            runs.append(cmd)
+            return outputs[cmd[-1]]
+
+        def capabilities():
+            # each call stands in for a new process
+            with patch.object(ffmpegConfig, '_capabilities', None):
+                return ffmpegConfig.getFfmpegCapabilities(), ffmpegConfig.canConvertTo('mp3'), ffmpegConfig.canConvertTo('opus')
+
+        with patch.object(ffmpegConfig, 'ffmpegCapabilitiesPath', f'{binPath}/capabilities.json'), \
+             patch('shutil.which', lambda binary: f'{binPath}/{binary}'), \
+             patch.object(ffmpegConfig, '_run', fakeRun):
+
+            probed, canMp3, canOpus = capabilities()
+            numProbed = len(runs)
+
+            cached = capabilities()[0]
+            numCached = len(runs)
+
+            # ffmpeg is updated
+            os.utime(f'{binPath}/ffmpeg', ns = (0, 0))
+            capabilities()
+            numUpdated = len(runs)
+
+        shutil.rmtree(binPath)
+
+        self.assertEqual(probed['ffmpeg'], {'path': f'{binPath}/ffmpeg', 'version': '6.0'})
+        self.assertEqual(probed['encoders'], ['libmp3lame', 'aac'])
+        self.assertEqual((canMp3, canOpus), (True, False))
+        self.assertEqual(cached, probed)
+        self.assertEqual(numProbed, 4) # ffmpeg version, encoders and muxers, ffprobe version
+        self.assertEqual(numCached, 4)
+        self.assertEqual(numUpdated, 8)
+
+
 #################################
 ## youtube api submodule tests ##
 #################################
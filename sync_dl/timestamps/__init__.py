@@ -1,20 +1,32 @@
 import re
 import os
+import json
 import subprocess
 import shutil
 
 import sync_dl.config as cfg
 from sync_dl.timestamps.scraping import Timestamp
-from typing import List
+from typing import List, NamedTuple, Union
 from sync_dl import noInterrupt
 
 from sync_dl.timestamps.scraping import scrapeCommentsForTimestamps
+from sync_dl.timestamps.cache import getRecordedSongInfo, recordSongInfo
 
 
 chapterRe = re.compile(r"\[CHAPTER\]\nTIMEBASE=(.+)\nSTART=(.+)\nEND=(.+)\ntitle=(.+)\n",flags = re.M)
 
+def _requireBinary(path, name):
+    '''path is where ffmpeg/ffprobe is installed (found from the capabilities cached by config.ffmpeg)'''
+    if path is None:
+        cfg.logger.error(f"{name} is Required to Read or Edit Chapters, Make Sure it is Installed")
+    return path
+
 def _getSongLengthSeconds(songPath:str) -> float:
-    result = subprocess.run(["ffprobe", "-v", "error", "-show_entries",
+    ffprobe = _requireBinary(cfg.ffprobePath(), 'ffprobe')
+    if ffprobe is None:
+        raise FileNotFoundError('ffprobe')
+
+    result = subprocess.run([ffprobe, "-v", "error", "-show_entries",
                              "format=duration", "-of",
                              "default=noprint_wrappers=1:nokey=1", songPath],
         stdout=subprocess.PIPE,
@@ -22,6 +34,94 @@ def _getSongLengthSeconds(songPath:str) -> float:
     return float(result.stdout)
 
 
+class SongInfo(NamedTuple):
+    duration: float
+    timestamps: List[Timestamp]
+
+
+def probeSong(songPath:str) -> Union[SongInfo, None]:
+    '''reads the duration and chapters of song with a single ffprobe, returns None if it fails'''
+    ffprobe = _requireBinary(cfg.ffprobePath(), 'ffprobe')
+    if ffprobe is None:
+        return None
+
+    probeCmd = [ffprobe, '-v', 'error', '-show_chapters', '-show_format', '-of', 'json', songPath]
+
+    try:
+        result = subprocess.run(probeCmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        info = json.loads(result.stdout)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        cfg.logger.debug(e)
+        return None
+
+    timestamps = []
+    for chapter in info.get('chapters', []):
+        title = chapter.get('tags', {}).get('title')
+        if title:
+            timestamps.append(Timestamp.fromFfmpegChapter(chapter['time_base'], chapter['start'], title))
+
+    return SongInfo(duration = float(info['format'].get('duration', 0)), timestamps = timestamps)
+
+
+def readSongInfo(songPath:str, videoId:str = None) -> Union[SongInfo, None]:
+    '''
+    duration and chapters of song, taken from the info recorded when videoId was downloaded (or last read)
+    if the song file is unchanged since, otherwise the song is probed. returns None if it cant be read
+    '''
+    if videoId is None:
+        return probeSong(songPath)
+
+    try:
+        filesize = os.path.getsize(songPath)
+    except OSError as e:
+        cfg.logger.debug(e)
+        return None
+
+    recorded = getRecordedSongInfo(videoId, filesize)
+    if recorded is not None:
+        _, duration, chapters = recorded
+        return SongInfo(duration = duration, timestamps = [Timestamp(time = t, label = label) for t,label in chapters])
+
+    songInfo = probeSong(songPath)
+    if songInfo is not None:
+        recordSongInfo(videoId, filesize, None, songInfo.duration, songInfo.timestamps)
+    return songInfo
+
+
+def _chapters(timestamps:List[Timestamp], duration:float) -> str:
+    '''ffmpeg metadata chapters for timestamps (sorted in place), the last ending at duration'''
+    timestamps.sort(key = lambda ele: ele.time)
+
+    chapters = ''
+    for i,timestamp in enumerate(timestamps):
+        nextTime = timestamps[i+1].time if i+1 < len(timestamps) else duration
+        ch = timestamp.toFfmpegChapter(nextTime)
+        cfg.logger.debug(f"Adding Chapter to FFMPEG Metadata File: \n{ch}")
+        chapters += ch
+    return chapters
+
+
+def applyTimestampsToSong(songPath:str, songName:str, timestamps:List[Timestamp], duration:float,
+                          ffmpegMetadataPath:str = None, songEditPath:str = None, videoId:str = None) -> bool:
+    '''
+    replaces the chapters of song with timestamps (duration is the length of the song, see readSongInfo)
+    the metadata file is written once and the song is remuxed once, its other metadata is kept
+    if videoId is given, the new chapters are recorded so the song doesnt need to be probed again
+    '''
+    if ffmpegMetadataPath is None:
+        ffmpegMetadataPath = cfg.ffmpegMetadataPath
+
+    with open(ffmpegMetadataPath, 'w') as f:
+        f.write(';FFMETADATA1\n' + _chapters(timestamps, duration))
+
+    if not applyChapterFileToSong(songPath, songName, ffmpegMetadataPath, songEditPath, keepMetadata = True):
+        return False
+
+    if videoId is not None:
+        recordSongInfo(videoId, os.path.getsize(songPath), None, duration, timestamps)
+    return True
+
+
 def getTimestamps(ffmpegMetadataPath:str) -> List[Timestamp]:
     with open(ffmpegMetadataPath, "r") as f:
         contents = f.read()
@@ -32,28 +132,32 @@ def getTimestamps(ffmpegMetadataPath:str) -> List[Timestamp]:
         return timestamps
 
 def extractChapters(songPath:str) -> List[Timestamp]:
-    cfg.clearTmpSubPath(cfg.ffmpegMetadataPath)
-    createChapterFileCmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', songPath, '-an', '-vn', '-sn','-f', 'ffmetadata', cfg.ffmpegMetadataPath]
-
-    try:
-        cfg.logger.debug(f"Extracting Chapters from Song Using FFMPEG Metadata File")
-        subprocess.run(createChapterFileCmd, check=True)
-    except subprocess.CalledProcessError as e:
-        cfg.logger.debug(e)
-        cfg.logger.error(f"Failed to Extract Chapters for Song: {songName}")
+    songInfo = probeSong(songPath)
+    if songInfo is None:
+        cfg.logger.error(f"Failed to Extract Chapters for Song: {songPath}")
         return []
 
-    return getTimestamps(cfg.ffmpegMetadataPath)
+    return songInfo.timestamps
+
 
+# the functions below default to the ffmpeg metadata file and song edit directory in cfg, functions
+# run concurrently (ie by DownloadPool) must each be given their own
+
+def createChapterFile(songPath:str, songName:str, ffmpegMetadataPath:str = None) -> bool:
+    if ffmpegMetadataPath is None:
+        ffmpegMetadataPath = cfg.ffmpegMetadataPath
 
-def createChapterFile(songPath:str, songName:str) -> bool:
     if not os.path.exists(songPath):
         cfg.logger.error(f"No Song at Path {songPath}")
         return False
 
-    cfg.clearTmpSubPath(cfg.ffmpegMetadataPath)
+    ffmpeg = _requireBinary(cfg.ffmpegPath(), 'ffmpeg')
+    if ffmpeg is None:
+        return False
+
+    cfg.clearTmpSubPath(ffmpegMetadataPath)
 
-    createChapterFileCmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', songPath,'-f', 'ffmetadata', cfg.ffmpegMetadataPath]
+    createChapterFileCmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', songPath,'-f', 'ffmetadata', ffmpegMetadataPath]
 
     try:
         cfg.logger.debug(f"Creating FFMPEG Metadata File")
@@ -65,11 +169,13 @@ def createChapterFile(songPath:str, songName:str) -> bool:
 
     return True
 
-def wipeChapterFile() -> List[Timestamp]:
+def wipeChapterFile(ffmpegMetadataPath:str = None) -> List[Timestamp]:
     '''detects chapters in file and wipes them. returns list of existing timestamps'''
+    if ffmpegMetadataPath is None:
+        ffmpegMetadataPath = cfg.ffmpegMetadataPath
 
     existingTimestamps = []
-    with open(cfg.ffmpegMetadataPath, "r+") as f:
+    with open(ffmpegMetadataPath, "r+") as f:
         contents = f.read()
 
         for (timebase, start, _, title) in chapterRe.findall(contents):
@@ -85,30 +191,36 @@ def wipeChapterFile() -> List[Timestamp]:
     return existingTimestamps
 
 
-def addTimestampsToChapterFile(timestamps:List[Timestamp], songPath:str):
-
-    timestamps.sort(key = lambda ele: ele.time)
+def addTimestampsToChapterFile(timestamps:List[Timestamp], songPath:str, ffmpegMetadataPath:str = None, duration:float = None):
+    '''duration is the length of the song, it is only probed for if not given'''
+    if ffmpegMetadataPath is None:
+        ffmpegMetadataPath = cfg.ffmpegMetadataPath
 
     if len(timestamps) > 0:
-        with open(cfg.ffmpegMetadataPath, "a") as f:
-            for i in range(0, len(timestamps) - 1):
-                t1 = timestamps[i]
-                t2 = timestamps[i+1]
-                ch = t1.toFfmpegChapter(t2.time)
-                cfg.logger.debug(f"Adding Chapter to FFMPEG Metadata File: \n{ch}")
-                f.write(ch)
+        if duration is None:
+            duration = _getSongLengthSeconds(songPath)
 
-            t1 = timestamps[-1]
-            end = _getSongLengthSeconds(songPath)
-            ch = t1.toFfmpegChapter(end)
-            cfg.logger.debug(f"Adding Chapter to FFMPEG Metadata File: \n{ch}")
-            f.write(ch)
+        with open(ffmpegMetadataPath, "a") as f:
+            f.write(_chapters(timestamps, duration))
 
 
-def applyChapterFileToSong(songPath:str, songName:str) -> bool:
-    cfg.clearTmpSubPath(cfg.songEditPath)
+def applyChapterFileToSong(songPath:str, songName:str, ffmpegMetadataPath:str = None, songEditPath:str = None, keepMetadata = False) -> bool:
+    '''
+    remuxes song with the metadata and chapters in the ffmpeg metadata file
+    if keepMetadata only the chapters are taken from the file, the songs other metadata is kept
+    '''
+    if ffmpegMetadataPath is None:
+        ffmpegMetadataPath = cfg.ffmpegMetadataPath
+    if songEditPath is None:
+        songEditPath = cfg.songEditPath
 
-    applyChapterFile = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', songPath, '-i', cfg.ffmpegMetadataPath, '-map_metadata', '1', '-map_chapters', '1', '-codec', 'copy', f"{cfg.songEditPath}/{songName}"]
+    ffmpeg = _requireBinary(cfg.ffmpegPath(), 'ffmpeg')
+    if ffmpeg is None:
+        return False
+
+    cfg.clearTmpSubPath(songEditPath)
+
+    applyChapterFile = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', songPath, '-i', ffmpegMetadataPath, '-map_metadata', '0' if keepMetadata else '1', '-map_chapters', '1', '-codec', 'copy', f"{songEditPath}/{songName}"]
 
     try:
         subprocess.run(applyChapterFile,check=True)
@@ -116,18 +228,33 @@ def applyChapterFileToSong(songPath:str, songName:str) -> bool:
         cfg.logger.debug(e)
         return False
 
+    # moved next to the song first (which may copy across filesystems), so the song is replaced by a rename
+    # this also keeps the edit from being written into other playlists the song is hardlinked to
+    partialPath = f"{os.path.dirname(songPath)}/.{songName}.part"
     with noInterrupt:
-        shutil.move(f"{cfg.songEditPath}/{songName}", songPath)
+        shutil.move(f"{songEditPath}/{songName}", partialPath)
+        os.replace(partialPath, songPath)
     return True
 
 
-def addTimestampsIfNoneExist(plPath, songName, videoId):
+def addTimestampsIfNoneExist(plPath, songName, videoId, workPath = None):
+    '''
+    scrapes comments of videoId for timestamps and adds them as chapters to song, if it has none
+    workPath is a tmp directory to hold intermediate files (defaults to the paths in cfg)
+    '''
+    if workPath is None:
+        ffmpegMetadataPath, songEditPath = cfg.ffmpegMetadataPath, cfg.songEditPath
+    else:
+        ffmpegMetadataPath, songEditPath = f"{workPath}/FFMETADATAFILE", f"{workPath}/songEdit"
+        os.makedirs(songEditPath, exist_ok = True)
+
     songPath = f"{plPath}/{songName}"
-    if not createChapterFile(songPath, songName):
+    songInfo = readSongInfo(songPath, videoId)
+    if songInfo is None:
+        cfg.logger.error(f"Failed to Read Chapters of Song: {songName}")
         return
 
-    existingTimestamps = wipeChapterFile()
-    if len(existingTimestamps) > 0:
+    if len(songInfo.timestamps) > 0:
         cfg.logger.info(f"Timestamps Found\n")
         return
 
@@ -145,9 +272,7 @@ def addTimestampsIfNoneExist(plPath, songName, videoId):
         cfg.logger.debug(timestamp)
 
     cfg.logger.info(f"Adding Comment Timestamps\n")
-    addTimestampsToChapterFile(timestamps, songPath)
-
-    if not applyChapterFileToSong(songPath, songName):
+    if not applyTimestampsToSong(songPath, songName, timestamps, songInfo.duration, ffmpegMetadataPath, songEditPath, videoId):
         cfg.logger.error(f"Failed to Add Timestamps To Song {songName}\n")
 
 
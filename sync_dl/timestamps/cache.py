@@ -0,0 +1,100 @@
+'''
+on disk cache of timestamps scraped from comments, keyed by video id (held in sqlite at cfg.timestampCachePath)
+
+videos where no timestamps where found are cached too. entries expire after cfg.timestampCacheDays, and once there
+are more than cfg.timestampCacheSize the least recently used are evicted
+
+the same database records the info yt-dlp gave for each downloaded song (title, duration and chapters), keyed by
+video id and the size of the song file, so the info is only used while the file is unchanged
+'''
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Tuple, Union
+
+import sync_dl.config as cfg
+
+# sqlite connections cannot be shared between threads (timestamps are scraped by DownloadPool workers)
+_local = threading.local()
+
+
+def _connect():
+    path = cfg.timestampCachePath
+    if getattr(_local, 'path', None) != path:
+        conn = sqlite3.connect(path, timeout = 10, isolation_level = None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS timestamps (videoId TEXT PRIMARY KEY, timestamps TEXT NOT NULL, fetched REAL NOT NULL, used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS timestampsUsed ON timestamps (used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS songInfo (videoId TEXT NOT NULL, filesize INTEGER NOT NULL, title TEXT, duration REAL NOT NULL, chapters TEXT NOT NULL, used REAL NOT NULL, PRIMARY KEY (videoId, filesize))")
+        conn.execute("CREATE INDEX IF NOT EXISTS songInfoUsed ON songInfo (used)")
+        _local.conn, _local.path = conn, path
+    return _local.conn
+
+
+def getCachedTimestamps(videoId) -> Union[List[Tuple[int, str]], None]:
+    '''returns the cached (time, label) timestamps of videoId (empty if none where found), or None if it isnt cached'''
+    conn = _connect()
+    now = time.time()
+
+    row = conn.execute("SELECT timestamps FROM timestamps WHERE videoId = ? AND fetched > ?",
+                       (videoId, now - cfg.timestampCacheDays*86400)).fetchone()
+    if row is None:
+        return None
+
+    conn.execute("UPDATE timestamps SET used = ? WHERE videoId = ?", (now, videoId))
+    return [(t, label) for t,label in json.loads(row[0])]
+
+
+def cacheTimestamps(videoId, timestamps: List[Tuple[int, str]]):
+    conn = _connect()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR REPLACE INTO timestamps (videoId, timestamps, fetched, used) VALUES (?, ?, ?, ?)",
+                     (videoId, json.dumps([(t, label) for t,label in timestamps]), now, now))
+
+        conn.execute("DELETE FROM timestamps WHERE fetched <= ?", (now - cfg.timestampCacheDays*86400,))
+        conn.execute("DELETE FROM timestamps WHERE videoId IN (SELECT videoId FROM timestamps ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                     (cfg.timestampCacheSize,))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def clearTimestampCache():
+    _connect().execute("DELETE FROM timestamps")
+
+
+def getRecordedSongInfo(videoId, filesize) -> Union[Tuple[str, float, List[Tuple[int, str]]], None]:
+    '''returns the recorded (title, duration, chapters) of the song file with videoId and filesize, or None if it wasnt recorded'''
+    conn = _connect()
+
+    row = conn.execute("SELECT title, duration, chapters FROM songInfo WHERE videoId = ? AND filesize = ?",
+                       (videoId, filesize)).fetchone()
+    if row is None:
+        return None
+
+    conn.execute("UPDATE songInfo SET used = ? WHERE videoId = ? AND filesize = ?", (time.time(), videoId, filesize))
+    title, duration, chapters = row
+    return title, duration, [(t, label) for t,label in json.loads(chapters)]
+
+
+def recordSongInfo(videoId, filesize, title, duration, chapters: List[Tuple[int, str]]):
+    '''if title is None, the title already recorded for videoId is kept (ie when chapters are added to a song)'''
+    conn = _connect()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR REPLACE INTO songInfo (videoId, filesize, title, duration, chapters, used) VALUES "
+                     "(?, ?, COALESCE(?, (SELECT title FROM songInfo WHERE videoId = ? AND title IS NOT NULL)), ?, ?, ?)",
+                     (videoId, filesize, title, videoId, duration, json.dumps([(t, label) for t,label in chapters]), time.time()))
+
+        conn.execute("DELETE FROM songInfo WHERE rowid IN (SELECT rowid FROM songInfo ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                     (cfg.timestampCacheSize,))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
@@ -1,9 +1,12 @@
-import requests
 import re
 import json
+import threading
+import time
+from itertools import repeat, chain
 from typing import NamedTuple, List, Union
 
 import sync_dl.config as cfg
+from sync_dl.timestamps.cache import getCachedTimestamps, cacheTimestamps
 
 
 def jsonRegex(*args, surroundingBrace = False):
@@ -57,41 +60,49 @@ class Timestamp(NamedTuple):
 
 
 
-def scrapeJson(j, desiredKey: str, results:List):
-    if isinstance(j,List):
-        for value in j:
-            if isinstance(value,List) or isinstance(value,dict):
-                scrapeJson(value, desiredKey, results)
-        return
-
-    if isinstance(j, dict):
-        for key,value in j.items():
-            if key == desiredKey:
-                results.append(value)
-            elif isinstance(value, dict) or isinstance(value, List):
-                scrapeJson(value, desiredKey, results)
-        return
+_missing = object()
 
-def scrapeFirstJson(j, desiredKey: str):
-    if isinstance(j,List):
-        for value in j:
-            if isinstance(value,List) or isinstance(value,dict):
-                res = scrapeFirstJson(value, desiredKey)
-                if res is not None:
-                    return res
-        return None
+def _follow(j, keys):
+    '''value at the path of keys in j, or _missing'''
+    for key in keys:
+        if not isinstance(j, dict) or key not in j:
+            return _missing
+        j = j[key]
+    return j
 
-    if isinstance(j, dict):
-        for key,value in j.items():
-            if key == desiredKey:
-                return value
-            elif isinstance(value, dict) or isinstance(value, List):
-                res = scrapeFirstJson(value, desiredKey)
-                if res is not None:
-                    return res
-        return None
+def iterJson(j, *path):
+    '''
+    yields values in j (parsed json) at the end of path, a sequence of keys the first of which may be at any depth.
+    values are yielded in document order and arent searched within. j is walked with a stack rather than
+    recursively (innertube responses are large and deeply nested), and the walk stops when the caller does
+    '''
+    first, rest = path[0], path[1:]
 
-    return None
+    stack = [iter(((None, j),))]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+
+        key, value = item
+        if key == first:
+            found = _follow(value, rest)
+            if found is not _missing:
+                yield found
+                continue
+
+        if isinstance(value, dict):
+            stack.append(iter(value.items()))
+        elif isinstance(value, list):
+            stack.append(zip(repeat(None), value))
+
+
+def scrapeJson(j, desiredKey: str, results:List):
+    results.extend(iterJson(j, desiredKey))
+
+def scrapeFirstJson(j, desiredKey: str):
+    return next((value for value in iterJson(j, desiredKey) if value is not None), None)
 
 def _sanitizeLabel(label):
     match = labelSanitizeRe.match(label)
@@ -101,48 +112,123 @@ def _sanitizeLabel(label):
 
 
 
-def _getComments(url):
-    r=requests.get(url)
+class RateLimiter:
+    '''spaces out calls to wait (from any thread) so they return at most ratePerSecond times a second'''
+    def __init__(self, ratePerSecond):
+        self.interval = 1/ratePerSecond if ratePerSecond > 0 else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            waitTime = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if waitTime > 0:
+            time.sleep(waitTime)
+
+
+class _CommentClient:
+    '''
+    fetches comments using keep alive sessions, one per thread (requests sessions arent thread safe). the innertube api
+    key and client version are the same for every video, so they are only searched for in the first watch page, and
+    again if a request using them fails. they are shared by every thread, and only read or written under the lock
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.key = None
+        self.clientVersion = None
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _keys(self):
+        '''returns the api key and client version, which may be changed by another thread'''
+        with self._lock:
+            return self.key, self.clientVersion
+
+    def _findKeys(self, page):
+        x, z = apiKeyRe.search(page), clientVersionRe.search(page)
+
+        if not x:
+            raise Exception("Unable to Find INNERTUBE_API_KEY")
+
+        if not z:
+            raise Exception("Unable to Find Youtube Client Version")
+
+        with self._lock:
+            self.key, self.clientVersion = x.group(1), z.group(1)
+
+    def _next(self, continuationToken):
+        key, clientVersion = self._keys()
+        requestData = {
+            "context": {
+                "adSignalsInfo": {},
+                "clickTracking": {},
+                "client": {"clientName": "WEB", "clientVersion": clientVersion},
+                "request": {},
+                "user": {}
+            },
+            "continuation": continuationToken
+        }
 
+        b = self.session.post('https://www.youtube.com/youtubei/v1/next?key='+key, data=json.dumps(requestData))
+        b.raise_for_status()
+        return json.loads(b.text)
 
-    x,y,z = apiKeyRe.search(r.text), continuationTokenRe.search(r.text), clientVersionRe.search(r.text)
+    def getComments(self, url, rateLimiter = None):
+        '''
+        yields the comments on each page of comments of url (as the runs making up each comment), pages after the
+        first are only fetched as they are needed. rateLimiter is waited on before each page after the first
+        '''
+        import requests # only imported when comments are scraped, as it slows startup
 
-    if not x:
-        raise Exception("Unable to Find INNERTUBE_API_KEY")
+        page = self.session.get(url).text
 
-    if not y:
-        raise Exception("Unable to Find Continuation Token")
+        y = continuationTokenRe.search(page)
+        if not y:
+            raise Exception("Unable to Find Continuation Token")
+        continuationToken = y.group(1)
 
-    if not z:
-        raise Exception("Unable to Find Youtube Client Version")
+        if self._keys()[0] is None:
+            self._findKeys(page)
 
-    key = x.group(1)
-    continuationToken = y.group(1)
-    clientVersion = z.group(1)
+        try:
+            commentJson:dict = self._next(continuationToken)
+        except (requests.RequestException, ValueError) as e:
+            # key or client version may have changed, they are found again from this page
+            cfg.logger.debug(e)
+            self._findKeys(page)
+            commentJson:dict = self._next(continuationToken)
 
-    requestData = '''{
-        "context": {
-            "adSignalsInfo": {
-            },
-            "clickTracking": {
-            },
-            "client": {
-                "clientName": "WEB",
-                "clientVersion": "'''+clientVersion+'''",
-            },
-            "request": {
-            },
-            "user": {
-            }
-        },
-        "continuation": "'''+continuationToken+'''"
-    }'''
+        while True:
+            # the runs (pieces of text and links) making up each comment
+            yield list(iterJson(commentJson, "contentText", "runs"))
+
+            continuationToken = next(iterJson(commentJson, "continuationItemRenderer", "continuationEndpoint", "continuationCommand", "token"), None)
+            if continuationToken is None:
+                return
 
-    b = requests.post('https://www.youtube.com/youtubei/v1/next?key='+key,data=requestData)
-    commentJson:dict = json.loads(b.text)
-    comments = []
-    scrapeJson(commentJson,"contentText",comments)
-    return comments
+            if rateLimiter is not None:
+                rateLimiter.wait()
+
+            try:
+                commentJson = self._next(continuationToken)
+            except (requests.RequestException, ValueError) as e:
+                cfg.logger.debug(e)
+                return
+
+_client = _CommentClient()
+
+
+def _getComments(url, rateLimiter = None):
+    return _client.getComments(url, rateLimiter)
 
 
 
@@ -154,6 +240,13 @@ def _getTime(url, timeRe):
         return int(matches.group(2))
     return None
 
+def _runUrl(ele):
+    '''url linked to by a run of a comment, or None if its text'''
+    url = _follow(ele, ("navigationEndpoint", "commandMetadata", "webCommandMetadata", "url"))
+    if url is not _missing:
+        return url
+    return scrapeFirstJson(ele, "url")
+
 def _getTimestamp(line, timeRe) -> Union[Timestamp, None]:
     '''line must be of form [text] [time] or [time] [text]'''
     text = ""
@@ -164,7 +257,7 @@ def _getTimestamp(line, timeRe) -> Union[Timestamp, None]:
 
     urlFirst = False
     ele = line[0]
-    foundUrl = scrapeFirstJson(ele, "url")
+    foundUrl = _runUrl(ele)
     if foundUrl is None:
         text+=ele['text']
     else:
@@ -177,7 +270,7 @@ def _getTimestamp(line, timeRe) -> Union[Timestamp, None]:
 
     for i in range(1,len(line)):
         ele = line[i]
-        foundUrl = scrapeFirstJson(ele, "url")
+        foundUrl = _runUrl(ele)
 
         # found text
         if foundUrl is None:
@@ -207,16 +300,8 @@ def _getTimestamp(line, timeRe) -> Union[Timestamp, None]:
     return None
 
 
-def _getTimeStamps(comments, videoId):
-    timeRe = re.compile(r'\/watch\?v=' + videoId + r'(&t=(\d+)s)?')
-
-    timeStampCandidates = []
-    for comment in comments:
-        runs = scrapeFirstJson(comment,'runs')
-
-        if runs is None:
-            return []
-
+def _addCandidates(comments, timeRe, timeStampCandidates):
+    for runs in comments:
         lines = []
         line = []
         # group into lines
@@ -239,6 +324,23 @@ def _getTimeStamps(comments, videoId):
         if len(timeStamps) > 1:
             timeStamps.sort(key = lambda ele: ele.time)
             timeStampCandidates.append(timeStamps)
+
+
+def _getTimeStamps(pages, videoId):
+    '''
+    pages yields the comments on each page, as the runs of each comment (see _getComments). pages are read until one
+    with a timestamp candidate has been, or cfg.commentPages pages or cfg.commentSeconds seconds have been spent
+    '''
+    timeRe = re.compile(r'\/watch\?v=' + videoId + r'(&t=(\d+)s)?')
+    deadline = time.monotonic() + cfg.commentSeconds
+
+    timeStampCandidates = []
+    for pageNum, comments in enumerate(pages, start = 1):
+        _addCandidates(comments, timeRe, timeStampCandidates)
+
+        if len(timeStampCandidates) > 0 or pageNum >= cfg.commentPages or time.monotonic() >= deadline:
+            break
+
     timeStampCandidates.sort(key=lambda ele: len(ele), reverse=True)
 
     if len(timeStampCandidates) > 0:
@@ -246,16 +348,32 @@ def _getTimeStamps(comments, videoId):
     return []
 
 
-def scrapeCommentsForTimestamps(videoId):
+def scrapeCommentsForTimestamps(videoId, useCache = True, rateLimiter = None):
+    '''
+    returns timestamps found in the comments of videoId
+    results are cached (see timestamps.cache), unless the comments couldnt be fetched
+    rateLimiter is waited on before each page of comments is fetched (not when they are cached)
+    '''
+    if useCache:
+        cached = getCachedTimestamps(videoId)
+        if cached is not None:
+            cfg.logger.debug(f"Using Cached Timestamps for {videoId}")
+            return [Timestamp(time = t, label = label) for t,label in cached]
+
     url = 'https://www.youtube.com/watch?v=' + videoId
 
+    if rateLimiter is not None:
+        rateLimiter.wait()
+
     try:
-        comments = _getComments(url)
+        pages = iter(_getComments(url, rateLimiter))
+        firstPage = next(pages, [])
     except:
         cfg.logger.info("No Comments Found")
         return []
 
-    timeStamps = _getTimeStamps(comments, videoId)
+    timeStamps = _getTimeStamps(chain([firstPage], pages), videoId)
+    cacheTimestamps(videoId, timeStamps)
     return timeStamps
 
 if __name__ == '__main__':
@@ -1,17 +1,48 @@
 import os
-import shelve
 import re
 
 from sync_dl import noInterrupt
 from sync_dl.ytdlWrappers import getIDs
 from sync_dl.plManagement import correctStateCorruption
-from sync_dl.helpers import getLocalSongs, relabel, getNumDigets, copy, delete, padZeros, calcuateTransferMoves, logTransferInfo, promptAndSanitize
+from sync_dl.helpers import getLocalSongs, relabel, prependWidth, copy, delete, padZeros, calcuateTransferMoves, logTransferInfo, promptAndSanitize
+from sync_dl.metaDataStore import openMetaData
 import sync_dl.config as cfg
 
 
 def pushLocalOrder(plPath):
-    from sync_dl_ytapi.commands import pushLocalOrder
-    pushLocalOrder(plPath)
+    # sync_dl_ytapi.commands.pushLocalOrder reads the metadata as a shelve, so only its building blocks are used
+    from sync_dl_ytapi.credentials import getCredentials
+    from sync_dl_ytapi.helpers import getPlId, pushOrderMoves
+    from sync_dl_ytapi.ytapiWrappers import getItemIds, moveSong
+
+    credJson = getCredentials()
+    if not credJson:
+        return
+
+    cfg.logger.info("Pushing Local Order to Remote...")
+
+    with openMetaData(plPath) as metaData:
+        url = metaData["url"]
+        localIds = list(metaData["ids"])
+
+    plId = getPlId(url)
+
+    remoteIdPairs = getItemIds(credJson,plId)
+    if len(remoteIdPairs) == 0:
+        return
+
+    remoteIds,remoteItemIds = zip(*remoteIdPairs)
+
+    cfg.logger.debug(f'Order Before Push: \n'+'\n'.join( [f'{i}: {str(remoteId)}' for i,remoteId in enumerate(remoteIds) ] ))
+
+    moves = pushOrderMoves(remoteIds,remoteItemIds,localIds)
+
+    for move in moves:
+        newIndex, songId,itemId = move
+
+        if not moveSong(credJson,plId,songId,itemId,newIndex):
+            cfg.logger.error("Ending PushLocalOrder Prematurly")
+            return
 
 
 def logout():
@@ -33,9 +64,7 @@ def transferSongs(srcPlPath: str, destPlPath: str, srcStart: int, srcEnd: int, d
     from sync_dl_ytapi.commands import getPlAdder, getPlRemover
 
 
-    srcMetaDataPath = f"{srcPlPath}/{cfg.metaDataName}"
-    destMetaDataPath = f"{destPlPath}/{cfg.metaDataName}"
-    with shelve.open(srcMetaDataPath, 'c',writeback=True) as srcMetaData, shelve.open(destMetaDataPath, 'c',writeback=True) as destMetaData:
+    with openMetaData(srcPlPath) as srcMetaData, openMetaData(destPlPath) as destMetaData:
         correctStateCorruption(srcPlPath, srcMetaData)
         correctStateCorruption(destPlPath, destMetaData)
 
@@ -44,14 +73,14 @@ def transferSongs(srcPlPath: str, destPlPath: str, srcStart: int, srcEnd: int, d
         srcLocalIds = srcMetaData["ids"]
         assert isinstance(srcLocalIds, list)
         srcIdsLen = len(srcLocalIds)
-        currentSrcDir = getLocalSongs(srcPlPath)
+        currentSrcDir = getLocalSongs(srcPlPath, srcMetaData)
         srcPlName = os.path.basename(srcPlPath)
 
         destPlUrl    = destMetaData["url"]
         destLocalIds = destMetaData["ids"]
         assert isinstance(destLocalIds, list)
         destIdsLen = len(destLocalIds)
-        currentDestDir = getLocalSongs(destPlPath)
+        currentDestDir = getLocalSongs(destPlPath, destMetaData)
         destPlName = os.path.basename(destPlPath)
 
         cfg.logger.info("Loading Youtube Api Resources...")
@@ -92,8 +121,6 @@ def transferSongs(srcPlPath: str, destPlPath: str, srcStart: int, srcEnd: int, d
         # number of elements to move
         blockSize = srcEnd-srcStart+1
 
-        numDestDigits = getNumDigets(destIdsLen + blockSize)
-
         songTransfers = calcuateTransferMoves(currentSrcDir, srcLocalIds, destLocalIds, srcRemoteIds, destRemoteIds, srcStart, srcEnd, destIndex)
 
         ### Inform User
@@ -108,6 +135,9 @@ def transferSongs(srcPlPath: str, destPlPath: str, srcStart: int, srcEnd: int, d
         cfg.logger.info("")
 
         #actual editing
+        numDestDigits = prependWidth(destPlPath, destMetaData, destIdsLen + blockSize)
+        currentDestDir = getLocalSongs(destPlPath, destMetaData)
+
         # make room for block
         for i in reversed(range(destIndex+1,destIdsLen)):
             oldName = currentDestDir[i]
@@ -0,0 +1,72 @@
+'''
+postprocessors added to the downloaders built by ytdlWrappers.YtdlSession (this module imports yt-dlp, so it is
+only imported once a downloader is needed)
+'''
+import os
+from yt_dlp.postprocessor.common import PostProcessor
+
+import sync_dl.config as cfg
+from sync_dl.timestamps.scraping import scrapeCommentsForTimestamps
+from sync_dl.timestamps.cache import recordSongInfo
+
+
+class CommentTimestampsPP(PostProcessor):
+    '''
+    runs before a song is downloaded, if the video has no chapters the timestamps scraped from its comments are
+    added as chapters, so the FFmpegMetadata postprocessor writes them along with the rest of the metadata
+    (rather than remuxing the song again afterwards). only runs if the scrapeCommentTimestamps param is set
+
+    an exception raised by a postprocessor fails the download, so failing to scrape only leaves the song without chapters
+    '''
+    def run(self, info):
+        if not self.get_param('scrapeCommentTimestamps') or info.get('chapters') or not info.get('duration'):
+            return [], info
+
+        try:
+            timestamps = scrapeCommentsForTimestamps(info['id'])
+        except Exception as e:
+            cfg.logger.debug(e)
+            cfg.logger.error(f"Unable to Scrape Comment Timestamps for {info['id']}, Song is Downloaded Without Them")
+            return [], info
+
+        timestamps.sort(key = lambda ele: ele.time)
+
+        if len(timestamps) > 0:
+            cfg.logger.debug(f"Adding Comment Timestamps to {info['id']}")
+            ends = [timestamp.time for timestamp in timestamps[1:]] + [info['duration']]
+            info['chapters'] = [{'start_time': timestamp.time, 'end_time': end, 'title': timestamp.label}
+                                for timestamp,end in zip(timestamps, ends)]
+        return [], info
+
+
+class RecordSongInfoPP(PostProcessor):
+    '''
+    runs once a song is downloaded and postprocessed, recording the title, duration and chapters yt-dlp gave for it
+    (see timestamps.readSongInfo), so the song doesnt need to be probed with ffmpeg, or its comments scraped, later on
+
+    chaptersWritten is whether the chapters in the info are written into the song (by FFmpegMetadata)
+    '''
+    def __init__(self, chaptersWritten):
+        super().__init__()
+        self.chaptersWritten = chaptersWritten
+
+    def run(self, info):
+        if not info.get('duration'):
+            return [], info
+
+        try:
+            filesize = os.path.getsize(info['filepath'])
+        except (KeyError, OSError):
+            return [], info
+
+        chapters = []
+        if self.chaptersWritten:
+            chapters = [(round(chapter['start_time']), chapter['title']) for chapter in info.get('chapters') or []
+                        if chapter.get('title')]
+
+        try:
+            recordSongInfo(info['id'], filesize, info.get('title'), info['duration'], chapters)
+        except Exception as e:
+            # the record is only an optimization, the song is probed if its missing (ie the database is locked)
+            cfg.logger.debug(e)
+        return [], info
@@ -1,7 +1,7 @@
-#import youtube_dl
-import yt_dlp as youtube_dl
 import os
 import time
+import threading
+from contextlib import contextmanager
 
 import shutil
 
@@ -22,12 +22,87 @@ class MyLogger:
         cfg.logger.debug(msg)
 
 
+class YtdlSession:
+    '''
+    holds the YoutubeDL instances used over a whole cli invocation, so the extractors and postprocessor
+    chain are built once rather than once per song. instances are handed out one caller at a time
+    (YoutubeDL is not thread safe) and returned for reuse, all of them sharing one cookie jar
+
+    changes to cfg.dlParams only apply to downloaders built after the change, call close to drop existing ones
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {'extract': [], 'download': []}
+        self._all = []
+        self._cookiejar = None
+
+    def _build(self, kind):
+        if kind == 'extract':
+            params = {"extract_flat": True, "quiet": True, "outtmpl": '%(title)s'}
+        else:
+            params = dict(cfg.dlParams)
+            params['outtmpl'] = '%(title)s.%(ext)s' # output path is set per song by downloadToTmp
+
+        # yt-dlp takes a while to import, so its only imported once a command uses it
+        #import youtube_dl
+        import yt_dlp as youtube_dl
+        from sync_dl.ytdlPostprocessors import CommentTimestampsPP, RecordSongInfoPP
+
+        params['logger'] = MyLogger()
+        ydl = youtube_dl.YoutubeDL(params)
+
+        if kind == 'download':
+            writesMetadata = any(pp['key'] == 'FFmpegMetadata' for pp in params['postprocessors'])
+            if writesMetadata:
+                ydl.add_post_processor(CommentTimestampsPP(), when = 'pre_process')
+            ydl.add_post_processor(RecordSongInfoPP(writesMetadata), when = 'after_move')
+
+        with self._lock:
+            if self._cookiejar is None:
+                self._cookiejar = ydl.cookiejar
+            else:
+                # cookiejar is a cached property, seeding it shares one jar between all instances
+                ydl.__dict__['cookiejar'] = self._cookiejar
+            self._all.append(ydl)
+        return ydl
+
+    @contextmanager
+    def _use(self, kind):
+        with self._lock:
+            ydl = self._idle[kind].pop() if self._idle[kind] else None
+
+        if ydl is None:
+            ydl = self._build(kind)
+
+        try:
+            yield ydl
+        finally:
+            with self._lock:
+                self._idle[kind].append(ydl)
+
+    def extractor(self):
+        '''flat extractor used for playlist and song info, outtmpl is the title for use with prepare_filename'''
+        return self._use('extract')
+
+    def downloader(self):
+        '''downloader configured with cfg.dlParams'''
+        return self._use('download')
+
+    def close(self):
+        with self._lock:
+            for ydl in self._all:
+                ydl.close()
+            self._all = []
+            self._idle = {'extract': [], 'download': []}
+            self._cookiejar = None
+
+session = YtdlSession()
+
+
 #ids are the unique part of each videos url
 def getIDs(playlistUrl):
     try:
-        params={"extract_flat": True, "quiet": True}
-        params['logger'] = MyLogger()
-        with youtube_dl.YoutubeDL(params) as ydl:
+        with session.extractor() as ydl:
             result = ydl.extract_info(playlistUrl,download=False)
             ids = []
             for videoData in result['entries']:
@@ -37,15 +112,42 @@ def getIDs(playlistUrl):
         return []
 
 
+# entries on the first page of a youtube playlist, so the fingerprint takes one request
+_fingerprintEntries = 100
+
+def getPlaylistFingerprint(playlistUrl):
+    '''
+    cheap summary of the remote playlist, its length, when it was last modified and the ids on its first page.
+    if the fingerprint is unchanged, so is the playlist (unless songs past the first page are reordered on the day
+    it was last modified). returns None if it couldnt be fetched
+    '''
+    try:
+        with session.extractor() as ydl:
+            ydl.params['playlist_items'] = f'1:{_fingerprintEntries}'
+            try:
+                result = ydl.extract_info(playlistUrl,download=False)
+            finally:
+                del ydl.params['playlist_items']
+
+        if result.get('playlist_count') is None:
+            return None
+
+        return {
+            'count': result['playlist_count'],
+            'modified': result.get('modified_date'),
+            'ids': [videoData["id"] for videoData in result['entries']],
+        }
+    except:
+        return None
+
+
 def getIdsAndTitles(url):
     '''
     used to check for corrupted metadata in integration tests
     Title will differ from what is on youtube because it is sanitized for use in filenames
     '''
     try:
-        params={"extract_flat": True, "quiet": True, "outtmpl": f'%(title)s'}
-        params['logger'] = MyLogger()
-        with youtube_dl.YoutubeDL(params) as ydl:
+        with session.extractor() as ydl:
             result = ydl.extract_info(url,download=False)
             ids = []
             titles = []
@@ -63,13 +165,7 @@ def getTitle(url):
     Title will differ from what is on youtube because it is sanitized for use in filenames
     '''
 
-    params = {}
-    params['extract_flat'] = True
-    params['quiet'] = True
-    params["outtmpl"] = f'%(title)s'
-    params['logger'] = MyLogger()
-
-    with youtube_dl.YoutubeDL(params) as ydl:
+    with session.extractor() as ydl:
 
         song = ydl.extract_info(url,download=False)
 
@@ -77,15 +173,24 @@ def getTitle(url):
     return title
 
 
-def downloadToTmp(videoId,numberStr):
-    url = f"https://www.youtube.com/watch?v={videoId}"
+def downloadToTmp(videoId, downloadPath = None, addTimestamps = False):
+    '''
+    downloads song to downloadPath (defaults to cfg.songDownloadPath), the number prepend is added when
+    the song is moved out of tmp, so concurrent downloads each need their own downloadPath
+
+    if addTimestamps, timestamps in the comments are written as chapters while the song is postprocessed
+    (only if the video has no chapters of its own)
+    '''
+    if downloadPath is None:
+        downloadPath = cfg.songDownloadPath
 
-    cfg.dlParams["outtmpl"] = f'{cfg.songDownloadPath}/{numberStr}_%(title)s.%(ext)s'
-    cfg.dlParams['logger'] = MyLogger()
+    url = f"https://www.youtube.com/watch?v={videoId}"
 
-    with youtube_dl.YoutubeDL(cfg.dlParams) as ydl:
+    with session.downloader() as ydl:
+        ydl.params['outtmpl']['default'] = f'{downloadPath}/%(title)s.%(ext)s'
+        ydl.params['scrapeCommentTimestamps'] = addTimestamps
 
-        cfg.clearTmpSubPath(cfg.songDownloadPath)
+        cfg.clearTmpSubPath(downloadPath)
 
         attemptNumber = 1
         numAttempts = 2
@@ -105,19 +210,30 @@ def downloadToTmp(videoId,numberStr):
                 attemptNumber += 1
 
 
-def moveFromTmp(path):
-    tmp = os.listdir(path=cfg.songDownloadPath)
-    shutil.move(f"{cfg.songDownloadPath}/{tmp[0]}", path)
-    return tmp[0]
+def getTmpSongName(downloadPath = None):
+    '''name of the song downloaded to downloadPath (defaults to cfg.songDownloadPath)'''
+    if downloadPath is None:
+        downloadPath = cfg.songDownloadPath
+
+    return os.listdir(path=downloadPath)[0]
+
+def moveFromTmp(path, numberStr, downloadPath = None, songName = None):
+    '''
+    moves downloaded song into path with the number prepend numberStr, returns the new song name
+    songName overrides the name given to the song (numberStr is then ignored)
+    '''
+    if downloadPath is None:
+        downloadPath = cfg.songDownloadPath
+
+    tmpName = getTmpSongName(downloadPath)
+    if songName is None:
+        songName = f"{numberStr}_{tmpName}"
+    shutil.move(f"{downloadPath}/{tmpName}", f"{path}/{songName}")
+    return songName
 
 def getJsonPlData(url):
     '''returns list of dicts of data for each video in playlist at url (order is playlist order)'''
-    params = {}
-    params['extract_flat'] = True
-
-    params['quiet'] = True
-    params['logger'] = MyLogger()
-    with youtube_dl.YoutubeDL(params) as ydl:
+    with session.extractor() as ydl:
         try:
             entries = ydl.extract_info(url,download=False)['entries']
         except:
@@ -146,15 +262,7 @@ def getThumbnailUrls(url:str) -> dict:
     Title will differ from what is on youtube because it is sanitized for use in filenames
     '''
 
-    params = {
-        "extract_flat": True, 
-        "quiet": True, 
-        "simulate": True,
-        #"list_thumbnails": True,
-        "logger": MyLogger(),
-    }
-
-    with youtube_dl.YoutubeDL(params) as ydl:
+    with session.extractor() as ydl:
         result = ydl.extract_info(url,download=False)
 
     try:
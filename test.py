@@ -7,6 +7,7 @@ import sys
 
 import sync_dl.tests.unitTests as unitTests
 import sync_dl.tests.integrationTests as integrationTests
+import sync_dl.tests.startupBenchmark as startupBenchmark
 
 import sync_dl.config as cfg
 
@@ -26,6 +27,8 @@ def parseArgs():
 
     parser.add_argument('-p','--print',action='store_true', help='prints to terminal in addition to tests/testing.log' )
 
+    parser.add_argument('-b','--benchmark',action='store_true', help='benchmarks startup time of each subcommand against its budget')
+
     args,other = parser.parse_known_args()
 
     sys.argv[1:] = other #additional unittest args
@@ -51,6 +54,12 @@ if __name__ == "__main__":
 
     setLogging(args)
 
+    if args.benchmark:
+        if not startupBenchmark.benchmark():
+            sys.exit(1)
+        if not (args.unit or args.integration):
+            sys.exit(0)
+
     runall = not (args.unit or args.integration)
 
     #checks if integration test has to run (whenever -i is used, or if all tests are run)